@@ -1,6 +1,9 @@
 import cv2
 import numpy as np
 import cv2.aruco as aruco
+from capture import LatestFrameCapture
+from localization import make_localizer, observations
+from markertracker import MarkerTracker
 
 def detect_aruco_from_cam():
     """
@@ -8,17 +11,21 @@ def detect_aruco_from_cam():
     Press 'q' to exit the webcam feed.
     """
     # Open the webcam (0 for default camera)
-    cap = cv2.VideoCapture(0)
+    cap = LatestFrameCapture(0)
 
     # Check if the camera opened successfully
     if not cap.isOpened():
         print("Error: Could not open webcam.")
         return
 
-    # Load the predefined ArUco dictionary
-    aruco_dict = aruco.getPredefinedDictionary(aruco.DICT_6X6_250)
-    parameters = aruco.DetectorParameters()
-    detector = aruco.ArucoDetector(aruco_dict, parameters)
+    # Detect markers of the predefined ArUco dictionary, then follow them with
+    # optical flow and only re-detect periodically or when one is lost
+    tracker = MarkerTracker(aruco.DICT_6X6_250)
+
+    # With a field map and a calibration, fuse all markers into one field position;
+    # built on the first frame so the calibration is scaled to the camera's resolution
+    localizer = None
+    first_frame = True
 
     while True:
         ret, frame = cap.read()
@@ -26,19 +33,31 @@ def detect_aruco_from_cam():
             print("Error: Failed to capture image.")
             break
 
+        if first_frame:
+            localizer = make_localizer(frame.shape[1::-1])
+            first_frame = False
+
         # Convert frame to grayscale
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-        # Detect markers
-        corners, ids, _ = detector.detectMarkers(gray)
+        # Detect or track markers
+        markers = tracker.update(gray)
 
-        if ids is not None:
+        if markers:
+            corners = [marker.corners.reshape(1, 4, 2) for marker in markers]
+            ids = np.array([[marker.marker_id] for marker in markers])
             aruco.drawDetectedMarkers(frame, corners, ids)
             
-            for i, marker_id in enumerate(ids):
-                x, y = int(corners[i][0][0][0]), int(corners[i][0][0][1])
-                cv2.putText(frame, f"ID: {marker_id[0]}", (x, y - 10),
+            for marker in markers:
+                x, y = int(marker.corners[0][0]), int(marker.corners[0][1])
+                cv2.putText(frame, f"ID: {marker.marker_id}", (x, y - 10),
                             cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+
+        if localizer is not None:
+            pose = localizer.update(observations(markers))
+            if pose is not None:
+                cv2.putText(frame, f"Pose: x={pose.x:.2f} y={pose.y:.2f} heading={np.degrees(pose.heading):.0f}",
+                            (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
         
         # Show the output
         cv2.imshow("ArUco Marker Detection", frame)
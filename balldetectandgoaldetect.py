@@ -1,5 +1,18 @@
+import os
+
 import cv2
 import numpy as np
+from colorsegment import segment_masks
+from pipeline import Pipeline
+from profiler import timed
+from roicircles import find_circles
+from stages import build_stages
+from telemetry import DEBUG, configure_from_env, telemetry
+from tracker import BallTracker
+
+# Run without any drawing or windows in the loop (HEADLESS=1). An annotated preview is
+# rendered on a separate thread at a low rate only when a display is attached.
+HEADLESS = os.environ.get("HEADLESS", "0") == "1"
 
 def get_hsv_ranges():
     """Define HSV ranges for red, pink, and white colors."""
@@ -18,47 +31,58 @@ def get_hsv_ranges():
 
     return red_ranges, pink_range, white_range
 
+@timed("mask")
 def create_combined_mask(img_hsv, red_ranges, pink_range, white_range):
     """Create a combined mask for red, pink, and white colors."""
-    # Combine red masks
-    red_mask = sum(cv2.inRange(img_hsv, lower, upper) for lower, upper in red_ranges)
-    # Create pink mask
-    pink_mask = cv2.inRange(img_hsv, *pink_range)
-    white_mask = cv2.inRange(img_hsv, *white_range)
-
-    return red_mask, pink_mask, white_mask
-
-def detect_and_draw_circles(video, mask, color_name):
-    """Detect circles in the mask and draw them on the video frame."""
-    blurred_mask = cv2.GaussianBlur(mask, (9, 9), 2)
-    circles = cv2.HoughCircles(
-        blurred_mask,
-        cv2.HOUGH_GRADIENT,
-        dp=1.2,
-        minDist=50,
-        param1=100,
-        param2=30,
-        minRadius=40,
-        maxRadius=150
-    )
-
-    center_x, center_y = -1, -1  # Default values if no circle is detected
-
-    if circles is not None:
-        circles = np.uint16(np.around(circles))
-        for circle in circles[0, :]:
-            x, y, radius = circle
-            cv2.circle(video, (x, y), radius, (0, 255, 0), 2)
-            cv2.circle(video, (x, y), 3, (0, 0, 255), -1)
-            cv2.putText(video, f"{color_name} ({x}, {y})", (x - 50, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-            center_x, center_y = x, y
-
-    return center_x, center_y
+    # Classify all three colors in a single lookup-table pass over the frame
+    color_classes = {"red": red_ranges, "pink": [pink_range], "white": [white_range]}
+    masks = segment_masks(img_hsv, color_classes)
 
-def detect_white_dots(video, mask, frame_center_x, frame_width_tolerance):
-    """Detect white dots in the specified range around the screen center and count them."""
+    return masks["red"], masks["pink"], masks["white"]
+
+@timed("ball_circles")
+def find_ball_circles(mask, detector=None, min_radius=40, max_radius=150, **hough_params):
+    """Detect circles in the mask and return them as a list of (x, y, radius).
+
+    The radius bounds and hough_params only apply without a detector, which
+    carries its own.
+    """
+    if detector is not None:
+        circles = detector.detect(mask)
+    else:
+        circles = find_circles(mask, min_radius, max_radius, **hough_params)
+
+    if circles is None:
+        return []
+    circles = np.uint16(np.around(circles))
+    return [(int(x), int(y), int(radius)) for x, y, radius in circles[0, :]]
+
+def draw_circles(video, circles, color_name):
+    """Draw detected circles and their labels on the video frame."""
+    for x, y, radius in circles:
+        cv2.circle(video, (x, y), radius, (0, 255, 0), 2)
+        cv2.circle(video, (x, y), 3, (0, 0, 255), -1)
+        cv2.putText(video, f"{color_name} ({x}, {y})", (x - 50, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+def detect_and_draw_circles(video, mask, color_name, detector=None):
+    """Detect circles in the mask and draw them on the video frame.
+
+    When a RoiCircleDetector is given, the search is restricted to a window
+    around the previous detection instead of the whole mask.
+    """
+    circles = find_ball_circles(mask, detector)
+    draw_circles(video, circles, color_name)
+
+    if not circles:
+        return -1, -1  # Default values if no circle is detected
+    x, y, _ = circles[-1]
+    return x, y
+
+@timed("white_dots")
+def find_white_dots(mask, frame_center_x, frame_width_tolerance):
+    """Return the centers of white dots in the specified range around the screen center."""
     contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    dot_count = 0
+    dots = []
 
     for contour in contours:
         if cv2.contourArea(contour) < 10:  # Ignore very small areas
@@ -68,16 +92,27 @@ def detect_white_dots(video, mask, frame_center_x, frame_width_tolerance):
         dot_center_x = x + w // 2
 
         if abs(dot_center_x - frame_center_x) <= frame_width_tolerance:
-            dot_count += 1
-            cv2.circle(video, (dot_center_x, y + h // 2), 2, (0, 255, 0), -1)  # Point-sized dot
+            dots.append((dot_center_x, y + h // 2))
 
-    if dot_count > 0:
-        cv2.putText(video, f"White Dots: {dot_count}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    return dots
 
-    return dot_count
+def draw_white_dots(video, dots):
+    """Draw the white dots and their count on the video frame."""
+    for dot in dots:
+        cv2.circle(video, dot, 2, (0, 255, 0), -1)  # Point-sized dot
 
-def detect_pink_center(video, mask, min_area=500):
-    """Detect the center of a sufficiently large pink-colored object using moments."""
+    if dots:
+        cv2.putText(video, f"White Dots: {len(dots)}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+def detect_white_dots(video, mask, frame_center_x, frame_width_tolerance):
+    """Detect white dots in the specified range around the screen center and count them."""
+    dots = find_white_dots(mask, frame_center_x, frame_width_tolerance)
+    draw_white_dots(video, dots)
+    return len(dots)
+
+@timed("pink_center")
+def find_pink_center(mask, min_area=500):
+    """Return ((center_x, center_y), contour) of a sufficiently large pink object, or None."""
     contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     if contours:
         # Find the largest contour
@@ -89,12 +124,23 @@ def detect_pink_center(video, mask, min_area=500):
             if moments["m00"] != 0:
                 center_x = int(moments["m10"] / moments["m00"])
                 center_y = int(moments["m01"] / moments["m00"])
-                # Draw center point and contour
-                cv2.drawContours(video, [largest_contour], -1, (0, 255, 255), 2)
-                cv2.circle(video, (center_x, center_y), 5, (0, 0, 255), -1)
-                cv2.putText(video, f"Pink ({center_x}, {center_y})", (center_x - 50, center_y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-                return center_x, center_y
-    return -1, -1
+                return (center_x, center_y), largest_contour
+    return None
+
+def draw_pink_center(video, pink, color_name="Pink"):
+    """Draw the pink object's contour and center on the video frame."""
+    if pink is None:
+        return
+    (center_x, center_y), contour = pink
+    cv2.drawContours(video, [contour], -1, (0, 255, 255), 2)
+    cv2.circle(video, (center_x, center_y), 5, (0, 0, 255), -1)
+    cv2.putText(video, f"{color_name} ({center_x}, {center_y})", (center_x - 50, center_y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+def detect_pink_center(video, mask, min_area=500):
+    """Detect the center of a sufficiently large pink-colored object using moments."""
+    pink = find_pink_center(mask, min_area)
+    draw_pink_center(video, pink)
+    return pink[0] if pink is not None else (-1, -1)
 
 def process_center_position(center_x, center_y, frame_width, frame_height, color_name):
     """Process the position of the detected center and provide movement commands."""
@@ -103,73 +149,58 @@ def process_center_position(center_x, center_y, frame_width, frame_height, color
 
     if center_x == -1 or center_y == -1:
         # Object not in frame
-        print(f"{color_name} center not detected: Object not in frame. Turning left.")
+        telemetry.emit("steer", key=color_name, color=color_name, detected=False, command="fl")
         return "fl"
 
     # Calculate relative coordinates
-    relative_x = center_x - screen_center_x
-    relative_y = screen_center_y - center_y  # Invert Y-axis to match standard cartesian coordinates
+    relative_x = int(center_x) - screen_center_x
+    relative_y = screen_center_y - int(center_y)  # Invert Y-axis to match standard cartesian coordinates
 
     if relative_x < -15:  # Object is to the left of the center
-        print(f"{color_name} object detected at relative coordinates: ({relative_x}, {relative_y}). Turning left.")
-        return "fl"
+        command = "fl"
     elif relative_x > 15:  # Object is to the right of the center
-        print(f"{color_name} object detected at relative coordinates: ({relative_x}, {relative_y}). Turning right.")
-        return "fr"
+        command = "fr"
     else:
         # Object is close to the center
-        print(f"{color_name} object detected at relative coordinates: ({relative_x}, {relative_y}). Keeping centered.")
-        return "f"
-
-
-def main():
-    red_ranges, pink_range, white_range = get_hsv_ranges()
-    webcam_video = cv2.VideoCapture(0)
-
-    if not webcam_video.isOpened():
-        print("Error: Could not open webcam.")
-        return
-
-    while True:
-        success, video = webcam_video.read()
-        if not success:
-            print("Error: Could not read frame.")
-            break
-
-        # Get frame dimensions
-        frame_height, frame_width, _ = video.shape
-        frame_center_x = frame_width // 2
-
-        # Convert frame to HSV color space
-        img_hsv = cv2.cvtColor(video, cv2.COLOR_BGR2HSV)
+        command = "f"
 
-        # Create masks for red, pink, and white
-        red_mask, pink_mask, white_mask = create_combined_mask(img_hsv, red_ranges, pink_range, white_range)
+    telemetry.emit("steer", key=color_name, color=color_name, detected=True, x=relative_x, y=relative_y, command=command)
+    return command
 
-        # Detect and draw circles for red
-        red_center_x, red_center_y = detect_and_draw_circles(video, red_mask, "Red")
 
-        # Detect center for pink objects
-        pink_center_x, pink_center_y = detect_pink_center(video, pink_mask)
-
-        # Detect and count white dots in the specified range
-        detect_white_dots(video, white_mask, frame_center_x, frame_width_tolerance=10)
+def main():
+    # Ball and goal are found on a half-resolution pyramid level, white dots in a band of the
+    # full-resolution frame; the HSV conversion and color classification are shared between them
+    pipeline = Pipeline(build_stages(["balldetectandgoaldetect"]))
+    red_tracker = BallTracker()
+    pink_tracker = BallTracker()
+    configure_from_env()
+
+    def steer(ctx):
+        frame_width, frame_height = ctx.width, ctx.height
+        circles, pink, dots = ctx.results["ball"], ctx.results["goal"], ctx.results["white_dots"]
+        red_center_x, red_center_y = circles[-1][:2] if circles else (-1, -1)
+        pink_center_x, pink_center_y = pink[0] if pink is not None else (-1, -1)
+
+        telemetry.emit("detection", level=DEBUG, red=circles, pink=pink and pink[0], white_dots=len(dots))
+
+        # Filter detections and keep predicting through short dropouts
+        red_tracker.update((red_center_x, red_center_y))
+        pink_tracker.update((pink_center_x, pink_center_y))
+        red_center_x, red_center_y = red_tracker.center()
+        pink_center_x, pink_center_y = pink_tracker.center()
 
         # Process center positions for red and pink
         process_center_position(red_center_x, red_center_y, frame_width, frame_height, "Red")
         process_center_position(pink_center_x, pink_center_y, frame_width, frame_height, "Pink")
 
-        # Display the video feed and masks
-        combined_mask = red_mask | pink_mask | white_mask
-        cv2.imshow("Mask Image", combined_mask)
-        cv2.imshow("Video Feed", video)
-
-        # Press 'q' to exit
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+        if not HEADLESS:
+            cv2.imshow("Mask Image", ctx.any_mask(("red", "pink", "white")))
 
-    webcam_video.release()
-    cv2.destroyAllWindows()
+    # Press 'q' to exit; in HEADLESS mode nothing is drawn in the loop and a preview
+    # thread renders a copy when a viewer is attached. Ctrl+C or SIGTERM stop it cleanly.
+    pipeline.run(0, window_name="Video Feed", headless=HEADLESS, on_frame=steer)
+    telemetry.stop()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import cv2
+from balldetectandgoaldetect import (create_combined_mask, detect_and_draw_circles, detect_pink_center,
+                                     detect_white_dots, get_hsv_ranges)
+from capture import open_source
+from pipeline import Pipeline
+from profiler import profiler
+from stages import CONFIGS, build_stages
+from tester import detect_center
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCE = os.path.join(ROOT, "camera_calibration-master", "aruco_data")
+RESULTS_DIR = os.path.join(ROOT, "benchmark_results")
+DEFAULT_CONFIGS = ["balldetectandgoaldetect", "tester", "arucko", "linedetect"]
+
+
+def load_frames(source, max_frames=None):
+    """Decode every frame of a video file or image directory up front."""
+    cap = open_source(source)
+    frames = []
+    while max_frames is None or len(frames) < max_frames:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def current_commit():
+    """Return the short hash of the checked-out commit, or None outside a git checkout."""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_available_stages(configs):
+    """Build the stages for each configuration, skipping ones whose optional library is missing."""
+    stages, skipped = [], {}
+    for config in configs:
+        try:
+            stages.extend(build_stages([config]))
+        except ImportError as error:
+            skipped[config] = str(error)
+    return stages, skipped
+
+
+def script_detectors():
+    """
+    Per-frame function running the scripts' own detectors the way their camera loops did: the
+    whole frame at full resolution, no pyramid or ROIs. This is the baseline the pipeline is
+    measured against, so a slowdown in the scripts' functions shows up in compare_results.
+    """
+    red_ranges, pink_range, white_range = get_hsv_ranges()
+
+    def process(frame):
+        video = frame.copy()  # The detectors draw on the frame
+        profiler.start_frame()
+        with profiler.stage("hsv"):
+            img_hsv = cv2.cvtColor(video, cv2.COLOR_BGR2HSV)
+        red_mask, pink_mask, white_mask = create_combined_mask(img_hsv, red_ranges, pink_range, white_range)
+        detect_and_draw_circles(video, red_mask, "Red")
+        detect_pink_center(video, pink_mask)
+        detect_white_dots(video, white_mask, video.shape[1] // 2, frame_width_tolerance=10)
+        with profiler.stage("detect_center"):  # tester.py's red and pink targets
+            detect_center(red_mask)
+            detect_center(pink_mask)
+        profiler.end_frame()
+    return process
+
+
+def time_frames(process, frames, repeat, warmup):
+    """Run process over the frames after a warmup and return (seconds, per-stage stats, peak traced bytes)."""
+    for frame in frames[:warmup]:
+        process(frame)
+    profiler.reset()
+    tracemalloc.reset_peak()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            process(frame)
+    elapsed = time.perf_counter() - start
+    _, peak_traced = tracemalloc.get_traced_memory()
+    return elapsed, profiler.snapshot(), peak_traced
+
+
+def run_benchmark(source=DEFAULT_SOURCE, configs=DEFAULT_CONFIGS, repeat=1, warmup=3, max_frames=None):
+    """
+    Replay recorded frames through the scripts' detectors and then the pipeline stages, and return
+    each case's throughput and per-stage latency (keyed "case/stage") and the memory use.
+    """
+    frames = load_frames(source, max_frames)
+    if not frames:
+        raise ValueError(f"No frames could be read from {source}")
+
+    stages, skipped = build_available_stages(configs)
+    cases = {"scripts": script_detectors(), "pipeline": Pipeline(stages).process}
+
+    processed = len(frames) * repeat
+    timings, stats, peak_traced = {}, {}, 0
+    was_enabled = profiler.enabled
+    profiler.enabled = True
+    tracemalloc.start()
+    try:
+        for case, process in cases.items():
+            elapsed, case_stats, case_peak = time_frames(process, frames, repeat, warmup)
+            timings[case] = {"frames": processed, "seconds": elapsed,
+                             "fps": processed / elapsed if elapsed > 0 else 0.0}
+            stats.update((f"{case}/{name}", s) for name, s in case_stats.items())
+            peak_traced = max(peak_traced, case_peak)
+    finally:
+        tracemalloc.stop()
+        profiler.enabled = was_enabled
+
+    height, width = frames[0].shape[:2]
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": current_commit(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "source": os.path.relpath(source, ROOT) if os.path.exists(source) else source,
+        "resolution": [width, height],
+        "configs": list(configs),
+        "skipped": skipped,
+        "cases": timings,
+        "stages": stats,
+        "peak_traced_mb": peak_traced / 2 ** 20,
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def save_results(results, directory=RESULTS_DIR):
+    """Write results as JSON, named after the time and commit, and return the path."""
+    os.makedirs(directory, exist_ok=True)
+    name = time.strftime("%Y%m%d-%H%M%S") + (f"_{results['commit']}" if results.get("commit") else "") + ".json"
+    path = os.path.join(directory, name)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def print_results(results):
+    print(f"Source: {results['source']} ({results['resolution'][0]}x{results['resolution'][1]}), "
+          f"{len(results['configs'])} configs, commit {results['commit']}")
+    for config, reason in results["skipped"].items():
+        print(f"Skipped {config}: {reason}")
+    for case, timing in results["cases"].items():
+        print(f"Throughput ({case}): {timing['fps']:.1f} frames/s over {timing['frames']} frames")
+    print(f"Peak traced memory: {results['peak_traced_mb']:.1f} MB, max RSS: {results['max_rss_mb']:.1f} MB")
+    print(f"{'stage':<28}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)")
+    for name, s in sorted(results["stages"].items(), key=lambda item: -item[1]["p50"]):
+        print(f"{name:<28}{s['p50']:>9.2f}{s['p95']:>9.2f}{s['p99']:>9.2f}")
+
+
+def compare_results(current, baseline, threshold=0.10):
+    """Print per-stage p50 and throughput changes against a baseline and return the regressions."""
+    regressions = []
+    print(f"Comparing against {baseline.get('commit')} ({baseline.get('timestamp')})")
+
+    for case, timing in sorted(current["cases"].items()):
+        old = baseline.get("cases", {}).get(case)
+        if not old or not old["fps"]:
+            continue
+        fps_change = timing["fps"] / old["fps"] - 1
+        flag = "  REGRESSION" if fps_change < -threshold else ""
+        print(f"{case + '/throughput':<28}{old['fps']:>9.1f}{timing['fps']:>9.1f}{fps_change * 100:>+8.1f}%"
+              f"  (frames/s){flag}")
+        if fps_change < -threshold:
+            regressions.append(f"{case}/fps")
+
+    for name, stats in sorted(current["stages"].items()):
+        old = baseline["stages"].get(name)
+        if old is None or old["p50"] == 0:
+            continue
+        change = stats["p50"] / old["p50"] - 1
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:<28}{old['p50']:>9.2f}{stats['p50']:>9.2f}{change * 100:>+8.1f}%  (p50 ms){flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded footage through the detectors and time them.")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="Video file or image directory")
+    parser.add_argument("--configs", nargs="+", default=DEFAULT_CONFIGS, choices=sorted(CONFIGS))
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the footage")
+    parser.add_argument("--warmup", type=int, default=3, help="Frames processed before timing starts")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown counted as a regression")
+    parser.add_argument("--no-save", action="store_true", help="Do not write the results file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.source, args.configs, args.repeat, args.warmup, args.max_frames)
+    print_results(results)
+    if not args.no_save:
+        print("Saved", save_results(results))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare_results(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
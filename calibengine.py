@@ -0,0 +1,183 @@
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+# Termination criteria for subpixel corner detection
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+
+
+def file_hash(path):
+    """sha1 of a file's contents, so a renamed or re-saved image is still recognised."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _init_worker():
+    # One OpenCV thread per process; the pool provides the parallelism
+    cv2.setNumThreads(1)
+
+
+def detect_chessboard(path, pattern_size):
+    """Worker: return {"size", "corners"} for one image, corners being (N, 1, 2) or absent if not found."""
+    gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return None
+    result = {"size": np.array(gray.shape[::-1])}
+    found, corners = cv2.findChessboardCorners(gray, tuple(pattern_size), None)
+    if found:
+        result["corners"] = cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), SUBPIX_CRITERIA)
+    return result
+
+
+def detect_aruco(path, dictionary_id):
+    """Worker: return {"size", "corners", "ids"} for one image, corners (k, 1, 4, 2) and ids (k, 1)."""
+    image = cv2.imread(path)
+    if image is None:
+        return None
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    dictionary = cv2.aruco.getPredefinedDictionary(dictionary_id)
+    if hasattr(cv2.aruco, "ArucoDetector"):
+        corners, ids, _ = cv2.aruco.ArucoDetector(dictionary).detectMarkers(gray)
+    else:
+        corners, ids, _ = cv2.aruco.detectMarkers(gray, dictionary, parameters=cv2.aruco.DetectorParameters_create())
+    count = 0 if ids is None else len(ids)
+    return {
+        "size": np.array(gray.shape[::-1]),
+        "corners": np.array(corners, dtype=np.float32).reshape(count, 1, 4, 2),
+        "ids": np.asarray(ids if ids is not None else [], dtype=np.int32).reshape(count, 1),
+    }
+
+
+class CornerCache:
+    """Detection results stored per image content hash, one .npz file each."""
+
+    def __init__(self, directory, detector_key):
+        self.directory = os.path.join(directory, detector_key)
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest + ".npz")
+
+    def load(self, digest):
+        path = self.path(digest)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+    def save(self, digest, result):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self.path(digest) + ".tmp.npz"
+        np.savez(tmp, **result)
+        os.replace(tmp, self.path(digest))
+
+
+def detect_all(paths, detect, args, detector_key, cache_dir=None, workers=None):
+    """Run detect(path, *args) on every image, in parallel, reusing cached results.
+
+    Only images whose content hash is not yet cached are decoded, each inside a
+    worker process (or inline with a single worker), so no more than one image
+    per worker is in memory at a time.
+    Returns the results in the order of paths (None for unreadable images) and
+    how many came from the cache.
+    """
+    paths = [str(path) for path in paths]
+    cache = CornerCache(cache_dir, detector_key) if cache_dir is not None else None
+    digests = [file_hash(path) for path in paths] if cache is not None else [None] * len(paths)
+
+    results = [cache.load(digest) if cache is not None else None for digest in digests]
+    missing = [i for i, result in enumerate(results) if result is None]
+    workers = workers or os.cpu_count() or 1
+    # The calibration scripts run at module level without a __main__ guard, so only
+    # fork is safe: spawned workers would re-run the calling script.
+    context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    if missing and (workers == 1 or len(missing) == 1 or context is None):
+        for i in missing:
+            results[i] = detect(paths[i], *args)
+            if cache is not None and results[i] is not None:
+                cache.save(digests[i], results[i])
+    elif missing:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+            futures = {i: pool.submit(detect, paths[i], *args) for i in missing}
+            for i, future in futures.items():
+                results[i] = future.result()
+                if cache is not None and results[i] is not None:
+                    cache.save(digests[i], results[i])
+    return results, len(paths) - len(missing)
+
+
+def chessboard_points(results, pattern_size):
+    """Object and image points of every image where the board was found, in preallocated arrays."""
+    found = [result for result in results if result is not None and "corners" in result]
+    count = pattern_size[0] * pattern_size[1]
+    objp = np.zeros((count, 3), np.float32)
+    objp[:, :2] = np.mgrid[0:pattern_size[0], 0:pattern_size[1]].T.reshape(-1, 2)
+
+    objpoints = np.empty((len(found), count, 3), dtype=np.float32)
+    imgpoints = np.empty((len(found), count, 1, 2), dtype=np.float32)
+    objpoints[:] = objp
+    for i, result in enumerate(found):
+        imgpoints[i] = result["corners"].reshape(count, 1, 2)
+    return objpoints, imgpoints
+
+
+def aruco_points(results):
+    """Concatenated marker corners (N, 1, 4, 2), ids (N, 1) and per-image marker counts.
+
+    The totals are known once detection finishes, so each array is allocated once
+    and filled by slice instead of being grown with np.vstack.
+    """
+    results = [result for result in results if result is not None]
+    counter = np.array([len(result["ids"]) for result in results], dtype=np.int32)
+    total = int(counter.sum())
+    corners = np.empty((total, 1, 4, 2), dtype=np.float32)
+    ids = np.empty((total, 1), dtype=np.int32)
+    start = 0
+    for result, count in zip(results, counter):
+        corners[start:start + count] = result["corners"]
+        ids[start:start + count] = result["ids"]
+        start += count
+    return corners, ids, counter
+
+
+def image_size(results):
+    """(width, height) shared by the images, raising if they differ."""
+    sizes = {tuple(int(v) for v in result["size"]) for result in results if result is not None}
+    if len(sizes) != 1:
+        raise ValueError(f"Calibration images must all have the same size, got {sorted(sizes)}")
+    return sizes.pop()
+
+
+def calibrate_chessboard(paths, pattern_size=(7, 6), cache_dir=None, workers=None):
+    """Calibrate from chessboard images; returns (rms, mtx, dist, rvecs, tvecs, results)."""
+    results, _ = detect_all(paths, detect_chessboard, (tuple(pattern_size),),
+                            f"chessboard_{pattern_size[0]}x{pattern_size[1]}", cache_dir, workers)
+    objpoints, imgpoints = chessboard_points(results, pattern_size)
+    if len(objpoints) == 0:
+        raise ValueError("The chessboard was not found in any image")
+    rms, mtx, dist, rvecs, tvecs = cv2.calibrateCamera(list(objpoints), list(imgpoints), image_size(results), None, None)
+    return rms, mtx, dist, rvecs, tvecs, results
+
+
+def calibrate_aruco(corners, ids, counter, board, size):
+    """Calibrate from concatenated ArUco board detections (see aruco_points)."""
+    if hasattr(cv2.aruco, "calibrateCameraAruco"):
+        rms, mtx, dist, _, _ = cv2.aruco.calibrateCameraAruco(corners, ids, counter, board, size, None, None)
+        return rms, mtx, dist
+    # Newer OpenCV: match each image's markers to the board and use the generic calibration
+    objpoints, imgpoints = [], []
+    start = 0
+    for count in counter:
+        obj, img = board.matchImagePoints(list(corners[start:start + count]), ids[start:start + count])
+        start += count
+        if obj is not None and len(obj) >= 4:
+            objpoints.append(obj)
+            imgpoints.append(img)
+    rms, mtx, dist, _, _ = cv2.calibrateCamera(objpoints, imgpoints, size, None, None)
+    return rms, mtx, dist
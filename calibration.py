@@ -1,54 +1,40 @@
 import cv2
 import numpy as np
 import glob
+import os
+from calibengine import calibrate_chessboard, image_size
 
-# Termination criteria for subpixel corner detection
-criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
-
-# Prepare object points, like (0,0,0), (1,0,0), (2,0,0), ..., (6,5,0)
+# Size of the checkerboard's inner corner grid
 # Change the size depending on the checkerboard you are using
-objp = np.zeros((6*7, 3), np.float32)  # For a 7x6 checkerboard
-objp[:, :2] = np.mgrid[0:7, 0:6].T.reshape(-1, 2)
+pattern_size = (7, 6)  # For a 7x6 checkerboard
 
-# Arrays to store object points and image points
-objpoints = []  # 3d point in real world space
-imgpoints = []  # 2d points in image plane
+# Set SHOW_CORNERS=1 to step through the detected corners (half a second per image)
+show_corners = os.environ.get("SHOW_CORNERS", "0") == "1"
 
 # Load images for calibration (use your actual path)
-images = glob.glob('calibration_images/*.jpg')  # Path to your checkerboard images
-
-# Read the first image to get its dimensions
-img = cv2.imread(images[0])  # Just read one image to get the dimensions
-gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-# Loop over all the images
-for fname in images:
-    img = cv2.imread(fname)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+images = sorted(glob.glob('calibration_images/*.jpg'))  # Path to your checkerboard images
 
-    # Find the chessboard corners
-    ret, corners = cv2.findChessboardCorners(gray, (7, 6), None)
-
-    if ret:
-        objpoints.append(objp)  # Add object points
-        corners2 = cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria)  # Refine corner locations
-        imgpoints.append(corners2)  # Add image points
+# Detect the corners in parallel; results are cached per image, so only new images are processed
+ret, mtx, dist, rvecs, tvecs, results = calibrate_chessboard(
+    images, pattern_size, cache_dir=os.path.join('calibration_images', 'corner_cache'))
 
+if show_corners:
+    for fname, result in zip(images, results):
+        if result is None or "corners" not in result:
+            continue
         # Draw and display the corners
-        img = cv2.drawChessboardCorners(img, (7, 6), corners2, ret)
+        img = cv2.imread(fname)
+        img = cv2.drawChessboardCorners(img, pattern_size, result["corners"], True)
         cv2.imshow('Chessboard', img)
         cv2.waitKey(500)
 
-cv2.destroyAllWindows()  # Close the image window
-
-# Perform camera calibration to get camera matrix and distortion coefficients
-ret, mtx, dist, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, gray.shape[::-1], None, None)
+    cv2.destroyAllWindows()  # Close the image window
 
-# Save the calibration results for later use
-np.savez('camera_calibration.npz', mtx=mtx, dist=dist, rvecs=rvecs, tvecs=tvecs)
+# Save the calibration results for later use, with the (width, height) they are valid for
+np.savez('camera_calibration.npz', mtx=mtx, dist=dist, rvecs=rvecs, tvecs=tvecs, size=image_size(results))
 
 # Output the results
 print("Camera matrix:")
 print(mtx)
 print("Distortion coefficients:")
-print(dist)
\ No newline at end of file
+print(dist)
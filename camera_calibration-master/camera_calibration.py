@@ -8,7 +8,6 @@ from cv2 import aruco
 import yaml
 import numpy as np
 from pathlib import Path
-from tqdm import tqdm
 
 # root directory of repo for relative path specification.
 root = Path(__file__).parent.absolute()
@@ -19,6 +18,9 @@ calibrate_camera = True
 # Set path to the images
 calib_imgs_path = root.joinpath("aruco_data")
 
+# Video source for validating: camera index, video file or directory of images
+validation_source = 0
+
 # For validating results, show aruco board to camera.
 aruco_dict = aruco.getPredefinedDictionary( aruco.DICT_6X6_1000 )
 
@@ -28,57 +30,54 @@ markerLength = 3.75  # Here, measurement unit is centimetre.
 # Provide separation between markers
 markerSeparation = 0.5   # Here, measurement unit is centimetre.
 
-# create arUco board
-board = aruco.GridBoard_create(4, 5, markerLength, markerSeparation, aruco_dict)
+# create arUco board (OpenCV 4.7 replaced the factory functions with constructors)
+if hasattr(aruco, "GridBoard_create"):
+    board = aruco.GridBoard_create(4, 5, markerLength, markerSeparation, aruco_dict)
+    arucoParams = aruco.DetectorParameters_create()
+else:
+    board = aruco.GridBoard((4, 5), markerLength, markerSeparation, aruco_dict)
+    arucoParams = aruco.DetectorParameters()
 
 '''uncomment following block to draw and show the board'''
-img = board.draw((864,1080))
-cv2.imshow("aruco", img)
-
-arucoParams = aruco.DetectorParameters_create()
+#img = board.draw((864,1080)) if hasattr(board, "draw") else board.generateImage((864,1080), marginSize=10)
+#cv2.imshow("aruco", img)
 
 if calibrate_camera == True:
-    img_list = []
-    calib_fnms = calib_imgs_path.glob('*.jpg')
-    print('Using ...', end='')
-    for idx, fn in enumerate(calib_fnms):
-        print(idx, '', end='')
-        img = cv2.imread( str(root.joinpath(fn) ))
-        img_list.append( img )
-        h, w, c = img.shape
-    print('Calibration images')
-
-    counter, corners_list, id_list = [], [], []
-    first = True
-    for im in tqdm(img_list):
-        img_gray = cv2.cvtColor(im,cv2.COLOR_RGB2GRAY)
-        corners, ids, rejectedImgPoints = aruco.detectMarkers(img_gray, aruco_dict, parameters=arucoParams)
-        if first == True:
-            corners_list = corners
-            id_list = ids
-            first = False
-        else:
-            corners_list = np.vstack((corners_list, corners))
-            id_list = np.vstack((id_list,ids))
-        counter.append(len(ids))
-    print('Found {} unique markers'.format(np.unique(ids)))
+    import sys
+    sys.path.insert(0, str(root.parent))
+    from calibengine import aruco_points, calibrate_aruco, detect_aruco, detect_all, image_size
+
+    calib_fnms = sorted(calib_imgs_path.glob('*.jpg'))
+    print('Using {} calibration images'.format(len(calib_fnms)))
+
+    # Markers are detected in a process pool and cached per image, so only new images are processed
+    results, cached = detect_all(calib_fnms, detect_aruco, (aruco.DICT_6X6_1000,), "aruco_6x6_1000",
+                                 cache_dir=str(calib_imgs_path.joinpath("corner_cache")))
+    print('{} images from the corner cache'.format(cached))
+    corners_list, id_list, counter = aruco_points(results)
+    print('Found {} unique markers'.format(np.unique(id_list)))
 
-    counter = np.array(counter)
     print ("Calibrating camera .... Please wait...")
     #mat = np.zeros((3,3), float)
-    ret, mtx, dist, rvecs, tvecs = aruco.calibrateCameraAruco(corners_list, id_list, counter, board, img_gray.shape, None, None )
+    ret, mtx, dist = calibrate_aruco(corners_list, id_list, counter, board, image_size(results))
 
     print("Camera matrix is \n", mtx, "\n And is stored in calibration.yaml file along with distortion coefficients : \n", dist)
-    data = {'camera_matrix': np.asarray(mtx).tolist(), 'dist_coeff': np.asarray(dist).tolist()}
+    data = {'camera_matrix': np.asarray(mtx).tolist(), 'dist_coeff': np.asarray(dist).tolist(),
+            'image_size': list(image_size(results))}
     with open("calibration.yaml", "w") as f:
         yaml.dump(data, f)
 
 else:
-    camera = cv2.VideoCapture(0)
-    ret, img = camera.read()
+    import sys
+    sys.path.insert(0, str(root.parent))
+    from capture import open_source
+    from markertracker import MarkerTracker
+    from rectify import Rectifier
+
+    camera = open_source(validation_source)
 
     with open('calibration.yaml') as f:
-        loadeddict = yaml.load(f)
+        loadeddict = yaml.safe_load(f)
     mtx = loadeddict.get('camera_matrix')
     dist = loadeddict.get('dist_coeff')
     mtx = np.array(mtx)
@@ -87,29 +86,43 @@ else:
     ret, img = camera.read()
     img_gray = cv2.cvtColor(img,cv2.COLOR_RGB2GRAY)
     h,  w = img_gray.shape[:2]
-    newcameramtx, roi=cv2.getOptimalNewCameraMatrix(mtx,dist,(w,h),1,(w,h))
+    # Undistortion tables are built once and cached next to calibration.yaml
+    rectifier = Rectifier(mtx, dist, (w, h), cache_dir=str(root.joinpath("rectify_cache")))
+    newcameramtx, roi = rectifier.new_camera_matrix, rectifier.roi
+
+    # Markers are detected once, then followed with optical flow between detections
+    tracker = MarkerTracker(aruco.DICT_6X6_1000)
+    no_distortion = np.zeros(5)
 
     pose_r, pose_t = [], []
     while True:
         ret, img = camera.read()
-        img_aruco = img
+        if not ret:
+            break
         im_gray = cv2.cvtColor(img,cv2.COLOR_RGB2GRAY)
         h,  w = im_gray.shape[:2]
-        dst = cv2.undistort(im_gray, mtx, dist, None, newcameramtx)
-        corners, ids, rejectedImgPoints = aruco.detectMarkers(dst, aruco_dict, parameters=arucoParams)
+        dst = rectifier.apply(im_gray)
+        img_aruco = cv2.cvtColor(dst, cv2.COLOR_GRAY2BGR)
+        markers = tracker.update(dst)
         #cv2.imshow("original", img_gray)
-        if corners == None:
+        if not markers:
             print ("pass")
         else:
+            corners = [marker.corners.reshape(1, 4, 2) for marker in markers]
+            ids = np.array([[marker.marker_id] for marker in markers], dtype=np.int32)
+            # Board pose from the detected markers' corners matched to their places on the board.
+            # The image is already undistorted, so the new camera matrix needs no distortion terms
+            obj_points, img_points = board.matchImagePoints(corners, ids)
+            ret = obj_points is not None and len(obj_points) >= 4
+            if ret:
+                ret, rvec, tvec = cv2.solvePnP(obj_points, img_points, newcameramtx, no_distortion)
+            if ret:
+                print ("Rotation ", rvec, "Translation", tvec)
+                img_aruco = aruco.drawDetectedMarkers(img_aruco, corners, ids, (0,255,0))
+                img_aruco = cv2.drawFrameAxes(img_aruco, newcameramtx, no_distortion, rvec, tvec, 10)    # axis length 10 can be changed according to your requirement
 
-            ret, rvec, tvec = aruco.estimatePoseBoard(corners, ids, board, newcameramtx, dist) # For a board
-            print ("Rotation ", rvec, "Translation", tvec)
-            if ret != 0:
-                img_aruco = aruco.drawDetectedMarkers(img, corners, ids, (0,255,0))
-                img_aruco = aruco.drawAxis(img_aruco, newcameramtx, dist, rvec, tvec, 10)    # axis length 100 can be changed according to your requirement
-
-            if cv2.waitKey(0) & 0xFF == ord('q'):
-                break;
         cv2.imshow("World co-ordinate frame axes", img_aruco)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
 
-cv2.destroyAllWindows()
+    cv2.destroyAllWindows()
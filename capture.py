@@ -0,0 +1,179 @@
+import glob
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+# Seconds read() waits for a frame; cameras can take several seconds to deliver the first one
+READ_TIMEOUT = 1.0
+FIRST_FRAME_TIMEOUT = 10.0
+
+
+class ImageDirectorySource:
+    """Minimal cv2.VideoCapture stand-in that reads a sorted directory of images."""
+
+    def __init__(self, path):
+        self.paths = sorted(
+            p for p in glob.glob(os.path.join(path, "*")) if p.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        self.index = 0
+
+    def isOpened(self):
+        return self.index < len(self.paths)
+
+    def read(self, image=None):
+        if self.index >= len(self.paths):
+            return False, None
+        frame = cv2.imread(self.paths[self.index])
+        self.index += 1
+        if frame is None:
+            return False, None
+        if image is not None and image.shape == frame.shape:
+            image[...] = frame
+            return True, image
+        return True, frame
+
+    def release(self):
+        self.index = len(self.paths)
+
+
+def open_source(source):
+    """Open a camera index, a video file, or a directory of images."""
+    if isinstance(source, str) and os.path.isdir(source):
+        return ImageDirectorySource(source)
+    return cv2.VideoCapture(source)
+
+
+class LatestFrameCapture:
+    """Grab and decode frames on a background thread, always handing out the newest one.
+
+    Frames land in a small preallocated ring of buffers. The capture thread never
+    writes into the buffer the caller currently holds, so a frame returned by
+    read() stays valid until the next read(). Frames that were captured but never
+    read are counted as dropped.
+    """
+
+    def __init__(self, source=0, num_buffers=3, fps=None):
+        if num_buffers < 3:
+            raise ValueError("At least 3 buffers are needed: one being read, one latest, one being written.")
+        self.cap = open_source(source)
+        self.num_buffers = num_buffers
+        # Pace file and directory sources to a camera-like rate; None reads as fast as possible
+        self.fps = fps
+        self.buffers = [None] * num_buffers
+        self.timestamps = np.zeros(num_buffers, dtype=np.float64)
+        self.sequence = np.zeros(num_buffers, dtype=np.int64)
+
+        self.condition = threading.Condition()
+        self.latest = -1
+        self.reading = -1
+        self.captured = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.last_latency = 0.0
+        self.total_latency = 0.0
+        self.running = False
+        self.finished = False
+        self.thread = None
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def start(self):
+        """Start the background capture thread."""
+        if self.running:
+            return self
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="LatestFrameCapture", daemon=True)
+        self.thread.start()
+        return self
+
+    def _next_write_index(self):
+        for index in range(self.num_buffers):
+            if index != self.latest and index != self.reading:
+                return index
+        raise RuntimeError("No free capture buffer.")
+
+    def _run(self):
+        period = 1.0 / self.fps if self.fps else 0.0
+        next_time = time.perf_counter()
+        while self.running:
+            with self.condition:
+                index = self._next_write_index()
+            success, frame = self.cap.read(self.buffers[index])
+            if not success:
+                break
+            stamp = time.perf_counter()
+
+            with self.condition:
+                self.buffers[index] = frame
+                self.timestamps[index] = stamp
+                self.captured += 1
+                self.sequence[index] = self.captured
+                self.latest = index
+                self.condition.notify_all()
+
+            if period:
+                next_time += period
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+        with self.condition:
+            self.finished = True
+            self.condition.notify_all()
+
+    def read(self, timeout=None):
+        """Return (success, frame) for the newest frame not yet handed out, waiting if needed.
+
+        Without a timeout, the first frame gets FIRST_FRAME_TIMEOUT for camera warm-up
+        and later ones READ_TIMEOUT.
+        """
+        if not self.running:
+            self.start()
+
+        with self.condition:
+            if timeout is None:
+                timeout = READ_TIMEOUT if self.captured else FIRST_FRAME_TIMEOUT
+            last_sequence = self.sequence[self.reading] if self.reading >= 0 else 0
+            deadline = time.perf_counter() + timeout
+            while self.latest < 0 or self.sequence[self.latest] == last_sequence:
+                remaining = deadline - time.perf_counter()
+                if self.finished or remaining <= 0:
+                    return False, None
+                self.condition.wait(remaining)
+
+            index = self.latest
+            self.dropped += int(self.sequence[index] - last_sequence) - 1
+            self.reading = index
+            self.delivered += 1
+            self.last_latency = time.perf_counter() - float(self.timestamps[index])
+            self.total_latency += self.last_latency
+            return True, self.buffers[index]
+
+    def stats(self):
+        """Return capture, delivery and drop counts plus capture-to-process latency in seconds."""
+        with self.condition:
+            return {
+                "captured": self.captured,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+                "last_latency": self.last_latency,
+                "mean_latency": self.total_latency / self.delivered if self.delivered else 0.0,
+            }
+
+    def release(self):
+        """Stop the capture thread and release the underlying source.
+
+        Waits for the thread to finish its current cap.read() first, so the source
+        is never released under it.
+        """
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.cap.release()
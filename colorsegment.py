@@ -0,0 +1,172 @@
+import hashlib
+import os
+
+import cv2
+import numpy as np
+
+# Every color class we threshold for, gathered from the detector scripts.
+# A class can own several HSV ranges (red wraps around the hue axis).
+COLOR_CLASSES = {
+    "red": [
+        (np.array([0, 170, 100]), np.array([10, 255, 255])),
+        (np.array([170, 170, 100]), np.array([180, 255, 255]))
+    ],
+    "pink": [(np.array([140, 100, 100]), np.array([170, 255, 255]))],
+    "white": [(np.array([0, 0, 200]), np.array([180, 50, 255]))],
+    "yellow": [(np.array([20, 170, 100]), np.array([30, 255, 255]))],
+    "blue": [(np.array([100, 100, 100]), np.array([130, 255, 255]))],
+    "green": [(np.array([35, 40, 40]), np.array([85, 255, 255]))],
+    # Looser red used by m.py and depthdetector.py
+    "red_loose": [
+        (np.array([0, 120, 70]), np.array([10, 255, 255])),
+        (np.array([170, 120, 70]), np.array([180, 255, 255]))
+    ],
+}
+
+# Bits kept per BGR channel in the direct BGR lookup table (64x64x64 = 256 KiB)
+BGR_LUT_BITS = 6
+
+# Where compiled BGR tables are persisted between runs
+LUT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lut_cache")
+
+_lut_cache = {}
+_bgr_lut_cache = {}
+
+
+def get_color_classes(names=None):
+    """Return the registered color classes, optionally restricted to the given names."""
+    if names is None:
+        return dict(COLOR_CLASSES)
+    return {name: COLOR_CLASSES[name] for name in names}
+
+
+def ranges_key(color_classes):
+    """Build a hashable key describing the class names and their HSV ranges."""
+    return tuple(
+        (name, tuple((tuple(int(v) for v in lower), tuple(int(v) for v in upper)) for lower, upper in ranges))
+        for name, ranges in color_classes.items()
+    )
+
+
+def build_hsv_lut(color_classes):
+    """Compile color classes into one 256-entry class-bitmask table per HSV channel.
+
+    Bit i of lut[c][value] is set when value lies inside channel c of a range of
+    the i-th class, so a pixel belongs to the class when the bit is set in all
+    three channels. Bounds are inclusive, matching cv2.inRange. The ranges of a
+    class may differ in one channel only (red wrapping around the hue axis),
+    otherwise the per-channel tables would accept mixed combinations.
+    """
+    if len(color_classes) > 8:
+        raise ValueError("At most 8 color classes fit in a uint8 bitmask.")
+
+    lut = np.zeros((3, 256), dtype=np.uint8)
+    for bit, (name, ranges) in enumerate(color_classes.items()):
+        first_lower, first_upper = ranges[0]
+        differing = {channel for lower, upper in ranges[1:] for channel in range(3)
+                     if (lower[channel], upper[channel]) != (first_lower[channel], first_upper[channel])}
+        if len(differing) > 1:
+            raise ValueError(f"The ranges of color class {name!r} differ in more than one channel.")
+        for lower, upper in ranges:
+            for channel in range(3):
+                lut[channel, int(lower[channel]):int(upper[channel]) + 1] |= np.uint8(1 << bit)
+    return lut
+
+
+def get_hsv_lut(color_classes):
+    """Return the lookup tables for the given classes, building them only once per set of ranges."""
+    key = ranges_key(color_classes)
+    lut = _lut_cache.get(key)
+    if lut is None:
+        lut = build_hsv_lut(color_classes)
+        _lut_cache[key] = lut
+    return lut
+
+
+def segment_hsv(img_hsv, lut, out=None):
+    """Classify every pixel of an HSV frame into a packed label image with three 8-bit table lookups."""
+    h, s, v = cv2.split(img_hsv)
+    cv2.LUT(h, lut[0], dst=h)
+    cv2.LUT(s, lut[1], dst=s)
+    cv2.LUT(v, lut[2], dst=v)
+    cv2.bitwise_and(h, s, dst=h)
+    return cv2.bitwise_and(h, v, dst=out)
+
+
+def label_mask(labels, bit, out=None):
+    """Extract a 0/255 mask for one class bit from a packed label image."""
+    selected = cv2.bitwise_and(labels, int(1 << bit))
+    return cv2.compare(selected, 0, cv2.CMP_NE, dst=out)
+
+
+def split_masks(labels, color_classes):
+    """Unpack a label image into a dict of per-class 0/255 masks."""
+    return {name: label_mask(labels, bit) for bit, name in enumerate(color_classes)}
+
+
+def segment_masks(img_hsv, color_classes):
+    """Produce a mask for every color class from a single pass over the HSV frame."""
+    labels = segment_hsv(img_hsv, get_hsv_lut(color_classes))
+    return split_masks(labels, color_classes)
+
+
+def build_bgr_lut(color_classes, bits=BGR_LUT_BITS):
+    """Compile color classes into a quantized BGR -> class-bitmask lookup table.
+
+    Each BGR cell is classified by converting its center color to HSV once, so
+    frames can later be labelled straight from BGR without cv2.cvtColor.
+    """
+    step = 256 >> bits
+    centers = (np.arange(1 << bits, dtype=np.uint16) * step + step // 2).astype(np.uint8)
+    b, g, r = np.meshgrid(centers, centers, centers, indexing="ij")
+    cube = np.stack([b, g, r], axis=-1).reshape(1, -1, 3)
+    cube_hsv = cv2.cvtColor(cube, cv2.COLOR_BGR2HSV)
+    return segment_hsv(cube_hsv, get_hsv_lut(color_classes)).reshape(-1)
+
+
+def bgr_lut_path(color_classes, bits=BGR_LUT_BITS, cache_dir=LUT_CACHE_DIR):
+    """Return the on-disk location of the BGR table for these ranges and bit depth."""
+    digest = hashlib.sha1(repr(ranges_key(color_classes)).encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, f"bgr_lut_{bits}bit_{digest}.npy")
+
+
+def load_bgr_lut(color_classes, bits=BGR_LUT_BITS, cache_dir=LUT_CACHE_DIR):
+    """Load the BGR table from disk, compiling and saving it if the ranges changed."""
+    key = (ranges_key(color_classes), bits)
+    lut = _bgr_lut_cache.get(key)
+    if lut is not None:
+        return lut
+
+    path = bgr_lut_path(color_classes, bits, cache_dir)
+    if os.path.exists(path):
+        lut = np.load(path)
+    else:
+        lut = build_bgr_lut(color_classes, bits)
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(path, lut)
+    _bgr_lut_cache[key] = lut
+    return lut
+
+
+def segment_bgr(frame, lut, bits=BGR_LUT_BITS, out=None):
+    """Classify a BGR frame with a single table gather, skipping the HSV conversion.
+
+    The table is quantized, so pixels near a range boundary can be classified
+    differently than by segment_hsv. The gather costs about as much as cvtColor
+    plus segment_hsv on small frames and more on full ones; it is for classes
+    that are not boxes in HSV, like fieldlines' "bright and not green".
+    """
+    shift = 8 - bits
+    b, g, r = cv2.split(frame)
+    index = (b >> shift).astype(np.uint32)
+    index <<= bits
+    index |= g >> shift
+    index <<= bits
+    index |= r >> shift
+    return np.take(lut, index, out=out)
+
+
+def segment_bgr_masks(frame, color_classes, bits=BGR_LUT_BITS):
+    """Produce a mask for every color class directly from a BGR frame."""
+    labels = segment_bgr(frame, load_bgr_lut(color_classes, bits), bits)
+    return split_masks(labels, color_classes)
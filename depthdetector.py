@@ -1,23 +1,33 @@
+# Imported first so the startup timer covers the rest of the imports
+from startup import background, startup
+
+import os
+
 import cv2
-import torch
 import numpy as np
-from PIL import Image
-from torchvision.transforms import transforms
+from depthmodels import TIERS, AdaptiveDepthPolicy, set_torch_threads
+from depthworker import DepthWorker
+from profiler import profiler, stage
 
-# Load the MiDaS model
-model_type = "DPT_Large"  # Options: DPT_Large, DPT_Hybrid, MiDaS_small
-model = torch.hub.load("intel-isl/MiDaS", model_type)
-model.eval()
+# Depth model tier to start with (DPT_Large, DPT_Hybrid, MiDaS_small or geometric) and the
+# depth update rate to hold; slower tiers are dropped automatically when they cannot keep up.
+model_type = os.environ.get("DEPTH_MODEL", "DPT_Large")
+target_fps = float(os.environ.get("DEPTH_FPS", "5"))
 
-# Load transforms for MiDaS
-transform = (
-    torch.hub.load("intel-isl/MiDaS", "transforms").dpt_transform
-    if model_type.startswith("DPT")
-    else torch.hub.load("intel-isl/MiDaS", "transforms").small_transform
-)
+# torch intra-op threads, leaving the other cores to capture and detection
+torch_threads = 2
 
-# Function to detect the red ball
-def detect_red_ball(frame):
+
+def start_depth_worker():
+    """Load and warm up the depth model, then start the inference thread."""
+    set_torch_threads(torch_threads)
+    depth_policy = AdaptiveDepthPolicy(TIERS, start=model_type, target_fps=target_fps)
+    depth_policy.service.warmup()
+    return DepthWorker(policy=depth_policy).start()
+
+
+# Function to detect the red regions, largest first
+def detect_red_regions(frame, max_regions=4):
     hsv_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
 
     # Define the red color range in HSV
@@ -33,47 +43,60 @@ def detect_red_ball(frame):
 
     # Find contours
     contours, _ = cv2.findContours(red_mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-    if contours:
-        largest_contour = max(contours, key=cv2.contourArea)
-        if cv2.contourArea(largest_contour) > 500:  # Minimum size filter
-            x, y, w, h = cv2.boundingRect(largest_contour)
-            return (x, y, w, h)
-    return None
+    contours = sorted(contours, key=cv2.contourArea, reverse=True)[:max_regions]
+    # Minimum size filter
+    return [cv2.boundingRect(contour) for contour in contours if cv2.contourArea(contour) > 500]
+
+# Function to detect the red ball
+def detect_red_ball(frame):
+    regions = detect_red_regions(frame, max_regions=1)
+    return regions[0] if regions else None
+
+# The model loads and warms up in the background while the camera already runs; once
+# ready, inference runs on its own thread and the loop below only submits crops.
+depth_task = background("depth model ready", start_depth_worker)
+depth_worker = None
 
 # Initialize webcam
 cap = cv2.VideoCapture(0)
+startup.mark("camera open")
+frame_index = 0
 
 while cap.isOpened():
     ret, frame = cap.read()
     if not ret:
         break
 
-    # Get the bounding box of the red ball
-    ball_region = detect_red_ball(frame)
-    if ball_region:
-        x, y, w, h = ball_region
-
-        # Crop the ball region and preprocess for MiDaS
-        ball_frame = frame[y : y + h, x : x + w]
-        input_image = cv2.cvtColor(ball_frame, cv2.COLOR_BGR2RGB)
-        input_image_pil = Image.fromarray(input_image)  # Convert to PIL image
-
-        # Apply transform
-        input_image_tensor = transform(input_image_pil).unsqueeze(0)  # Add batch dimension
-
-        # Predict depth using MiDaS
-        with torch.no_grad():
-            prediction = model(input_image_tensor)
-            depth_map = prediction.squeeze().cpu().numpy()
-
-        # Get the average depth in the region
-        avg_depth = np.mean(depth_map)
+    profiler.start_frame()
+
+    # Get the bounding boxes of the red ball and any other red objects
+    with stage("detect_red_regions"):
+        regions = detect_red_regions(frame)
+    boxes = {("ball" if i == 0 else f"red{i}"): region for i, region in enumerate(regions)}
+
+    # Depth is only recomputed for boxes that moved, grew or went stale, all in one batch
+    if depth_worker is None and depth_task.done:
+        depth_worker = depth_task.result()
+    if depth_worker is not None:
+        depth_worker.submit_many(frame, boxes, frame_index)
+        for object_id in list(depth_worker.results):
+            if object_id not in boxes:
+                depth_worker.forget(object_id)
+
+    for object_id, (x, y, w, h) in boxes.items():
+        latest = depth_worker.latest(object_id) if depth_worker is not None else None
+        if latest is None:
+            label = "Depth: ..." if depth_worker is not None else "Depth: loading"
+        else:
+            result, staleness = latest
+            units = "" if result.units == "relative" else f" {result.units}"
+            label = f"Depth: {result.depth:.2f}{units} ({staleness * 1000:.0f} ms old)"
 
         # Display the depth and draw bounding box
         cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
         cv2.putText(
             frame,
-            f"Depth: {avg_depth:.2f}",
+            label,
             (x, y - 10),
             cv2.FONT_HERSHEY_SIMPLEX,
             0.6,
@@ -81,8 +104,13 @@ while cap.isOpened():
             2,
         )
 
+    profiler.end_frame()
+    frame_index += 1
+
     # Show the frame
     cv2.imshow("Depth Estimation", frame)
+    if startup.first_frame():
+        print(startup.report())
 
     # Quit if 'q' is pressed
     if cv2.waitKey(1) & 0xFF == ord("q"):
@@ -90,3 +118,9 @@ while cap.isOpened():
 
 cap.release()
 cv2.destroyAllWindows()
+if depth_worker is not None:
+    depth_worker.stop()
+    print("Depth worker:", depth_worker.stats())
+print(startup.report())
+if profiler.enabled:
+    print(profiler.report())
@@ -0,0 +1,233 @@
+import os
+import threading
+from collections import namedtuple
+
+from depthservice import DepthCache, DepthService
+from startup import load_cached_model
+
+# How to build one depth backend. loader() returns a model taking a (n, 3, size, size)
+# tensor, or None for backends that need no model; units tells callers how to read depth.
+BackendSpec = namedtuple("BackendSpec", ["name", "loader", "input_size", "normalization", "units"])
+
+BACKENDS = {}
+
+# Most to least accurate; the adaptive policy moves along this list
+TIERS = ["DPT_Large", "DPT_Hybrid", "MiDaS_small", "geometric"]
+
+_models = {}
+_loading = {}
+_lock = threading.Lock()
+
+
+def register_backend(name, loader, input_size=None, normalization="dpt", units="relative"):
+    """Add or replace a depth backend, e.g. a small local stand-in model for tests."""
+    BACKENDS[name] = BackendSpec(name, loader, input_size, normalization, units)
+    with _lock:
+        _models.pop(name, None)
+
+
+def _hub_loader(model_type):
+    def build():
+        import torch
+
+        return torch.hub.load("intel-isl/MiDaS", model_type)
+
+    def skeleton():
+        import torch
+
+        # Architecture only, from the hub code already on disk when it is there
+        local = os.path.join(torch.hub.get_dir(), "intel-isl_MiDaS_master")
+        if os.path.isdir(local):
+            return torch.hub.load(local, model_type, source="local", pretrained=False)
+        return torch.hub.load("intel-isl/MiDaS", model_type, pretrained=False)
+
+    return lambda: load_cached_model(model_type, build, skeleton)
+
+
+register_backend("DPT_Large", _hub_loader("DPT_Large"), input_size=384, normalization="dpt")
+register_backend("DPT_Hybrid", _hub_loader("DPT_Hybrid"), input_size=384, normalization="dpt")
+register_backend("MiDaS_small", _hub_loader("MiDaS_small"), input_size=256, normalization="imagenet")
+register_backend("geometric", lambda: None, units="cm")
+
+
+def load_model(name):
+    """Return the backend's model, loading it on first use and keeping it in memory.
+
+    Concurrent callers for the same backend wait for a single load.
+    """
+    with _lock:
+        if name in _models:
+            return _models[name]
+        event = _loading.get(name)
+        owner = event is None
+        if owner:
+            event = _loading[name] = threading.Event()
+    if not owner:
+        event.wait()
+        if name not in _models:
+            raise RuntimeError(f"Loading depth backend {name} failed")
+        return _models[name]
+    try:
+        model = BACKENDS[name].loader()
+        with _lock:
+            _models[name] = model
+        return model
+    finally:
+        with _lock:
+            del _loading[name]
+        event.set()
+
+
+def set_torch_threads(num_threads):
+    """Set torch's intra-op thread count; it applies to the whole process, so call it once at startup."""
+    import torch
+
+    torch.set_num_threads(num_threads)
+
+
+def is_loaded(name):
+    return name in _models
+
+
+def preload(name):
+    """Load a backend's model on a background thread; returns the thread, or None if already loaded."""
+    if is_loaded(name):
+        return None
+    thread = threading.Thread(target=load_model, args=(name,), name=f"load-{name}", daemon=True)
+    thread.start()
+    return thread
+
+
+class GeometricDepth:
+    """Distance from a box's pixel size (dpth.py's get_dist), with the DepthService interface.
+
+    Uses the same calibrated per-pixel tables as dpth.py (geometry.geometry_for);
+    focal is only used when there is no camera calibration. Depth is in the units
+    of real_diameter (cm by default), not MiDaS relative depth.
+    """
+
+    units = "cm"
+
+    def __init__(self, real_diameter=4, focal=1080, cache=None):
+        self.real_diameter = real_diameter
+        self.focal = focal
+        self.cache = cache if cache is not None else DepthCache()
+
+    def warmup(self, batch_size=1):
+        pass
+
+    def measure(self, crop, box=None, frame_size=None):
+        """Distance of an object filling crop; its box and the frame size place it in the image.
+
+        Without them the optical center of a frame the crop's size is assumed.
+        """
+        from geometry import geometry_for
+
+        pixel_diameter = max(crop.shape[:2])
+        if box is None or frame_size is None:
+            return geometry_for(crop.shape[1::-1], self.focal).distance(self.real_diameter, pixel_diameter)
+        x, y, w, h = box
+        return geometry_for(frame_size, self.focal).distance(self.real_diameter, pixel_diameter,
+                                                             x + (w - 1) / 2, y + (h - 1) / 2)
+
+    def measure_batch(self, crops, statistic="mean", boxes=None, frame_size=None):
+        boxes = boxes if boxes is not None else [None] * len(crops)
+        return [self.measure(crop, box, frame_size) for crop, box in zip(crops, boxes)]
+
+    def depths(self, frame, boxes, frame_index, statistic="mean"):
+        results = {}
+        for object_id, (x, y, w, h) in boxes.items():
+            depth = self.measure(frame[y:y + h, x:x + w], (x, y, w, h), frame.shape[1::-1])
+            self.cache.put(object_id, depth, (x, y, w, h), frame_index)
+            results[object_id] = (depth, True)
+        return results
+
+
+def make_service(name, cache=None):
+    """Build a depth service for a backend, loading its model if needed."""
+    spec = BACKENDS[name]
+    if spec.input_size is None:
+        return GeometricDepth(cache=cache)
+    service = DepthService(load_model(name), spec.input_size, spec.normalization, cache=cache)
+    service.units = spec.units
+    return service
+
+
+class AdaptiveDepthPolicy:
+    """Switch depth tiers at runtime so inference keeps up with a target rate.
+
+    record() takes the duration of each inference. When its moving average on the
+    current tier exceeds the budget (1 / target_fps), the policy drops to the next
+    cheaper tier, whose model is preloaded in the background so the switch does
+    not stall. After `cooldown` inferences well under budget it tries the next
+    better tier again once that model is in memory; a tier that immediately
+    proves too slow doubles the wait before the next attempt. Services share one
+    cache, which is cleared on a switch since tiers do not report depth in the
+    same units.
+    """
+
+    def __init__(self, tiers=TIERS, start=None, target_fps=5.0, smoothing=0.2, upgrade_margin=0.5, cooldown=20,
+                 min_samples=3):
+        self.tiers = list(tiers)
+        self.index = self.tiers.index(start) if start is not None else 0
+        self.budget = 1.0 / target_fps
+        self.smoothing = smoothing
+        self.upgrade_margin = upgrade_margin  # Move up only while under this fraction of the budget
+        self.cooldown = cooldown  # Inferences on a tier before considering an upgrade
+        self.wait = cooldown  # Current cooldown, doubled after a failed upgrade
+        self.min_samples = min_samples
+        self.latency = {}  # Moving average of inference seconds per tier
+        self.since_switch = 0
+        self.switches = 0
+        self.upgraded = False
+        self.cache = DepthCache()
+        self.services = {}
+        self.service = self._service(self.tier)
+        self._preload_next()
+
+    @property
+    def tier(self):
+        return self.tiers[self.index]
+
+    def _service(self, name):
+        service = self.services.get(name)
+        if service is None:
+            service = self.services[name] = make_service(name, cache=self.cache)
+        return service
+
+    def _preload_next(self):
+        if self.index + 1 < len(self.tiers):
+            preload(self.tiers[self.index + 1])
+
+    def _switch(self, index):
+        self.index = index
+        self.service = self._service(self.tier)
+        self.cache.clear()
+        self.since_switch = 0
+        self.switches += 1
+        self._preload_next()
+
+    def record(self, seconds):
+        """Account for one inference on the current tier and switch tiers if needed; returns the tier."""
+        name = self.tier
+        previous = self.latency.get(name)
+        average = seconds if previous is None or self.since_switch < self.min_samples else previous + self.smoothing * (seconds - previous)
+        self.latency[name] = average
+        self.since_switch += 1
+
+        if self.since_switch < self.min_samples:
+            return name  # The first passes after a switch include warmup
+        if average > self.budget and self.index + 1 < len(self.tiers):
+            failed_upgrade = self.upgraded and self.since_switch <= self.cooldown
+            self.wait = min(self.wait * 2, self.cooldown * 64) if failed_upgrade else self.cooldown
+            self._switch(self.index + 1)
+            self.upgraded = False
+        elif self.index > 0 and self.since_switch >= self.wait and average < self.upgrade_margin * self.budget:
+            better = self.tiers[self.index - 1]
+            if is_loaded(better):
+                self.latency.pop(better, None)  # Measure it afresh
+                self._switch(self.index - 1)
+                self.upgraded = True
+            else:
+                preload(better)
+        return self.tier
@@ -0,0 +1,216 @@
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# Input normalisation of the MiDaS transforms (RGB order)
+NORMALIZATION = {
+    "dpt": ((0.5, 0.5, 0.5), (0.5, 0.5, 0.5)),
+    "imagenet": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225)),
+}
+
+# Depth of one object: mean of the depth map over its box, plus when it was computed
+CachedDepth = namedtuple("CachedDepth", ["depth", "box", "frame_index"])
+
+
+class Preprocessor:
+    """NumPy-native replacement for the MiDaS PIL transforms.
+
+    Crops are resized, converted from BGR to normalised RGB planes and written
+    straight into a preallocated float32 array that a torch tensor shares memory
+    with, so no PIL image or new tensor is created per inference.
+    """
+
+    def __init__(self, size, normalization="dpt", batch_size=1):
+        import torch
+
+        mean, std = NORMALIZATION[normalization]
+        self.size = size
+        self.scale = 1.0 / (255.0 * np.asarray(std, dtype=np.float32))
+        self.offset = -np.asarray(mean, dtype=np.float32) / np.asarray(std, dtype=np.float32)
+        self.resized = np.empty((size, size, 3), dtype=np.uint8)
+        self.array = np.zeros((batch_size, 3, size, size), dtype=np.float32)
+        self.tensor = torch.from_numpy(self.array)
+
+    def fill(self, index, crop):
+        """Write one BGR crop, stretched to size x size, into slot index of the batch."""
+        cv2.resize(crop, (self.size, self.size), dst=self.resized, interpolation=cv2.INTER_AREA)
+        for channel in range(3):
+            # Input is BGR, the model expects RGB planes
+            plane = self.array[index, channel]
+            np.multiply(self.resized[:, :, 2 - channel], self.scale[channel], out=plane, casting="unsafe")
+            plane += self.offset[channel]
+
+    def letterbox(self, index, crop):
+        """Write one BGR crop, scaled to fit with its aspect ratio kept, into slot index.
+
+        The padding is zero after normalisation, i.e. the dataset mean color.
+        Returns the (x, y, w, h) the crop occupies in the size x size input.
+        """
+        h, w = crop.shape[:2]
+        scale = self.size / max(h, w)
+        nw, nh = max(1, round(w * scale)), max(1, round(h * scale))
+        x0, y0 = (self.size - nw) // 2, (self.size - nh) // 2
+        resized = cv2.resize(crop, (nw, nh), interpolation=cv2.INTER_AREA)
+        self.array[index] = 0.0
+        for channel in range(3):
+            plane = self.array[index, channel, y0:y0 + nh, x0:x0 + nw]
+            np.multiply(resized[:, :, 2 - channel], self.scale[channel], out=plane, casting="unsafe")
+            plane += self.offset[channel]
+        return x0, y0, nw, nh
+
+
+def region_statistics(predictions, rects, input_size):
+    """Mean and median of each prediction over its letterboxed rect, without a Python loop per pixel.
+
+    predictions is (n, H, W); rects are (x, y, w, h) in input_size coordinates and
+    are rescaled when the model's output resolution differs from its input.
+    """
+    n, height, width = predictions.shape
+    rects = np.asarray(rects, dtype=np.float64).reshape(n, 4)
+    sx, sy = width / input_size, height / input_size
+    x0 = np.floor(rects[:, 0] * sx)[:, None, None]
+    y0 = np.floor(rects[:, 1] * sy)[:, None, None]
+    x1 = np.ceil((rects[:, 0] + rects[:, 2]) * sx)[:, None, None]
+    y1 = np.ceil((rects[:, 1] + rects[:, 3]) * sy)[:, None, None]
+    rows = np.arange(height)[None, :, None]
+    cols = np.arange(width)[None, None, :]
+    inside = (rows >= y0) & (rows < y1) & (cols >= x0) & (cols < x1)
+
+    counts = np.maximum(inside.sum(axis=(1, 2)), 1)
+    means = np.where(inside, predictions, 0.0).sum(axis=(1, 2)) / counts
+    medians = np.nanmedian(np.where(inside, predictions, np.nan), axis=(1, 2))
+    return means, medians
+
+
+def box_changed(old_box, new_box, move_threshold, grow_threshold):
+    """True when the box center moved or its area changed by more than the given fractions of its size."""
+    ox, oy, ow, oh = old_box
+    nx, ny, nw, nh = new_box
+    shift = np.hypot((nx + nw / 2) - (ox + ow / 2), (ny + nh / 2) - (oy + oh / 2))
+    if shift > move_threshold * max(ow, oh, 1):
+        return True
+    old_area, new_area = max(ow * oh, 1), nw * nh
+    return abs(new_area - old_area) > grow_threshold * old_area
+
+
+class DepthCache:
+    """Per-object depth values that are reused until the object's box changes or goes stale.
+
+    Safe to share between the capture loop and an inference thread.
+    """
+
+    def __init__(self, move_threshold=0.25, grow_threshold=0.2, max_age=15):
+        self.move_threshold = move_threshold  # Center shift, as a fraction of the box size
+        self.grow_threshold = grow_threshold  # Relative area change
+        self.max_age = max_age  # Frames before a value is recomputed regardless
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, object_id):
+        with self.lock:
+            return self.entries.get(object_id)
+
+    def put(self, object_id, depth, box, frame_index):
+        with self.lock:
+            self.entries[object_id] = CachedDepth(depth, tuple(box), frame_index)
+
+    def needs_update(self, object_id, box, frame_index):
+        with self.lock:
+            entry = self.entries.get(object_id)
+        if entry is None or frame_index - entry.frame_index >= self.max_age:
+            return True
+        return box_changed(entry.box, box, self.move_threshold, self.grow_threshold)
+
+    def forget(self, object_id):
+        with self.lock:
+            self.entries.pop(object_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class DepthService:
+    """MiDaS depth for tracked objects, re-running inference only when a box really changes."""
+
+    units = "relative"  # MiDaS predicts relative inverse depth: larger is closer
+
+    def __init__(self, model, input_size=384, normalization="dpt", cache=None, max_batch=8):
+        self.model = model
+        self.input_size = input_size
+        self.max_batch = max_batch
+        self.preprocessor = Preprocessor(input_size, normalization, batch_size=max_batch)
+        self.cache = cache if cache is not None else DepthCache()
+        self.inferences = 0
+        self.cache_hits = 0
+
+    def infer(self, crop):
+        """Run the model on one BGR crop and return the relative depth map as a NumPy array."""
+        import torch
+
+        self.preprocessor.fill(0, crop)
+        with torch.inference_mode():
+            prediction = self.model(self.preprocessor.tensor[:1])
+        self.inferences += 1
+        return prediction[0].cpu().numpy()
+
+    def infer_batch(self, crops):
+        """Letterbox up to max_batch crops into one batch and run a single forward pass.
+
+        Returns the (n, H, W) predictions and each crop's rect in the input.
+        """
+        import torch
+
+        rects = [self.preprocessor.letterbox(i, crop) for i, crop in enumerate(crops)]
+        with torch.inference_mode():
+            predictions = self.model(self.preprocessor.tensor[:len(crops)])
+        self.inferences += 1
+        return predictions.cpu().numpy(), rects
+
+    def warmup(self, batch_size=1):
+        """Run the model once on a dummy batch so the first real inference is not the slow one."""
+        import torch
+
+        self.preprocessor.array[:batch_size] = 0.0
+        with torch.inference_mode():
+            self.model(self.preprocessor.tensor[:batch_size])
+
+    def measure(self, crop):
+        """Return the mean relative depth of a BGR crop."""
+        return float(np.mean(self.infer(crop)))
+
+    def measure_batch(self, crops, statistic="mean", boxes=None, frame_size=None):
+        """Return the mean (or median) relative depth of every crop, max_batch crops per forward pass.
+
+        boxes and frame_size (where the crops came from) are only used by GeometricDepth.
+        """
+        values = []
+        for start in range(0, len(crops), self.max_batch):
+            predictions, rects = self.infer_batch(crops[start:start + self.max_batch])
+            means, medians = region_statistics(predictions, rects, self.input_size)
+            values.extend((medians if statistic == "median" else means).tolist())
+        return values
+
+    def depths(self, frame, boxes, frame_index, statistic="mean"):
+        """Return {object id: (depth, recomputed)} for a dict of boxes, batching every stale one."""
+        stale = [object_id for object_id, box in boxes.items()
+                 if self.cache.needs_update(object_id, box, frame_index)]
+        if stale:
+            crops = [frame[y:y + h, x:x + w] for x, y, w, h in (boxes[object_id] for object_id in stale)]
+            for object_id, depth in zip(stale, self.measure_batch(crops, statistic)):
+                self.cache.put(object_id, depth, boxes[object_id], frame_index)
+        self.cache_hits += len(boxes) - len(stale)
+        return {object_id: (self.cache.get(object_id).depth, object_id in stale) for object_id in boxes}
+
+    def depth(self, object_id, frame, box, frame_index):
+        """Return (mean depth, recomputed) for an object's (x, y, w, h) box in this frame."""
+        if not self.cache.needs_update(object_id, box, frame_index):
+            self.cache_hits += 1
+            return self.cache.get(object_id).depth, False
+
+        x, y, w, h = box
+        depth = self.measure(frame[y:y + h, x:x + w])
+        self.cache.put(object_id, depth, box, frame_index)
+        return depth, True
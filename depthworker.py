@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import namedtuple
+
+# One finished depth measurement, in the service's units; captured_at is the timestamp of the frame it was computed from
+DepthResult = namedtuple("DepthResult", ["object_id", "depth", "units", "box", "frame_index", "captured_at", "completed_at"])
+
+
+class DepthWorker:
+    """Run depth inference on a background thread so the capture loop never waits for the model.
+
+    submit() and submit_many() drop a frame's crops into a size-1 mailbox: a
+    request that the worker has not picked up yet is replaced by the newer one, so
+    the model always works on the latest view. All crops of one request share a
+    single batched forward pass. Finished results are published per object and read
+    with latest(), which also reports how old the underlying frame is. torch runs
+    the forward pass without the GIL, so capture and display keep their rate; its
+    thread count is set once for the process (depthmodels.set_torch_threads).
+
+    An object forgotten while its crop is being measured stays forgotten: results
+    are only published for requests queued after the object's last forget().
+    """
+
+    def __init__(self, service=None, policy=None):
+        # depthservice.DepthService; its cache decides when to re-infer. With a
+        # depthmodels.AdaptiveDepthPolicy the service follows the policy's current tier.
+        self.policy = policy
+        self.service = policy.service if policy is not None else service
+        self.condition = threading.Condition()
+        self.pending = None
+        self.results = {}
+        self.results_lock = threading.Lock()  # Orders forget() against publishing results
+        self.generations = {}  # forget() count per object
+        self.submitted = 0
+        self.replaced = 0
+        self.completed = 0
+        self.total_inference = 0.0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start the inference thread."""
+        if self.running:
+            return self
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="DepthWorker", daemon=True)
+        self.thread.start()
+        return self
+
+    def submit(self, object_id, frame, box, frame_index, timestamp=None):
+        """Queue one object's crop for inference unless its cached depth is still valid.
+
+        Returns True when a request was queued. Only the crop is copied, so the
+        caller may reuse the frame buffer right away.
+        """
+        return self.submit_many(frame, {object_id: box}, frame_index, timestamp) > 0
+
+    def submit_many(self, frame, boxes, frame_index, timestamp=None):
+        """Queue every object in {object id: box} whose cached depth is stale, as one batch.
+
+        Returns how many objects were queued.
+        """
+        if not self.running:
+            return 0
+        cache = self.service.cache
+        stale = [(object_id, box) for object_id, box in boxes.items() if cache.needs_update(object_id, box, frame_index)]
+        if not stale:
+            return 0
+        captured_at = time.perf_counter() if timestamp is None else timestamp
+        requests = []
+        with self.results_lock:
+            for object_id, (x, y, w, h) in stale:
+                requests.append((object_id, frame[y:y + h, x:x + w].copy(), (x, y, w, h),
+                                 self.generations.get(object_id, 0)))
+        with self.condition:
+            if self.pending is not None:
+                self.replaced += 1
+            self.pending = (requests, frame.shape[1::-1], frame_index, captured_at)
+            self.submitted += 1
+            self.condition.notify()
+        return len(requests)
+
+    def latest(self, object_id, now=None):
+        """Return (DepthResult, staleness in seconds) for an object, or None before its first result."""
+        result = self.results.get(object_id)
+        if result is None:
+            return None
+        now = time.perf_counter() if now is None else now
+        return result, now - result.captured_at
+
+    def forget(self, object_id):
+        """Drop the cached and published depth of an object that is no longer tracked."""
+        with self.results_lock:
+            self.generations[object_id] = self.generations.get(object_id, 0) + 1
+            self.results.pop(object_id, None)
+            self.service.cache.forget(object_id)
+
+    def _run(self):
+        while self.running:
+            with self.condition:
+                while self.pending is None and self.running:
+                    self.condition.wait(0.1)
+                item, self.pending = self.pending, None
+            if item is None:
+                continue
+            requests, frame_size, frame_index, captured_at = item
+            start = time.perf_counter()
+            depths = self.service.measure_batch([crop for _, crop, _, _ in requests],
+                                                boxes=[box for _, _, box, _ in requests], frame_size=frame_size)
+            completed_at = time.perf_counter()
+            self.total_inference += completed_at - start
+            self.completed += 1
+            units = getattr(self.service, "units", "relative")
+            with self.results_lock:
+                for (object_id, _, box, generation), depth in zip(requests, depths):
+                    if self.generations.get(object_id, 0) != generation:
+                        continue  # Forgotten while it was being measured
+                    self.service.cache.put(object_id, depth, box, frame_index)
+                    self.results[object_id] = DepthResult(object_id, depth, units, box, frame_index,
+                                                          captured_at, completed_at)
+            if self.policy is not None:
+                # A tier switch clears the cache, so the next request re-measures in the new units
+                self.policy.record(completed_at - start)
+                self.service = self.policy.service
+
+    def stats(self):
+        """Return counts of requests submitted, replaced before being run and completed, plus mean inference time."""
+        return {
+            "submitted": self.submitted,
+            "replaced": self.replaced,
+            "completed": self.completed,
+            "mean_inference": self.total_inference / self.completed if self.completed else 0.0,
+            "tier": self.policy.tier if self.policy is not None else None,
+        }
+
+    def stop(self):
+        """Stop the inference thread after the current forward pass."""
+        self.running = False
+        if self.thread is not None:
+            with self.condition:
+                self.condition.notify()
+            self.thread.join(timeout=5.0)
+            self.thread = None
@@ -1,5 +1,6 @@
 import cv2
 import numpy as np
+from colorsegment import segment_masks
 
 def get_hsv_ranges():
     """Define HSV ranges for red and yellow colors."""
@@ -12,9 +13,9 @@ def get_hsv_ranges():
 
 def create_combined_mask(img_hsv, red_ranges, yellow_range):
     """Create a combined mask for red and yellow colors."""
-    red_mask = sum(cv2.inRange(img_hsv, lower, upper) for lower, upper in red_ranges)
-    yellow_mask = cv2.inRange(img_hsv, *yellow_range)
-    return red_mask | yellow_mask
+    # Red and yellow share one class so the combined mask comes out of a single pass
+    masks = segment_masks(img_hsv, {"ball": list(red_ranges) + [yellow_range]})
+    return masks["ball"]
 
 def detect_and_draw_circles(video, mask):
     """Detect circles in the mask and draw them on the video frame."""
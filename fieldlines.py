@@ -0,0 +1,369 @@
+import hashlib
+import math
+import os
+import sys
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from colorsegment import BGR_LUT_BITS, COLOR_CLASSES, ranges_key, segment_bgr
+from profiler import timed
+
+# Where bird's-eye remap tables are kept between runs
+BIRDSEYE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "birdseye_cache")
+
+# segments: (N, 4) x1, y1, x2, y2 in full-resolution pixels. ground: (N, 4) forward1, left1,
+# forward2, left2 on the floor from the point below the camera, or None without a bird's-eye view.
+FieldLines = namedtuple("FieldLines", ["segments", "ground", "mask"])
+
+_line_lut_cache = {}
+
+
+def build_line_lut(green_ranges=None, brightness=200, bits=BGR_LUT_BITS):
+    """Quantized BGR -> 0/255 table marking pixels that are bright and not green.
+
+    Each cell is classified once from its center color, as build_bgr_lut does,
+    with friedgedetection.py's test: grayscale above brightness and outside the
+    green HSV ranges.
+    """
+    green_ranges = COLOR_CLASSES["green"] if green_ranges is None else green_ranges
+    step = 256 >> bits
+    centers = (np.arange(1 << bits, dtype=np.uint16) * step + step // 2).astype(np.uint8)
+    b, g, r = np.meshgrid(centers, centers, centers, indexing="ij")
+    cube = np.stack([b, g, r], axis=-1).reshape(1, -1, 3)
+    bright = cv2.cvtColor(cube, cv2.COLOR_BGR2GRAY) > brightness
+    cube_hsv = cv2.cvtColor(cube, cv2.COLOR_BGR2HSV)
+    green = np.zeros(bright.shape, dtype=bool)
+    for lower, upper in green_ranges:
+        green |= cv2.inRange(cube_hsv, lower, upper).reshape(bright.shape) > 0
+    return np.where(bright & ~green, 255, 0).astype(np.uint8).reshape(-1)
+
+
+def get_line_lut(green_ranges=None, brightness=200, bits=BGR_LUT_BITS):
+    """The line table for these settings, built once per process."""
+    green_ranges = COLOR_CLASSES["green"] if green_ranges is None else green_ranges
+    key = (ranges_key({"green": green_ranges}), brightness, bits)
+    lut = _line_lut_cache.get(key)
+    if lut is None:
+        lut = build_line_lut(green_ranges, brightness, bits)
+        _line_lut_cache[key] = lut
+    return lut
+
+
+def camera_pose(height, pitch):
+    """rvec, tvec taking floor points (forward, left, up) into a camera at height, tilted down by pitch."""
+    cp, sp = math.cos(pitch), math.sin(pitch)
+    # Rows: camera x (right), y (down), z (forward) in the robot frame, as in geometry.py
+    rotation = np.array([[0, -1, 0], [-sp, 0, -cp], [cp, 0, -sp]], dtype=np.float64)
+    tvec = -rotation @ np.array([0, 0, height], dtype=np.float64)
+    return cv2.Rodrigues(rotation)[0], tvec
+
+
+def merge_segments(segments, distance_tolerance, angle_tolerance=math.radians(5), max_gap=0.0):
+    """Merge near-collinear segments, longest first, such as the two edges Hough finds on one thin line.
+
+    A segment joins a merged line when its direction is within angle_tolerance,
+    both its ends lie within distance_tolerance of that line, and it overlaps it
+    or lies within max_gap of it; the line then extends to cover both.
+    """
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+    if len(segments) == 0:
+        return np.empty((0, 4), dtype=np.float32)
+    lengths = np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1])
+    order = np.argsort(-lengths)
+    # Merged lines: origin, unit direction and the extent [start, end] along it
+    origins = np.empty((len(segments), 2))
+    directions = np.empty((len(segments), 2))
+    extents = np.empty((len(segments), 2))
+    count = 0
+    min_cos = math.cos(angle_tolerance)
+    for index in order:
+        p, q = segments[index, :2], segments[index, 2:]
+        direction = (q - p) / max(lengths[index], 1e-12)
+        o, d = origins[:count], directions[:count]
+        normals = np.stack([-d[:, 1], d[:, 0]], axis=1)
+        a = np.einsum("ij,ij->i", d, p - o)
+        b = np.einsum("ij,ij->i", d, q - o)
+        low, high = np.minimum(a, b), np.maximum(a, b)
+        match = ((np.abs(d @ direction) >= min_cos)
+                 & (np.abs(np.einsum("ij,ij->i", normals, p - o)) <= distance_tolerance)
+                 & (np.abs(np.einsum("ij,ij->i", normals, q - o)) <= distance_tolerance)
+                 & (low <= extents[:count, 1] + max_gap) & (high >= extents[:count, 0] - max_gap))
+        hits = np.flatnonzero(match)
+        if len(hits):
+            line = hits[0]
+            extents[line] = min(extents[line, 0], low[line]), max(extents[line, 1], high[line])
+        else:
+            origins[count], directions[count], extents[count] = p, direction, (0.0, lengths[index])
+            count += 1
+    origins, directions, extents = origins[:count], directions[:count], extents[:count]
+    starts = origins + extents[:, :1] * directions
+    ends = origins + extents[:, 1:] * directions
+    return np.concatenate([starts, ends], axis=1).astype(np.float32)
+
+
+class BirdsEye:
+    """Top-down view of the floor in front of the camera, through remap tables built once per mounting.
+
+    The view covers forward_range x left_range (in the units of height) at
+    `resolution` per pixel, far side at the top and the robot's left on the left.
+    The tables are in OpenCV's fixed-point format and saved as .npy files in
+    cache_dir like Rectifier's, so later runs memory-map them. Floor points the
+    camera cannot see stay black.
+    """
+
+    def __init__(self, camera_matrix, dist_coeffs, size, height, pitch=0.0, forward_range=(0.2, 3.0),
+                 left_range=(-1.5, 1.5), resolution=0.01, cache_dir=BIRDSEYE_CACHE_DIR):
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        self.dist_coeffs = np.zeros(5) if dist_coeffs is None else np.asarray(dist_coeffs, dtype=np.float64)
+        self.size = tuple(int(v) for v in size)  # Camera image (width, height)
+        self.height = height
+        self.pitch = pitch
+        self.forward_range = forward_range
+        self.left_range = left_range
+        self.resolution = resolution
+        self.view_size = (int(round((left_range[1] - left_range[0]) / resolution)),
+                          int(round((forward_range[1] - forward_range[0]) / resolution)))
+        self.rvec, self.tvec = camera_pose(height, pitch)
+        self.rotation = cv2.Rodrigues(self.rvec)[0]
+        # Normalized extent of the image; floor points beyond it are out of view
+        width, height_px = self.size
+        corners = np.array([[0, 0], [width - 1, 0], [0, height_px - 1], [width - 1, height_px - 1]], dtype=np.float32)
+        self.limit = np.abs(cv2.undistortPoints(corners.reshape(-1, 1, 2), self.camera_matrix,
+                                                self.dist_coeffs).reshape(-1, 2)).max(axis=0) * 1.05
+        self.cache_dir = cache_dir
+        digest = hashlib.sha1()
+        digest.update(self.camera_matrix.tobytes())
+        digest.update(self.dist_coeffs.tobytes())
+        digest.update(np.array([*self.size, height, pitch, *forward_range, *left_range, resolution]).tobytes())
+        self.key = digest.hexdigest()[:16]
+        self._maps = None
+
+    def _paths(self):
+        base = os.path.join(self.cache_dir, f"{self.key}_{self.view_size[0]}x{self.view_size[1]}")
+        return base + "_map1.npy", base + "_map2.npy"
+
+    @property
+    def maps(self):
+        """The (map1, map2) remap tables, loaded from the cache or built on first use."""
+        if self._maps is None:
+            self._maps = self._load() or self._build()
+        return self._maps
+
+    def _load(self):
+        if self.cache_dir is None:
+            return None
+        path1, path2 = self._paths()
+        if not (os.path.exists(path1) and os.path.exists(path2)):
+            return None
+        return np.load(path1, mmap_mode="r"), np.load(path2, mmap_mode="r")
+
+    def _build(self):
+        cols, rows = self.view_size
+        forward, left = self.to_ground(np.stack(np.meshgrid(np.arange(cols), np.arange(rows)), -1).reshape(-1, 2)).T
+        floor = np.stack([forward, left, np.zeros_like(forward)], -1)
+        pixels = self._project(floor)
+        map_x = pixels[:, 0].reshape(rows, cols).astype(np.float32)
+        map_y = pixels[:, 1].reshape(rows, cols).astype(np.float32)
+        maps = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for path, table in zip(self._paths(), maps):
+                np.save(path + ".tmp.npy", table)
+                os.replace(path + ".tmp.npy", path)
+        return maps
+
+    def _project(self, floor):
+        # Points behind the camera or outside its field of view map off-image (-1), so
+        # the distortion polynomial cannot fold far-off points back into the frame
+        camera = floor @ self.rotation.T + self.tvec
+        with np.errstate(divide="ignore", invalid="ignore"):
+            normalized = camera[:, :2] / camera[:, 2:]
+        visible = (camera[:, 2] > 1e-6) & np.all(np.abs(normalized) <= self.limit, axis=1)
+        pixels = np.full((len(floor), 2), -1.0)
+        if visible.any():
+            projected, _ = cv2.projectPoints(floor[visible], self.rvec, self.tvec, self.camera_matrix,
+                                             self.dist_coeffs)
+            pixels[visible] = projected.reshape(-1, 2)
+        return pixels
+
+    def warp(self, image, dst=None, interpolation=cv2.INTER_NEAREST):
+        """Return the bird's-eye view of a camera image, written into dst when given."""
+        map1, map2 = self.maps
+        return cv2.remap(image, map1, map2, interpolation, dst=dst)
+
+    def to_ground(self, points):
+        """Bird's-eye pixel (x, y) -> floor (forward, left), for an (N, 2) array."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        forward = self.forward_range[1] - (points[:, 1] + 0.5) * self.resolution
+        left = self.left_range[1] - (points[:, 0] + 0.5) * self.resolution
+        return np.stack([forward, left], -1)
+
+    def to_image(self, ground):
+        """Floor (forward, left) -> camera pixel, for an (N, 2) array; (-1, -1) where not visible."""
+        ground = np.asarray(ground, dtype=np.float64).reshape(-1, 2)
+        return self._project(np.concatenate([ground, np.zeros((len(ground), 1))], axis=1))
+
+
+class FieldLineDetector:
+    """White field lines as straight segments, found on a decimated frame.
+
+    One table gather turns the decimated BGR frame into the bright-and-not-green
+    mask (friedgedetection.py's five passes). With a camera height, the mask is
+    remapped to a bird's-eye view of the floor, where lines keep their straight
+    shape and true proportions whatever the perspective and lens distortion,
+    and HoughLinesP finds them there in floor units; their ends are projected
+    back into the image for drawing. Without one, HoughLinesP runs on the mask
+    itself. Hough sees only the mask's outline, and segments closer than
+    line_width to each other are merged, so a painted line gives one segment
+    rather than one per edge. min_length, max_gap and
+    line_width are in full-resolution pixels, or in floor units with a
+    bird's-eye view.
+    """
+
+    def __init__(self, size, camera_matrix=None, dist_coeffs=None, decimate=2, brightness=200, height=None,
+                 pitch=0.0, min_length=None, max_gap=None, line_width=None, votes=None, birdseye_options=None):
+        self.size = tuple(int(v) for v in size)
+        self.decimate = decimate
+        self.lut = get_line_lut(brightness=brightness)
+        width, height_px = self.size
+        self.small_size = (width // decimate, height_px // decimate)
+        self.small = None
+        self.mask = np.empty(self.small_size[::-1], dtype=np.uint8)
+        self.edges = np.empty_like(self.mask)
+        self.birdseye = None
+        if height is not None:
+            # Intrinsics of the decimated image: pixel centers scale about the corner
+            scaled = np.array(camera_matrix, dtype=np.float64)
+            scaled[0, 0] /= decimate
+            scaled[1, 1] /= decimate
+            scaled[0, 2] = (scaled[0, 2] + 0.5) / decimate - 0.5
+            scaled[1, 2] = (scaled[1, 2] + 0.5) / decimate - 0.5
+            self.birdseye = BirdsEye(scaled, dist_coeffs, self.small_size, height, pitch, **(birdseye_options or {}))
+            self.top = np.empty(self.birdseye.view_size[::-1], dtype=np.uint8)
+            self.edges = np.empty_like(self.top)
+            scale = self.birdseye.resolution
+            min_length, max_gap, line_width = min_length or 0.3, max_gap or 0.05, line_width or 0.08
+        else:
+            scale = decimate
+            min_length, max_gap, line_width = min_length or 40, max_gap or 10, line_width or 8
+        self.hough = dict(rho=1, theta=np.pi / 180, threshold=votes or 30,
+                          minLineLength=min_length / scale, maxLineGap=max_gap / scale)
+        self.merge = dict(distance_tolerance=line_width, max_gap=max_gap)
+
+    @classmethod
+    def from_calibration(cls, size, decimate=2, height=None, pitch=None, **kwargs):
+        """Detector using the calibration on disk and CAMERA_HEIGHT / CAMERA_PITCH_DEG for the mounting."""
+        from geometry import load_intrinsics
+
+        if height is None and os.environ.get("CAMERA_HEIGHT"):
+            height = float(os.environ["CAMERA_HEIGHT"])
+        if pitch is None:
+            pitch = math.radians(float(os.environ.get("CAMERA_PITCH_DEG", "0")))
+        camera_matrix, dist_coeffs, _ = load_intrinsics(size)
+        return cls(size, camera_matrix, dist_coeffs, decimate, height=height, pitch=pitch, **kwargs)
+
+    @timed("field_lines")
+    def detect(self, frame):
+        """Return the FieldLines of one BGR frame, or of one already at 1 / decimate size (a pyramid level)."""
+        frame_size = frame.shape[1::-1]
+        if frame_size == self.small_size:
+            self.small = frame
+        elif frame_size == self.size:
+            self.small = cv2.resize(frame, self.small_size, dst=self.small, interpolation=cv2.INTER_NEAREST)
+        else:
+            # The buffers, the line scale and the bird's-eye maps are all built for one resolution
+            raise ValueError(f"FieldLineDetector was built for {self.size[0]}x{self.size[1]} frames, "
+                             f"got {frame_size[0]}x{frame_size[1]}; create one detector per frame size.")
+        segment_bgr(self.small, self.lut, out=self.mask)
+
+        if self.birdseye is None:
+            # Hough on the outline: thick near lines would otherwise give a fan of segments each
+            cv2.Canny(self.mask, 50, 150, edges=self.edges)
+            lines = cv2.HoughLinesP(self.edges, **self.hough)
+            if lines is None:
+                return FieldLines(np.empty((0, 4), dtype=np.float32), None, self.mask)
+            segments = (lines.reshape(-1, 4).astype(np.float32) + 0.5) * self.decimate - 0.5
+            return FieldLines(merge_segments(segments, **self.merge), None, self.mask)
+
+        self.birdseye.warp(self.mask, dst=self.top)
+        cv2.Canny(self.top, 50, 150, edges=self.edges)
+        lines = cv2.HoughLinesP(self.edges, **self.hough)
+        if lines is None:
+            empty = np.empty((0, 4), dtype=np.float32)
+            return FieldLines(empty, empty.copy(), self.mask)
+        ground = merge_segments(self.birdseye.to_ground(lines.reshape(-1, 2)).reshape(-1, 4), **self.merge)
+        ends = self.birdseye.to_image(ground.reshape(-1, 2))
+        segments = ((ends + 0.5) * self.decimate - 0.5).reshape(-1, 4).astype(np.float32)
+        return FieldLines(segments, ground, self.mask)
+
+
+def draw_lines(frame, lines, color=(0, 0, 255), thickness=2):
+    """Draw the segments of a FieldLines result on a frame."""
+    for x1, y1, x2, y2 in lines.segments:
+        cv2.line(frame, (int(round(x1)), int(round(y1))), (int(round(x2)), int(round(y2))), color, thickness)
+    return frame
+
+
+def contour_lines(frame, brightness=200, min_area=50):
+    """The original friedgedetection.py pass sequence, kept for comparison."""
+    frame = cv2.resize(frame, (640, 480))
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    green_mask = cv2.inRange(hsv, COLOR_CLASSES["green"][0][0], COLOR_CLASSES["green"][0][1])
+    non_green_mask = cv2.bitwise_not(green_mask)
+    white_line = cv2.bitwise_and(frame, frame, mask=non_green_mask)
+    gray = cv2.cvtColor(white_line, cv2.COLOR_BGR2GRAY)
+    _, threshold = cv2.threshold(gray, brightness, 255, cv2.THRESH_BINARY)
+    contours, _ = cv2.findContours(threshold, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return [contour for contour in contours if cv2.contourArea(contour) > min_area]
+
+
+def benchmark(source, decimate=2, repeat=3):
+    """Compare the contour pipeline with the line detector on recorded footage, printing ms/frame."""
+    from capture import open_source
+
+    cap = open_source(source)
+    frames = []
+    while True:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        print("Error: No frames read from", source)
+        return None
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            contour_lines(frame)
+    contour_time = (time.perf_counter() - start) / (repeat * len(frames))
+
+    detector = FieldLineDetector.from_calibration(frames[0].shape[1::-1], decimate)
+    if detector.birdseye is not None:
+        detector.birdseye.maps
+    start = time.perf_counter()
+    count = 0
+    for _ in range(repeat):
+        for frame in frames:
+            count += len(detector.detect(frame).segments)
+    line_time = (time.perf_counter() - start) / (repeat * len(frames))
+
+    print(f"Frames: {len(frames)}")
+    print(f"Contours (5 passes, 640x480): {contour_time * 1000:.2f} ms/frame")
+    view = "bird's-eye" if detector.birdseye is not None else "image"
+    print(f"Line segments (1/{decimate} resolution, {view}): {line_time * 1000:.2f} ms/frame, "
+          f"{count / (repeat * len(frames)):.1f} segments/frame")
+    if line_time > 0:
+        print(f"Speedup: {contour_time / line_time:.1f}x")
+    return {"contour_ms": contour_time * 1000, "line_ms": line_time * 1000}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python fieldlines.py <video file or image directory>")
+        sys.exit(1)
+    benchmark(sys.argv[1])
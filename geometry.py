@@ -0,0 +1,200 @@
+import functools
+import math
+import os
+import time
+
+import cv2
+import numpy as np
+
+# Focal length used when no calibration file exists (the old hard-coded guesses were 1000-1080)
+DEFAULT_FOCAL = 1000
+
+# Iterations for undistorting the table grid; OpenCV's default 5 is off by a fraction of a pixel at the edges
+UNDISTORT_CRITERIA = (cv2.TERM_CRITERIA_COUNT | cv2.TERM_CRITERIA_EPS, 20, 1e-7)
+
+
+def load_intrinsics(size, focal=DEFAULT_FOCAL, path=None):
+    """(camera matrix, distortion, calibrated) for frames of size, from the calibration on disk or nominal.
+
+    A calibration made at another resolution is scaled to size; one with a
+    different aspect ratio raises ValueError.
+    """
+    from rectify import load_calibration
+
+    try:
+        camera_matrix, dist_coeffs = load_calibration(path, size)
+        return camera_matrix, dist_coeffs, True
+    except (FileNotFoundError, ImportError):
+        width, height = size
+        camera_matrix = np.array([[focal, 0, (width - 1) / 2], [0, focal, (height - 1) / 2], [0, 0, 1]],
+                                 dtype=np.float64)
+        return camera_matrix, np.zeros(5), False
+
+
+class CameraGeometry:
+    """Per-pixel lookup tables turning image measurements into distances.
+
+    range_scale[y, x] turns apparent size into distance: a ball of diameter S
+    that appears d pixels across at (x, y) (the mean of its outline's axes, as a
+    circle fit measures) is S * range_scale[y, x] / d away along its line of
+    sight. At the center this is the pinhole S * f / d. Off center, a ball's
+    outline is stretched along the radial direction, and lens distortion changes
+    the local focal length differently along and across that direction. Both are
+    folded into the table, where the pinhole formula would come out short by up
+    to tens of percent in the corners.
+
+    With height set (lens height above the floor, pitch tilting the camera down
+    in radians), ground_range and ground_bearing give the floor point seen at
+    each pixel, from the point below the camera: bearing is positive to the
+    left, and both are NaN above the horizon.
+
+    The rays are undistorted on a grid every `step` pixels and the tables
+    interpolated to full resolution, once per camera.
+    """
+
+    def __init__(self, camera_matrix, dist_coeffs, size, height=None, pitch=0.0, step=4, calibrated=True):
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        self.dist_coeffs = np.zeros(5) if dist_coeffs is None else np.asarray(dist_coeffs, dtype=np.float64)
+        self.size = tuple(int(v) for v in size)
+        self.height = height
+        self.pitch = pitch
+        self.step = step
+        self.calibrated = calibrated
+        width, height_px = self.size
+
+        # Sample rays at the pixel positions cv2.resize interpolates between
+        cols, rows = -(-width // step), -(-height_px // step)
+        xs = np.arange(cols, dtype=np.float32) * step + (step - 1) / 2
+        ys = np.arange(rows, dtype=np.float32) * step + (step - 1) / 2
+        grid = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 1, 2)
+        normalized = cv2.undistortPoints(grid, self.camera_matrix, self.dist_coeffs, criteria=UNDISTORT_CRITERIA)
+        normalized = normalized.reshape(rows, cols, 2).astype(np.float64)
+        nx, ny = normalized[..., 0], normalized[..., 1]
+
+        # Pixels per normalized unit along and across the radial direction, from
+        # the inverse Jacobian of the undistortion
+        dx_dv, dx_du = np.gradient(nx, step)
+        dy_dv, dy_du = np.gradient(ny, step)
+        det = dx_du * dy_dv - dx_dv * dy_du
+        radius = np.hypot(nx, ny)
+        radial_x = np.where(radius > 1e-12, nx / np.maximum(radius, 1e-12), 1.0)
+        radial_y = np.where(radius > 1e-12, ny / np.maximum(radius, 1e-12), 0.0)
+        radial_focal = np.hypot(dy_dv * radial_x - dx_dv * radial_y, dx_du * radial_y - dy_du * radial_x)
+        tangential_focal = np.hypot(dy_dv * radial_y + dx_dv * radial_x, dx_du * radial_x + dy_du * radial_y)
+        radial_focal /= np.abs(det)
+        tangential_focal /= np.abs(det)
+        # A ball's outline spans 1 / cos across the radius and 1 / cos^2 along it (cos = 1 / secant)
+        secant = np.sqrt(1 + radius ** 2)
+        self.range_scale = self._expand((tangential_focal * secant + radial_focal * secant ** 2) / 2)
+        self.center_scale = math.sqrt(self.camera_matrix[0, 0] * self.camera_matrix[1, 1])
+
+        self.ground_range = self.ground_bearing = None
+        if height is not None:
+            # Camera axes in the robot frame (forward, left, up)
+            cp, sp = math.cos(pitch), math.sin(pitch)
+            rays = (nx[..., None] * np.array([0, -1, 0]) + ny[..., None] * np.array([-sp, 0, -cp])
+                    + np.array([cp, 0, -sp]))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t = np.where(rays[..., 2] < 0, -height / rays[..., 2], np.nan)
+            ahead, left = t * rays[..., 0], t * rays[..., 1]
+            self.ground_range = self._expand(np.hypot(ahead, left))
+            self.ground_bearing = self._expand(np.arctan2(left, ahead))
+
+    def _expand(self, table):
+        width, height = self.size
+        full = cv2.resize(table.astype(np.float32), (table.shape[1] * self.step, table.shape[0] * self.step),
+                          interpolation=cv2.INTER_LINEAR)
+        return np.ascontiguousarray(full[:height, :width])
+
+    def _index(self, x, y):
+        width, height = self.size
+        col = np.clip(np.asarray(x, dtype=np.float64) + 0.5, 0, width - 1).astype(np.intp)
+        row = np.clip(np.asarray(y, dtype=np.float64) + 0.5, 0, height - 1).astype(np.intp)
+        return row, col
+
+    def distance(self, real_size, pixel_size, x=None, y=None):
+        """Distance to an object of real_size appearing pixel_size across at (x, y); 0 for empty sizes.
+
+        Works on scalars or arrays. Without a position, the optical center is assumed.
+        """
+        scale = self.center_scale if x is None else self.range_scale[self._index(x, y)]
+        pixel_size = np.asarray(pixel_size, dtype=np.float64)
+        with np.errstate(divide="ignore"):
+            distance = np.where(pixel_size > 0, real_size * scale / pixel_size, 0.0)
+        return float(distance) if distance.ndim == 0 else distance
+
+    def ground(self, x, y):
+        """(range, bearing) of the floor point at pixel (x, y), NaN above the horizon."""
+        if self.ground_range is None:
+            raise ValueError("Ground tables need the camera height")
+        index = self._index(x, y)
+        range_, bearing = self.ground_range[index], self.ground_bearing[index]
+        if np.ndim(range_) == 0:
+            return float(range_), float(bearing)
+        return range_, bearing
+
+
+@functools.lru_cache(maxsize=None)
+def geometry_for(size, focal=DEFAULT_FOCAL, height=None, pitch=None):
+    """Shared CameraGeometry for a frame size, built on first use from the calibration on disk.
+
+    The camera mounting defaults to CAMERA_HEIGHT (lens height above the floor,
+    no ground tables if unset) and CAMERA_PITCH_DEG (downward tilt).
+    """
+    size = tuple(int(v) for v in size)
+    if height is None and os.environ.get("CAMERA_HEIGHT"):
+        height = float(os.environ["CAMERA_HEIGHT"])
+    if pitch is None:
+        pitch = math.radians(float(os.environ.get("CAMERA_PITCH_DEG", "0")))
+    camera_matrix, dist_coeffs, calibrated = load_intrinsics(size, focal)
+    return CameraGeometry(camera_matrix, dist_coeffs, size, height, pitch, calibrated=calibrated)
+
+
+def check(size=(1280, 720), focal=900.0, distortion=(-0.3, 0.1, 0.0, 0.0, 0.0), real_size=4.0, distance=100.0):
+    """Compare the pinhole formula with the tables on synthetic balls spread across the image.
+
+    Each ball is placed at a known distance along a pixel's ray; its outline (the
+    cone of rays grazing it) is projected through the distorted camera and its
+    apparent size taken as the mean axis of an ellipse fit.
+    """
+    width, height = size
+    camera_matrix = np.array([[focal, 0, (width - 1) / 2], [0, focal, (height - 1) / 2], [0, 0, 1]])
+    dist_coeffs = np.array(distortion, dtype=np.float64)
+    start = time.perf_counter()
+    geometry = CameraGeometry(camera_matrix, dist_coeffs, size)
+    build_time = time.perf_counter() - start
+
+    xs, ys = np.meshgrid(np.linspace(40, width - 40, 15), np.linspace(40, height - 40, 9))
+    xs, ys = xs.ravel(), ys.ravel()
+    pixels = np.stack([xs, ys], -1).reshape(-1, 1, 2)
+    rays = cv2.undistortPoints(pixels, camera_matrix, dist_coeffs, criteria=UNDISTORT_CRITERIA).reshape(-1, 2)
+    rays = np.concatenate([rays, np.ones((len(rays), 1))], axis=1)
+    rays /= np.linalg.norm(rays, axis=1, keepdims=True)
+    half_angle = math.asin(real_size / 2 / distance)
+    angles = np.linspace(0, 2 * np.pi, 180, endpoint=False)
+    pixel_size = np.empty(len(rays))
+    for i, ray in enumerate(rays):
+        across = np.cross(ray, [0.0, 0.0, 1.0])
+        across = across / np.linalg.norm(across) if np.linalg.norm(across) > 1e-9 else np.array([1.0, 0.0, 0.0])
+        outline = math.cos(half_angle) * ray + math.sin(half_angle) * (
+            np.cos(angles)[:, None] * across + np.sin(angles)[:, None] * np.cross(ray, across))
+        projected, _ = cv2.projectPoints(outline * distance, np.zeros(3), np.zeros(3), camera_matrix, dist_coeffs)
+        _, axes, _ = cv2.fitEllipse(projected.reshape(-1, 2).astype(np.float32))
+        pixel_size[i] = sum(axes) / 2
+
+    pinhole = real_size * focal / pixel_size
+    start = time.perf_counter()
+    tables = geometry.distance(real_size, pixel_size, xs, ys)
+    lookup_time = (time.perf_counter() - start) / len(pixel_size)
+
+    pinhole_error = np.abs(pinhole - distance) / distance * 100
+    table_error = np.abs(tables - distance) / distance * 100
+    print(f"Tables for {width}x{height} built in {build_time * 1000:.1f} ms")
+    print(f"Pinhole formula: median error {np.median(pinhole_error):.2f}%, max {pinhole_error.max():.2f}%")
+    print(f"Lookup tables:   median error {np.median(table_error):.2f}%, max {table_error.max():.2f}%")
+    print(f"Lookup: {lookup_time * 1e6:.2f} us/object (vectorized)")
+    return {"pinhole_max": float(pinhole_error.max()), "table_max": float(table_error.max())}
+
+
+if __name__ == "__main__":
+    check()
@@ -1,17 +1,26 @@
 import cv2
-import apriltag
 import numpy as np
+from geometry import geometry_for, load_intrinsics
+from localization import make_localizer
+from pipeline import Pipeline
+from stages import build_stages
+from tagtracker import estimate_pose
 
 # Define the real-world size of the AprilTag marker (in meters)
 MARKER_SIZE = 0.05  # Example: 5 cm
 
-# Camera intrinsic parameters (replace with your calibration values)
-CAMERA_MATRIX = np.array([[1000, 0, 640],
-                          [0, 1000, 360],
-                          [0, 0, 1]], dtype=np.float32)
-DIST_COEFFS = np.zeros((4, 1))  # Assume no distortion for simplicity
+def load_camera(frame_size):
+    """
+    Camera intrinsics from calibration.yaml / camera_calibration.npz scaled to the frame size,
+    and a field localizer (None without a field map and a real calibration).
+    """
+    camera_matrix, dist_coeffs, calibrated = load_intrinsics(frame_size)
+    if not calibrated:
+        print("No camera calibration found, using nominal intrinsics")
+    # Tags are keyed ("tag36h11", id) in the field map. Nominal intrinsics are too rough for a field pose.
+    return camera_matrix, dist_coeffs, make_localizer(frame_size)
 
-def calculate_distance(tag_size, corners):
+def calculate_distance(tag_size, corners, image_size):
     """
     Calculate the distance from the camera to the AprilTag.
     """
@@ -25,52 +34,39 @@ def calculate_distance(tag_size, corners):
     # Average size for stability
     marker_size_px = (marker_width_px + marker_height_px) / 2
 
-    # Distance calculation using the pinhole camera model
-    focal_length = CAMERA_MATRIX[0, 0]  # Focal length (fx)
-    distance = (tag_size * focal_length) / marker_size_px
+    # Per-pixel table read: accounts for where the tag is in the image and the lens distortion
+    center_x, center_y = corners.mean(axis=0)
+    distance = geometry_for(image_size).distance(tag_size, marker_size_px, center_x, center_y)
 
     return distance
 
-# Initialize video capture
-cap = cv2.VideoCapture(0)
-
-# Initialize AprilTag detector
-options = apriltag.DetectorOptions(families="tag36h11")
-detector = apriltag.Detector(options)
-
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        break
-
-    # Convert frame to grayscale
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-    # Detect AprilTags in the image
-    tags = detector.detect(gray)
-
-    for tag in tags:
-        # Extract the corners of the detected tag
-        corners = tag.corners
-        top_left, top_right, bottom_right, bottom_left = corners
-
-        # Draw the detected tag
-        corners = np.int32(corners)
-        cv2.polylines(frame, [corners], isClosed=True, color=(0, 255, 0), thickness=2)
+def tag_distance(tag_size, corners, image_size, camera_matrix, dist_coeffs):
+    """
+    Distance to the AprilTag from its pose, or from its pixel size if that fails.
+    """
+    pose = estimate_pose(corners, tag_size, camera_matrix, dist_coeffs)
+    if pose is not None:
+        return float(np.linalg.norm(pose[1]))
+    return calculate_distance(tag_size, corners, image_size)
 
-        # Calculate the distance
-        distance = calculate_distance(MARKER_SIZE, corners)
-        center_x, center_y = int(tag.center[0]), int(tag.center[1])
-        cv2.putText(frame, f"Distance: {distance:.2f}m", (center_x, center_y - 10),
+def draw_tags(frame, result):
+    """
+    Draw each tag's outline and distance, and the field position when there is one.
+    """
+    tags, robot = result
+    for _, corners, center, distance in tags:
+        cv2.polylines(frame, [np.int32(np.round(corners))], isClosed=True, color=(0, 255, 0), thickness=2)
+        cv2.putText(frame, f"Distance: {distance:.2f}m", (int(center[0]), int(center[1]) - 10),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-
-    # Display the result
-    cv2.imshow("AprilTag Distance", frame)
-
-    # Break the loop on 'q' key press
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-
-# Release resources
-cap.release()
-cv2.destroyAllWindows()
+    if robot is not None:
+        cv2.putText(frame, f"Pose: x={robot.x:.2f} y={robot.y:.2f} heading={np.degrees(robot.heading):.0f}",
+                    (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+
+def main():
+    # The AprilTag stage searches around known tags and re-scans the whole frame periodically
+    # for new ones; the camera calibration is loaded on the first frame, at its resolution.
+    # Break the loop on 'q' key press.
+    Pipeline(build_stages(["linedetect"])).run(0, window_name="AprilTag Distance")
+
+if __name__ == "__main__":
+    main()
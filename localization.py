@@ -0,0 +1,334 @@
+import json
+import math
+import os
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from tagtracker import square_object_points
+
+# Robot position on the field (same units as the field map) and heading in radians,
+# counter-clockwise from the field's x axis; rms is the reprojection error in pixels.
+RobotPose = namedtuple("RobotPose", ["x", "y", "heading", "timestamp", "markers", "rms"])
+
+
+def wrap_angle(angle):
+    return (angle + math.pi) % (2 * math.pi) - math.pi
+
+
+def wall_rotation(facing):
+    """Marker-to-field rotation of an upright marker whose front faces the given heading (radians)."""
+    c, s = math.cos(facing), math.sin(facing)
+    # Columns: marker x (viewer's right), marker y (up), marker z (out of the marker)
+    return np.array([[-s, 0, c], [c, 0, s], [0, 1, 0]], dtype=np.float64)
+
+
+class FieldMap:
+    """Known marker positions on the field, as the field coordinates of each marker's four corners.
+
+    Field frame: x and y along the floor, z up. Keys are whatever the detectors
+    report, e.g. ArUco ids, or (family, id) to keep AprilTags apart from them.
+    """
+
+    def __init__(self, marker_size):
+        self.marker_size = marker_size
+        self.corners = {}
+
+    def add_wall_marker(self, key, x, y, z, facing, size=None):
+        """Upright marker centered at (x, y, z), its front facing the heading `facing` in radians."""
+        model = square_object_points(self.marker_size if size is None else size).astype(np.float64)
+        self.corners[key] = model @ wall_rotation(facing).T + np.array([x, y, z], dtype=np.float64)
+        return self
+
+    @classmethod
+    def from_json(cls, path):
+        """Load {"marker_size": s, "markers": [{"id", "x", "y", "z", "facing_deg"}, ...]}."""
+        with open(path) as f:
+            data = json.load(f)
+        field = cls(data["marker_size"])
+        for marker in data["markers"]:
+            key = marker["id"] if "family" not in marker else (marker["family"], marker["id"])
+            field.add_wall_marker(key, marker["x"], marker["y"], marker["z"], math.radians(marker["facing_deg"]),
+                                  marker.get("size"))
+        return field
+
+
+def load_field_map(path=None):
+    """The FieldMap in FIELD_MAP (default field_map.json), or None when there is no such file."""
+    path = path or os.environ.get("FIELD_MAP", "field_map.json")
+    return FieldMap.from_json(path) if os.path.exists(path) else None
+
+
+def observations(detections, family=None):
+    """[(key, corners)] from MarkerTracker Markers or MarkerPoses, or TagTracker TagDetections.
+
+    With family set, keys are (family, id), as for AprilTags in a field map shared with ArUco markers.
+    """
+    found = []
+    for detection in detections:
+        marker_id = detection.tag_id if hasattr(detection, "tag_id") else detection.marker_id
+        found.append(((family, marker_id) if family else marker_id, detection.corners))
+    return found
+
+
+def camera_extrinsics(x, y, heading, height, pitch=0.0):
+    """rvec, tvec of a camera at (x, y, height) looking along heading, tilted down by pitch radians."""
+    c, s = math.cos(heading), math.sin(heading)
+    # Rows: camera x (right), camera y (down), camera z (forward) in field coordinates
+    rotation = np.array([[s, -c, 0], [0, 0, -1], [c, s, 0]], dtype=np.float64)
+    if pitch:
+        cp, sp = math.cos(pitch), math.sin(pitch)
+        rotation = np.array([[1, 0, 0], [0, cp, -sp], [0, sp, cp]]) @ rotation
+    tvec = -rotation @ np.array([x, y, height], dtype=np.float64)
+    return cv2.Rodrigues(rotation)[0], tvec.reshape(3, 1)
+
+
+class Localizer:
+    """Fuse every visible marker into one robot pose per frame and smooth it over time.
+
+    All corners of all mapped markers are stacked into one perspective-n-point
+    problem, so a frame gives a single least-squares pose whatever the marker
+    count. The previous solution seeds the iterative solver; without one, SQPnP
+    finds the global optimum. A lone marker is ambiguous, so both IPPE solutions
+    are kept and the one nearer the previous pose wins. With camera_height set,
+    each solution is refined over (x, y, heading) only, for a camera at that
+    height and pitch: this removes the flip ambiguity and most of the noise of
+    distant markers. Accepted solutions are blended into the running pose with a
+    time constant; ones with a large reprojection error are rejected. pose is a
+    plain attribute, so control code can read it for free.
+    """
+
+    def __init__(self, field_map, camera_matrix, dist_coeffs=None, camera_height=None, camera_pitch=0.0,
+                 smoothing_time=0.15, max_rms=3.0, camera_offset=(0.0, 0.0)):
+        self.field = field_map
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        self.dist_coeffs = np.zeros(5) if dist_coeffs is None else np.asarray(dist_coeffs, dtype=np.float64)
+        self.camera_height = camera_height  # Lens height above the floor; None solves all six degrees of freedom
+        self.camera_pitch = camera_pitch  # Downward tilt in radians, used with camera_height
+        self.smoothing_time = smoothing_time  # Seconds; 0 disables smoothing
+        self.max_rms = max_rms
+        self.camera_offset = camera_offset  # Camera position in the robot frame (forward, left)
+        self.pose = None
+        self.rvec = None
+        self.tvec = None
+        self.rejected = 0
+
+    def _candidates(self, world, image, single):
+        if single:
+            count, rvecs, tvecs, _ = cv2.solvePnPGeneric(world, image, self.camera_matrix, self.dist_coeffs,
+                                                         flags=cv2.SOLVEPNP_IPPE)
+            return list(zip(rvecs, tvecs))[:count]
+        if self.rvec is not None:
+            ok, rvec, tvec = cv2.solvePnP(world, image, self.camera_matrix, self.dist_coeffs,
+                                          self.rvec.copy(), self.tvec.copy(), True, flags=cv2.SOLVEPNP_ITERATIVE)
+        else:
+            ok, rvec, tvec = cv2.solvePnP(world, image, self.camera_matrix, self.dist_coeffs,
+                                          flags=cv2.SOLVEPNP_SQPNP)
+        return [(rvec, tvec)] if ok else []
+
+    def _residuals(self, world, image, rvec, tvec):
+        projected, _ = cv2.projectPoints(world, rvec, tvec, self.camera_matrix, self.dist_coeffs)
+        return (projected.reshape(-1, 2) - image).ravel()
+
+    def _refine_planar(self, world, image, params, iterations=10):
+        # Gauss-Newton over (x, y, heading) with a numeric Jacobian: three parameters, a few dozen residuals
+        def residuals(p):
+            return self._residuals(world, image, *camera_extrinsics(p[0], p[1], p[2], self.camera_height,
+                                                                    self.camera_pitch))
+        params = np.array(params, dtype=np.float64)
+        steps = np.array([1e-4, 1e-4, 1e-5])
+        jacobian = np.empty((len(image) * 2, 3))
+        for _ in range(iterations):
+            current = residuals(params)
+            for i in range(3):
+                shifted = params.copy()
+                shifted[i] += steps[i]
+                jacobian[:, i] = (residuals(shifted) - current) / steps[i]
+            delta = np.linalg.lstsq(jacobian, -current, rcond=None)[0]
+            params += delta
+            if np.abs(delta).max() < 1e-7:
+                break
+        return params, residuals(params)
+
+    def solve(self, observations):
+        """Single solve over [(key, corners (4, 2))]; returns (x, y, heading, rms, markers used) or None.
+
+        x, y and heading are those of the camera, before camera_offset is applied.
+        """
+        used = [(key, corners) for key, corners in observations if key in self.field.corners]
+        if not used:
+            return None
+        world = np.concatenate([self.field.corners[key] for key, _ in used])
+        image = np.concatenate([np.asarray(corners, dtype=np.float64).reshape(4, 2) for _, corners in used])
+        previous = None if self.tvec is None else -cv2.Rodrigues(self.rvec)[0].T @ self.tvec.ravel()
+
+        best = None
+        for rvec, tvec in self._candidates(world, image, len(used) == 1):
+            rotation = cv2.Rodrigues(rvec)[0]
+            camera = -rotation.T @ tvec.ravel()
+            heading = math.atan2(rotation[2, 1], rotation[2, 0])
+            if self.camera_height is not None:
+                (camera[0], camera[1], heading), residuals = self._refine_planar(world, image,
+                                                                                 (camera[0], camera[1], heading))
+                rvec, tvec = camera_extrinsics(camera[0], camera[1], heading, self.camera_height, self.camera_pitch)
+                camera[2] = self.camera_height
+            else:
+                residuals = self._residuals(world, image, rvec, tvec)
+            rms = float(np.sqrt(np.mean(residuals ** 2) * 2))
+            # Prefer the smaller error; among a lone marker's unconstrained pair, the one nearer the last pose
+            score = rms if previous is None or self.camera_height is not None else np.linalg.norm(camera - previous)
+            if best is None or score < best[0]:
+                best = (score, rvec, tvec, camera[0], camera[1], heading, rms)
+        if best is None:
+            return None
+        _, self.rvec, self.tvec, x, y, heading, rms = best
+        return x, y, heading, rms, len(used)
+
+    def update(self, observations, timestamp=None):
+        """Fold one frame's [(key, corners)] into the pose estimate and return the current RobotPose."""
+        timestamp = time.perf_counter() if timestamp is None else timestamp
+        rvec, tvec = self.rvec, self.tvec
+        solution = self.solve(observations)
+        if solution is None:
+            return self.pose
+        x, y, heading, rms, count = solution
+        if rms > self.max_rms:
+            # Keep seeding the solver from the last accepted solution
+            self.rvec, self.tvec = rvec, tvec
+            self.rejected += 1
+            return self.pose
+        forward, left = self.camera_offset
+        x = x - forward * math.cos(heading) + left * math.sin(heading)
+        y = y - forward * math.sin(heading) - left * math.cos(heading)
+
+        previous = self.pose
+        if previous is not None and self.smoothing_time > 0:
+            alpha = 1.0 - math.exp(-max(timestamp - previous.timestamp, 0.0) / self.smoothing_time)
+            x = previous.x + alpha * (x - previous.x)
+            y = previous.y + alpha * (y - previous.y)
+            heading = wrap_angle(previous.heading + alpha * wrap_angle(heading - previous.heading))
+        self.pose = RobotPose(float(x), float(y), float(heading), timestamp, count, rms)
+        return self.pose
+
+
+def make_localizer(size=None, **kwargs):
+    """A Localizer for the field map and camera calibration on disk, or None when either is missing.
+
+    size (width, height) of the frames scales the calibration to their resolution.
+    """
+    from rectify import load_calibration
+
+    field_map = load_field_map()
+    if field_map is None:
+        return None
+    try:
+        camera_matrix, dist_coeffs = load_calibration(size=size)
+    except (FileNotFoundError, ImportError):
+        print("Field map found but no camera calibration; localization disabled")
+        return None
+    return Localizer(field_map, camera_matrix, dist_coeffs, **kwargs)
+
+
+def render_markers(field_map, camera_matrix, size, x, y, heading, height, pitch=0.0,
+                   dictionary=cv2.aruco.DICT_6X6_250, background=128, marker_pixels=120):
+    """Synthetic camera view of the field's markers from a known pose, for checking the localizer.
+
+    Returns the BGR image and the true [(key, corners)] of every marker fully in view.
+    Keys must be ids of the given dictionary.
+    """
+    width, height_px = size
+    image = np.full((height_px, width), background, dtype=np.uint8)
+    rvec, tvec = camera_extrinsics(x, y, heading, height, pitch)
+    rotation = cv2.Rodrigues(rvec)[0]
+    aruco_dictionary = cv2.aruco.getPredefinedDictionary(dictionary)
+    border = marker_pixels // 6
+    visible = []
+    for key, corners in field_map.corners.items():
+        depth = (corners @ rotation.T + tvec.ravel())[:, 2]
+        if np.any(depth <= 0.05):
+            continue
+        # Pad each marker with a white quiet zone, then warp it into the view
+        center = corners.mean(axis=0)
+        padded = center + (corners - center) * (marker_pixels + 2 * border) / marker_pixels
+        quad, _ = cv2.projectPoints(padded, rvec, tvec, camera_matrix, None)
+        inner, _ = cv2.projectPoints(corners, rvec, tvec, camera_matrix, None)
+        inner = inner.reshape(4, 2)
+        if np.any(inner < 0) or np.any(inner[:, 0] >= width) or np.any(inner[:, 1] >= height_px):
+            continue
+        marker = cv2.aruco.generateImageMarker(aruco_dictionary, key, marker_pixels)
+        marker = cv2.copyMakeBorder(marker, border, border, border, border, cv2.BORDER_CONSTANT, value=255)
+        side = marker.shape[0]
+        # Outer edges of the marker image, in the pixel-center coordinates projectPoints uses
+        source = np.float32([[0, 0], [side, 0], [side, side], [0, side]]) - 0.5
+        homography = cv2.getPerspectiveTransform(source, quad.reshape(4, 2).astype(np.float32))
+        warped = cv2.warpPerspective(marker, homography, size, flags=cv2.INTER_LINEAR)
+        mask = cv2.warpPerspective(np.full_like(marker, 255), homography, size, flags=cv2.INTER_NEAREST)
+        image[mask > 0] = warped[mask > 0]
+        visible.append((key, inner))
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR), visible
+
+
+def example_field(marker_size=0.15):
+    """A 4 x 3 m field with markers along all four walls, ids 0-13."""
+    field = FieldMap(marker_size)
+    key = 0
+    for x in (0.5, 1.5, 2.5, 3.5):
+        field.add_wall_marker(key, x, 3.0, 0.3, -math.pi / 2)  # Far wall, facing the field
+        field.add_wall_marker(key + 1, x, 0.0, 0.3, math.pi / 2)  # Near wall
+        key += 2
+    for y in (0.75, 1.5, 2.25):
+        field.add_wall_marker(key, 4.0, y, 0.3, math.pi)
+        field.add_wall_marker(key + 1, 0.0, y, 0.3, 0.0)
+        key += 2
+    return field
+
+
+def simulate(frames=60, size=(1280, 720), height=0.25, pitch=0.1):
+    """Drive a synthetic robot around the example field and report the localization error.
+
+    The same tracked markers go through a six degree of freedom solve and a solve
+    constrained to the known camera height and pitch.
+    """
+    from markertracker import MarkerTracker
+
+    field = example_field()
+    camera_matrix = np.array([[900.0, 0, size[0] / 2], [0, 900.0, size[1] / 2], [0, 0, 1]])
+    tracker = MarkerTracker()
+    truth, observed = [], []
+    for i in range(frames):
+        t = i / frames
+        x, y = 2.0 + 0.8 * math.cos(2 * math.pi * t), 1.5 + 0.6 * math.sin(2 * math.pi * t)
+        heading = 2 * math.pi * t + math.pi / 2 + 0.4 * math.sin(6 * math.pi * t)
+        frame, _ = render_markers(field, camera_matrix, size, x, y, heading, height, pitch)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        truth.append((x, y, heading))
+        observed.append([(marker.marker_id, marker.corners) for marker in tracker.update(gray)])
+
+    results = {}
+    for name, localizer in (("free", Localizer(field, camera_matrix, smoothing_time=0.0)),
+                            ("planar", Localizer(field, camera_matrix, camera_height=height, camera_pitch=pitch,
+                                                 smoothing_time=0.0))):
+        errors, headings = [], []
+        start = time.perf_counter()
+        for i, ((x, y, heading), observations) in enumerate(zip(truth, observed)):
+            pose = localizer.update(observations, timestamp=i / 30.0)
+            if pose is not None and pose.timestamp == i / 30.0:
+                errors.append(math.hypot(pose.x - x, pose.y - y))
+                headings.append(abs(wrap_angle(pose.heading - heading)))
+        solve_time = (time.perf_counter() - start) / frames
+        if not errors:
+            print(f"{name}: no poses were solved")
+            continue
+        print(f"{name:>6}: localized {len(errors)}/{frames}, "
+              f"position error median {np.median(errors) * 100:.1f} cm, max {np.max(errors) * 100:.1f} cm, "
+              f"heading error median {math.degrees(np.median(headings)):.2f} deg, "
+              f"max {math.degrees(np.max(headings)):.2f} deg, {solve_time * 1000:.2f} ms/frame")
+        results[name] = {"localized": len(errors), "median_error": float(np.median(errors)),
+                         "max_error": float(np.max(errors)), "solve_ms": solve_time * 1000}
+    return results
+
+
+if __name__ == "__main__":
+    simulate()
@@ -1,32 +1,51 @@
+# Imported first so the startup timer covers the rest of the imports
+from startup import background, lazy_import, startup
+
 import cv2
-import mediapipe as mp
+from capture import LatestFrameCapture
+
+# MediaPipe is only imported when the hand model is built, on a background thread
+mp = lazy_import("mediapipe")
+
 
-# Initialize MediaPipe Hands
-mp_hands = mp.solutions.hands
-hands = mp_hands.Hands()
-mp_drawing = mp.solutions.drawing_utils
+def create_hands():
+    return mp.solutions.hands.Hands()
+
+
+# Initialize MediaPipe Hands while the camera already runs
+hands_task = background("hands model ready", create_hands)
+hands = None
 
 # Initialize webcam
-cap = cv2.VideoCapture(0)
+cap = LatestFrameCapture(0)
+startup.mark("camera open")
 
 while cap.isOpened():
     ret, frame = cap.read()
     if not ret:
         break
 
-    # Convert the BGR image to RGB
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    if hands is None and hands_task.done:
+        hands = hands_task.result()
+        mp_hands = mp.solutions.hands
+        mp_drawing = mp.solutions.drawing_utils
+
+    if hands is not None:
+        # Convert the BGR image to RGB
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
-    # Process the frame and detect hands
-    result = hands.process(rgb_frame)
+        # Process the frame and detect hands
+        result = hands.process(rgb_frame)
 
-    # Draw hand landmarks
-    if result.multi_hand_landmarks:
-        for hand_landmarks in result.multi_hand_landmarks:
-            mp_drawing.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
+        # Draw hand landmarks
+        if result.multi_hand_landmarks:
+            for hand_landmarks in result.multi_hand_landmarks:
+                mp_drawing.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
 
     # Display the frame
     cv2.imshow('MediaPipe Hands', frame)
+    if startup.first_frame():
+        print(startup.report())
 
     # Break the loop on 'q' key press
     if cv2.waitKey(1) & 0xFF == ord('q'):
@@ -34,4 +53,5 @@ while cap.isOpened():
 
 # Release resources
 cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+cv2.destroyAllWindows()
+print(startup.report())
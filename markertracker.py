@@ -0,0 +1,228 @@
+import sys
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from profiler import timed
+from tagtracker import square_object_points
+
+# A marker found in the current frame; corners are float32 (4, 2) in ArUco order
+Marker = namedtuple("Marker", ["marker_id", "corners", "tracked"])
+
+# Pose of a marker in the camera frame, stamped with the capture time of its frame
+MarkerPose = namedtuple("MarkerPose", ["marker_id", "rvec", "tvec", "corners", "timestamp", "tracked"])
+
+
+def solve_square_poses(corners, size, camera_matrix, dist_coeffs):
+    """Poses of n square markers of one size, solved as one batch.
+
+    corners is (n, 4, 2) in the top-left, top-right, bottom-right, bottom-left
+    order. All corners are undistorted to normalized coordinates in one call,
+    then each marker goes through the IPPE square solver, which needs no
+    distortion model or intrinsics at that point. Returns rvecs and tvecs as
+    (n, 3) arrays.
+    """
+    corners = np.asarray(corners, dtype=np.float64).reshape(-1, 4, 2)
+    n = len(corners)
+    rvecs, tvecs = np.zeros((n, 3)), np.zeros((n, 3))
+    if n == 0:
+        return rvecs, tvecs
+    normalized = cv2.undistortPoints(corners.reshape(-1, 1, 2), camera_matrix, dist_coeffs).reshape(n, 4, 1, 2)
+    model = square_object_points(size)
+    identity = np.eye(3)
+    for i in range(n):
+        _, rvec, tvec = cv2.solvePnP(model, normalized[i], identity, None, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+        rvecs[i], tvecs[i] = rvec.ravel(), tvec.ravel()
+    return rvecs, tvecs
+
+
+class MarkerTracker:
+    """Follow known ArUco markers between frames with optical flow instead of re-detecting them.
+
+    All tracked corners are propagated with one pyramidal Lucas-Kanade call,
+    checked by flowing them back again, and snapped to the marker corners with
+    cornerSubPix. Each tracked quad must then still look like its marker: convex,
+    not collapsed or stretched, close to its previous area, framed by a light
+    margin, and with its bits decoding to its ID. A marker that fails is dropped
+    and triggers a full ArucoDetector pass on the next frame; full detection also
+    runs every redetect_every frames to pick up new markers.
+    """
+
+    def __init__(self, dictionary=cv2.aruco.DICT_6X6_250, redetect_every=10, max_flow_error=1.0,
+                 win_size=(21, 21), max_level=3, max_bit_errors=2, max_area_change=0.5, max_side_ratio=4.0):
+        self.dictionary = cv2.aruco.getPredefinedDictionary(dictionary)
+        self.detector = cv2.aruco.ArucoDetector(self.dictionary, cv2.aruco.DetectorParameters())
+        self.redetect_every = redetect_every
+        self.max_flow_error = max_flow_error  # Forward-backward disagreement allowed, in pixels
+        self.max_bit_errors = max_bit_errors  # Margin, border and ID bits allowed to read wrong in a tracked quad
+        self.max_area_change = max_area_change  # Relative area change allowed between frames
+        self.max_side_ratio = max_side_ratio  # Longest over shortest side
+        # Canonical view of a marker for decoding: 4 pixels per cell, with its black border
+        # and a ring of the light margin the detector needs around it
+        self.cell_px = 4
+        self.patch_size = (self.dictionary.markerSize + 4) * self.cell_px
+        first, last = self.cell_px, self.patch_size - 1 - self.cell_px
+        self.patch_corners = np.float32([[first, first], [last, first], [last, last], [first, last]])
+        self.flow_params = dict(winSize=win_size, maxLevel=max_level,
+                                criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+        self.subpix_criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 0.01)
+        self.ids = np.empty(0, dtype=np.int32)
+        self.corners = np.empty((0, 4, 2), dtype=np.float32)
+        self.previous = None
+        self.since_detection = 0
+        self.detections = 0
+        self.tracked_frames = 0
+
+    def _detect(self, gray):
+        corners, ids, _ = self.detector.detectMarkers(gray)
+        self.detections += 1
+        self.since_detection = 0
+        if ids is None:
+            self.ids = np.empty(0, dtype=np.int32)
+            self.corners = np.empty((0, 4, 2), dtype=np.float32)
+        else:
+            self.ids = np.ravel(ids).astype(np.int32)
+            self.corners = np.array(corners, dtype=np.float32).reshape(-1, 4, 2)
+        return False
+
+    def _shape_ok(self, quad, previous):
+        if not cv2.isContourConvex(quad.reshape(-1, 1, 2)):
+            return False
+        sides = np.linalg.norm(quad - np.roll(quad, -1, axis=0), axis=1)
+        if sides.min() < 4 or sides.max() > self.max_side_ratio * sides.min():
+            return False
+        area, previous_area = cv2.contourArea(quad), cv2.contourArea(previous)
+        return abs(area - previous_area) <= self.max_area_change * previous_area
+
+    def _decodes_as(self, gray, quad, marker_id):
+        transform = cv2.getPerspectiveTransform(quad, self.patch_corners)
+        patch = cv2.warpPerspective(gray, transform, (self.patch_size, self.patch_size), flags=cv2.INTER_LINEAR)
+        _, patch = cv2.threshold(patch, 0, 1, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        cells = self.dictionary.markerSize + 4
+        # Majority of the inner half of each cell, away from blurred cell edges
+        margin = self.cell_px // 4
+        grid = patch.reshape(cells, self.cell_px, cells, self.cell_px)[:, margin:self.cell_px - margin, :,
+                                                                      margin:self.cell_px - margin]
+        bits = (grid.mean(axis=(1, 3)) > 0.5).astype(np.uint8)
+        marker, inner = bits[1:-1, 1:-1], bits[2:-2, 2:-2]
+        # Margin cells must read white and border cells black; a quad slid by part of a cell misses both
+        border_errors = bits.size - marker.size - int(bits.sum() - marker.sum()) + int(marker.sum() - inner.sum())
+        if border_errors > self.max_bit_errors:
+            return False
+        inner = np.ascontiguousarray(inner)
+        return border_errors + self.dictionary.getDistanceToId(inner, int(marker_id), False) <= self.max_bit_errors
+
+    def _track(self, gray):
+        points = self.corners.reshape(-1, 1, 2)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(self.previous, gray, points, None, **self.flow_params)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.previous, moved, None, **self.flow_params)
+        error = np.linalg.norm((back - points).reshape(-1, 2), axis=1)
+        height, width = gray.shape[:2]
+        x, y = moved[:, 0, 0], moved[:, 0, 1]
+        # cornerSubPix needs its whole window inside the image
+        inside = (x >= 6) & (y >= 6) & (x < width - 6) & (y < height - 6)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (error < self.max_flow_error) & inside
+        keep = good.reshape(-1, 4).all(axis=1)
+        self.since_detection += 1
+        self.tracked_frames += 1
+        if not keep.any():
+            return self._detect(gray)
+        moved = moved.reshape(-1, 4, 2)[keep]
+        refined = cv2.cornerSubPix(gray, moved.reshape(-1, 1, 2), (5, 5), (-1, -1), self.subpix_criteria)
+        refined = refined.reshape(-1, 4, 2)
+        # Flow can slide a whole quad onto other texture; only keep quads that still are the marker
+        verified = np.array([self._shape_ok(quad, previous) and self._decodes_as(gray, quad, marker_id)
+                             for quad, previous, marker_id in zip(refined, self.corners[keep], self.ids[keep])])
+        keep[keep] = verified
+        if not keep.any():
+            return self._detect(gray)
+        self.ids = self.ids[keep]
+        self.corners = refined[verified]
+        # A lost marker may reappear elsewhere: look for it on the next frame
+        if not keep.all():
+            self.since_detection = self.redetect_every
+        return True
+
+    @timed("marker_tracker")
+    def update(self, gray):
+        """Return the markers in this frame as a list of Marker."""
+        if self.previous is None or len(self.ids) == 0 or self.since_detection >= self.redetect_every:
+            tracked = self._detect(gray)
+        else:
+            tracked = self._track(gray)
+        if self.previous is None or self.previous.shape != gray.shape:
+            self.previous = np.empty_like(gray)
+        np.copyto(self.previous, gray)
+        return [Marker(int(marker_id), quad, tracked) for marker_id, quad in zip(self.ids, self.corners)]
+
+    def update_poses(self, gray, marker_size, camera_matrix, dist_coeffs, timestamp=None):
+        """Track markers and return their MarkerPoses, all solved in one batch."""
+        timestamp = time.perf_counter() if timestamp is None else timestamp
+        markers = self.update(gray)
+        rvecs, tvecs = solve_square_poses(self.corners, marker_size, camera_matrix, dist_coeffs)
+        return [MarkerPose(marker.marker_id, rvec, tvec, marker.corners, timestamp, marker.tracked)
+                for marker, rvec, tvec in zip(markers, rvecs, tvecs)]
+
+
+def pose_stream(source, marker_size, camera_matrix, dist_coeffs, tracker=None):
+    """Yield (timestamp, [MarkerPose]) for every frame of a camera, video file or image directory."""
+    from capture import LatestFrameCapture
+
+    tracker = tracker or MarkerTracker()
+    cap = LatestFrameCapture(source)
+    gray = None
+    try:
+        while True:
+            success, frame = cap.read()
+            if not success:
+                break
+            timestamp = time.perf_counter()
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+            yield timestamp, tracker.update_poses(gray, marker_size, camera_matrix, dist_coeffs, timestamp)
+    finally:
+        cap.release()
+
+
+def benchmark(source, dictionary=cv2.aruco.DICT_6X6_250):
+    """Compare per-frame detection with the tracker on recorded footage, printing ms/frame for each."""
+    from capture import open_source
+
+    cap = open_source(source)
+    frames = []
+    while True:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    cap.release()
+    if not frames:
+        print("Error: No frames read from", source)
+        return None
+
+    detector = cv2.aruco.ArucoDetector(cv2.aruco.getPredefinedDictionary(dictionary), cv2.aruco.DetectorParameters())
+    start = time.perf_counter()
+    detected = sum(len(detector.detectMarkers(gray)[0]) for gray in frames)
+    detect_time = (time.perf_counter() - start) / len(frames)
+
+    tracker = MarkerTracker(dictionary)
+    start = time.perf_counter()
+    tracked = sum(len(tracker.update(gray)) for gray in frames)
+    track_time = (time.perf_counter() - start) / len(frames)
+
+    print(f"Frames: {len(frames)}")
+    print(f"Detection every frame: {detect_time * 1000:.2f} ms/frame, {detected} markers")
+    print(f"Tracked:               {track_time * 1000:.2f} ms/frame, {tracked} markers "
+          f"({tracker.detections} detections, {tracker.tracked_frames} tracked frames)")
+    if track_time > 0:
+        print(f"Speedup: {detect_time / track_time:.1f}x")
+    return {"frames": len(frames), "detect_ms": detect_time * 1000, "track_ms": track_time * 1000,
+            "detected": detected, "tracked": tracked}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python markertracker.py <video file or image directory>")
+        sys.exit(1)
+    benchmark(sys.argv[1])
@@ -1,5 +1,6 @@
 import cv2
 import numpy as np
+from colorsegment import segment_masks
 
 def get_hsv_ranges():
     """Define HSV ranges for red, pink, and white colors."""
@@ -20,13 +21,11 @@ def get_hsv_ranges():
 
 def create_combined_mask(img_hsv, red_ranges, pink_range, white_range):
     """Create a combined mask for red, pink, and white colors."""
-    # Combine red masks
-    red_mask = sum(cv2.inRange(img_hsv, lower, upper) for lower, upper in red_ranges)
-    # Create pink mask
-    pink_mask = cv2.inRange(img_hsv, *pink_range)
-    white_mask = cv2.inRange(img_hsv, *white_range)
+    # Classify all three colors in a single lookup-table pass over the frame
+    color_classes = {"red": red_ranges, "pink": [pink_range], "white": [white_range]}
+    masks = segment_masks(img_hsv, color_classes)
 
-    return red_mask, pink_mask, white_mask
+    return masks["red"], masks["pink"], masks["white"]
 
 def detect_and_draw_circles(video, mask, color_name):
     """Detect circles in the mask and draw them on the video frame."""
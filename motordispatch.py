@@ -0,0 +1,288 @@
+import queue
+import threading
+import time
+
+# Motor driver pins (BCM numbering): in1/in2 drive the right motor, in3/in4 the left one,
+# en carries the PWM. ENB is only separately wired on some robots (None when ENA/ENB are bridged)
+MOTOR_PINS = (24, 23, 21, 22)
+EN_PIN = 25
+ENB_PIN = None
+
+# in1, in2, in3, in4 levels for each drive command
+COMMAND_PIN_STATES = {
+    "f": (1, 0, 1, 0),
+    "fl": (1, 0, 0, 0),
+    "fr": (0, 0, 1, 0),
+    "stop": (0, 0, 0, 0),
+}
+
+
+class FakeGPIO:
+    """In-memory stand-in for RPi.GPIO that records every pin write."""
+
+    BCM = "BCM"
+    OUT = "OUT"
+    HIGH = 1
+    LOW = 0
+
+    class PWM:
+        def __init__(self, pin, frequency):
+            self.pin = pin
+            self.frequency = frequency
+            self.duty_cycles = []
+
+        def start(self, duty):
+            self.duty_cycles.append(duty)
+
+        def ChangeDutyCycle(self, duty):
+            self.duty_cycles.append(duty)
+
+        def stop(self):
+            pass
+
+    def __init__(self):
+        self.mode = None
+        self.pins = {}
+        self.writes = []
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction):
+        self.pins[pin] = self.LOW
+
+    def output(self, pin, level):
+        self.pins[pin] = level
+        self.writes.append((pin, level))
+
+    def cleanup(self):
+        self.pins.clear()
+
+
+class MotorDispatcher:
+    """Apply motor commands from a background thread, at most once per control tick.
+
+    submit() never blocks the vision loop: commands go into a bounded queue
+    (the oldest is dropped when it is full). Every tick the dispatcher drains the
+    queue, keeps only the newest command of each kind, and writes only the pins
+    whose level actually changes. Command-to-actuation latency is recorded.
+
+    Wheel duty commands drive the two enable pins independently when enb_pin is
+    wired. With a single shared enable pin, the enable pin is held fully on and
+    software PWM on the forward inputs (in1 right, in3 left) gives each wheel its
+    own duty; the next direction command returns those pins to plain levels.
+    """
+
+    def __init__(self, gpio=None, pins=MOTOR_PINS, en_pin=EN_PIN, pwm_frequency=1000,
+                 duty=50, tick=0.02, queue_size=16, enb_pin=ENB_PIN):
+        self.gpio = gpio  # RPi.GPIO is imported by setup() when None
+        self.pins = pins
+        self.en_pin = en_pin
+        self.enb_pin = enb_pin
+        self.pwm_frequency = pwm_frequency
+        self.duty = duty
+        self.requested_duty = duty  # Last set_duty(), restored when leaving wheel PWM
+        self.tick = tick
+        self.commands = queue.Queue(maxsize=queue_size)
+
+        self.pin_levels = {}
+        self.duty_b = duty
+        self.pwm = None
+        self.pwm_b = None
+        self.wheel_pwm = None  # (right, left) PWM on in1/in3 with a shared enable pin
+        self.wheel_duty = (None, None)
+        self.wheel_pwm_active = False
+        self.thread = None
+        self.running = False
+
+        self.submitted = 0
+        self.applied = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.pin_writes = 0
+        self.skipped_writes = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    def setup(self):
+        """Configure the pins, drive them low and start the PWM."""
+        if self.gpio is None:
+            import RPi.GPIO
+            self.gpio = RPi.GPIO
+        gpio = self.gpio
+        gpio.setmode(gpio.BCM)
+        for pin in self.pins:
+            gpio.setup(pin, gpio.OUT)
+        gpio.setup(self.en_pin, gpio.OUT)
+        for pin in self.pins:
+            gpio.output(pin, gpio.LOW)
+            self.pin_levels[pin] = 0
+        self.pwm = gpio.PWM(self.en_pin, self.pwm_frequency)
+        self.pwm.start(self.duty)
+        if self.enb_pin is not None:
+            gpio.setup(self.enb_pin, gpio.OUT)
+            self.pwm_b = gpio.PWM(self.enb_pin, self.pwm_frequency)
+            self.pwm_b.start(self.duty_b)
+
+    def start(self):
+        """Set up the hardware and start the dispatch thread."""
+        if self.running:
+            return self
+        self.setup()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="MotorDispatcher", daemon=True)
+        self.thread.start()
+        return self
+
+    def _put(self, kind, value):
+        item = (kind, value, time.perf_counter())
+        self.submitted += 1
+        while True:
+            try:
+                self.commands.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.commands.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def submit(self, command):
+        """Queue a drive command ("f", "fl", "fr" or "stop") without blocking."""
+        if command not in COMMAND_PIN_STATES:
+            raise ValueError(f"Unknown motor command: {command!r}")
+        self._put("direction", command)
+
+    def set_duty(self, duty):
+        """Queue a new PWM duty cycle (0-100) without blocking."""
+        self._put("duty", max(0.0, min(100.0, float(duty))))
+
+    def set_wheel_duty(self, left, right):
+        """Queue forward drive with separate left and right duty cycles (0-100) without blocking."""
+        self._put("wheels", (max(0.0, min(100.0, float(left))), max(0.0, min(100.0, float(right)))))
+
+    def _drain(self):
+        latest = {}
+        while True:
+            try:
+                kind, value, stamp = self.commands.get_nowait()
+            except queue.Empty:
+                return latest
+            if kind in latest:
+                self.coalesced += 1
+            latest[kind] = (value, stamp)
+
+    def _run(self):
+        next_tick = time.perf_counter()
+        while self.running:
+            next_tick += self.tick
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()
+            # Apply the surviving commands in submission order so the newest one wins
+            latest = sorted(self._drain().items(), key=lambda item: item[1][1])
+            for kind, (value, stamp) in latest:
+                self.apply(kind, value, stamp)
+
+    def _write_direction(self, command):
+        if self.wheel_pwm_active:
+            self._stop_wheel_pwm()
+        gpio = self.gpio
+        for pin, level in zip(self.pins, COMMAND_PIN_STATES[command]):
+            if self.pin_levels.get(pin) == level:
+                self.skipped_writes += 1
+                continue
+            gpio.output(pin, gpio.HIGH if level else gpio.LOW)
+            self.pin_levels[pin] = level
+            self.pin_writes += 1
+
+    def _write_duty(self, duty, duty_b=None):
+        if duty != self.duty:
+            self.pwm.ChangeDutyCycle(duty)
+            self.duty = duty
+        if duty_b is not None and self.pwm_b is not None and duty_b != self.duty_b:
+            self.pwm_b.ChangeDutyCycle(duty_b)
+            self.duty_b = duty_b
+
+    def _start_wheel_pwm(self):
+        # Reverse inputs low, forward inputs handed over to PWM, enable fully on
+        self._write_direction("stop")
+        in1, _, in3, _ = self.pins
+        if self.wheel_pwm is None:
+            self.wheel_pwm = (self.gpio.PWM(in1, self.pwm_frequency), self.gpio.PWM(in3, self.pwm_frequency))
+        for pwm in self.wheel_pwm:
+            pwm.start(0)
+        self.wheel_duty = (0, 0)
+        self.pin_levels.pop(in1, None)
+        self.pin_levels.pop(in3, None)
+        self.wheel_pwm_active = True
+        self._write_duty(100)
+
+    def _stop_wheel_pwm(self):
+        for pwm in self.wheel_pwm:
+            pwm.stop()
+        self.wheel_pwm_active = False
+        self._write_duty(self.requested_duty)
+
+    def _write_wheels(self, left, right):
+        if self.pwm_b is not None:
+            self._write_direction("f")
+            # ENA drives the right motor (in1/in2), ENB the left one (in3/in4)
+            self._write_duty(right, left)
+            return
+        if not self.wheel_pwm_active:
+            self._start_wheel_pwm()
+        for pwm, duty, current in zip(self.wheel_pwm, (right, left), self.wheel_duty):
+            if duty != current:
+                pwm.ChangeDutyCycle(duty)
+        self.wheel_duty = (right, left)
+
+    def apply(self, kind, value, stamp=None):
+        """Write a command to the hardware, skipping pins already at the requested level."""
+        if kind == "direction":
+            self._write_direction(value)
+        elif kind == "duty":
+            self.requested_duty = value
+            if not self.wheel_pwm_active:
+                self._write_duty(value, value)
+        elif kind == "wheels":
+            self._write_wheels(*value)
+
+        self.applied += 1
+        if stamp is not None:
+            self.last_latency = time.perf_counter() - stamp
+            self.max_latency = max(self.max_latency, self.last_latency)
+            self.total_latency += self.last_latency
+
+    def stats(self):
+        """Return command counts, pin-write counts and command-to-actuation latency in seconds."""
+        return {
+            "submitted": self.submitted,
+            "applied": self.applied,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "pin_writes": self.pin_writes,
+            "skipped_writes": self.skipped_writes,
+            "last_latency": self.last_latency,
+            "max_latency": self.max_latency,
+            "mean_latency": self.total_latency / self.applied if self.applied else 0.0,
+        }
+
+    def stop(self):
+        """Stop the dispatch thread, bring the motors to a halt and release the GPIO."""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        if self.pin_levels:
+            self.apply("direction", "stop")
+        if self.pwm is not None:
+            self.pwm.stop()
+        if self.pwm_b is not None:
+            self.pwm_b.stop()
+        if self.gpio is not None:
+            self.gpio.cleanup()
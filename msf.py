@@ -1,46 +1,26 @@
 import cv2
-import numpy as np
+from pipeline import Pipeline
+from stages import build_stages
 
-# Specifying upper and lower ranges of color to detect in HSV format
-lower_red1 = np.array([0, 170, 100])    # Lower range of red
-upper_red1 = np.array([10, 255, 255])
-lower_red2 = np.array([170, 170, 100])  # Upper range of red
-upper_red2 = np.array([180, 255, 255])
+# The red HSV ranges ([0, 170, 100]-[10, 255, 255] and [170, 170, 100]-[180, 255, 255])
+# are the "red" class in colorsegment.py, shared with the other detectors
 
-# Capturing webcam footage
-webcam_video = cv2.VideoCapture(0)
+def find_red_boxes(mask, min_area=500):
+    """Bounding boxes (x, y, w, h) of the contours in the mask larger than min_area."""
+    mask_contours, hierarchy = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)  # Finding contours
+    return [cv2.boundingRect(mask_contour) for mask_contour in mask_contours if cv2.contourArea(mask_contour) > min_area]
 
-if not webcam_video.isOpened():
-    print("Error: Could not open webcam.")
-    exit()
+def draw_boxes(video, boxes):
+    """Draw bounding boxes for large contours."""
+    for x, y, w, h in boxes:
+        cv2.rectangle(video, (x, y), (x + w, y + h), (0, 0, 255), 3)
 
-while True:
-    success, video = webcam_video.read()  # Reading webcam footage
-    if not success:
-        print("Error: Could not read frame.")
-        break
+def main():
+    def show_mask(ctx):
+        cv2.imshow("Mask Image", ctx.mask("red"))  # Displaying mask image
 
-    img = cv2.cvtColor(video, cv2.COLOR_BGR2HSV)  # Converting BGR image to HSV format
+    # Capturing webcam footage and displaying it with the boxes; exit the loop if 'q' is pressed
+    Pipeline(build_stages(["msf"])).run(0, window_name="Video Feed", on_frame=show_mask)
 
-    mask1 = cv2.inRange(img, lower_red1, upper_red1)  # Masking the image to find our color
-    mask2 = cv2.inRange(img, lower_red2, upper_red2)
-    red_mask = mask1 | mask2
-
-    mask_contours, hierarchy = cv2.findContours(red_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)  # Finding contours
-
-    # Drawing bounding boxes for large contours
-    for mask_contour in mask_contours:
-        if cv2.contourArea(mask_contour) > 500:
-            x, y, w, h = cv2.boundingRect(mask_contour)
-            cv2.rectangle(video, (x, y), (x + w, y + h), (0, 0, 255), 3)
-
-    cv2.imshow("Mask Image", red_mask)  # Displaying mask image
-    cv2.imshow("Video Feed", video)    # Displaying webcam image
-
-    # Exit the loop if 'q' is pressed
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-
-# Release resources
-webcam_video.release()
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    main()
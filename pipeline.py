@@ -0,0 +1,269 @@
+import argparse
+import signal
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from capture import LatestFrameCapture
+from colorsegment import get_color_classes, get_hsv_lut, segment_hsv
+from preview import PreviewWorker
+from profiler import profiler
+from pyramid import Pyramid, to_full
+
+
+class FrameBuffers:
+    """Output arrays reused from frame to frame, keyed by name, shape and dtype."""
+
+    def __init__(self):
+        self.arrays = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        key = (name, tuple(shape), np.dtype(dtype))
+        array = self.arrays.get(key)
+        if array is None:
+            array = np.empty(shape, dtype=dtype)
+            self.arrays[key] = array
+        return array
+
+
+class FrameContext:
+    """One frame plus the intermediates derived from it, each computed at most once.
+
+    Stages ask for hsv, gray, rgb or a color mask and the first request computes it
+    into a reused buffer; every later stage in the same frame gets the cached array.
+    Stage results are collected in results, keyed by stage name.
+
+    at_level(n) gives the context of the frame downscaled by 2**n, with its own
+    conversions and masks; level contexts share results with the full-resolution
+    one (root) and report them in full-resolution coordinates.
+    """
+
+    def __init__(self, frame, index, timestamp, buffers, color_classes, pyramid=None, level=0, root=None):
+        self.frame = frame
+        self.index = index
+        self.timestamp = timestamp
+        self.height, self.width = frame.shape[:2]
+        self.buffers = buffers
+        self.color_classes = color_classes
+        self.level = level
+        self.scale = 1 << level
+        self.root = root if root is not None else self
+        self.results = self.root.results if root is not None else {}
+        self._cache = {}
+        self._pyramid = pyramid
+        self._levels = {0: self}
+
+    def at_level(self, level):
+        """Context for the frame at 1 / 2**level resolution, built once per frame."""
+        root = self.root
+        ctx = root._levels.get(level)
+        if ctx is None:
+            if root._pyramid is None:
+                root._pyramid = Pyramid(self.buffers)
+                root._pyramid.set_frame(root.frame)
+            with profiler.stage("pyramid"):
+                frame = root._pyramid.level(level)
+            ctx = FrameContext(frame, self.index, self.timestamp, self.buffers, self.color_classes,
+                               level=level, root=root)
+            root._levels[level] = ctx
+        return ctx
+
+    def to_full(self, points):
+        """Map pixel coordinates in this context to the full-resolution frame."""
+        return to_full(points, self.level)
+
+    def _convert(self, name, code, channels):
+        image = self._cache.get(name)
+        if image is None:
+            shape = (self.height, self.width, channels) if channels > 1 else (self.height, self.width)
+            with profiler.stage(name):
+                image = cv2.cvtColor(self.frame, code, dst=self.buffers.get(name, shape))
+            self._cache[name] = image
+        return image
+
+    @property
+    def hsv(self):
+        return self._convert("hsv", cv2.COLOR_BGR2HSV, 3)
+
+    @property
+    def gray(self):
+        return self._convert("gray", cv2.COLOR_BGR2GRAY, 1)
+
+    @property
+    def rgb(self):
+        return self._convert("rgb", cv2.COLOR_BGR2RGB, 3)
+
+    @property
+    def labels(self):
+        """Packed color-class label image for every class any stage registered."""
+        labels = self._cache.get("labels")
+        if labels is None:
+            out = self.buffers.get("labels", (self.height, self.width))
+            img_hsv = self.hsv
+            with profiler.stage("labels"):
+                labels = segment_hsv(img_hsv, get_hsv_lut(self.color_classes), out=out)
+            self._cache["labels"] = labels
+        return labels
+
+    def mask(self, color_name):
+        """Return the 0/255 mask for a registered color class."""
+        return self.any_mask((color_name,))
+
+    def any_mask(self, color_names):
+        """Return the 0/255 mask of pixels belonging to any of the given color classes."""
+        key = "mask:" + ",".join(color_names)
+        mask = self._cache.get(key)
+        if mask is None:
+            out = self.buffers.get(key, (self.height, self.width))
+            cv2.bitwise_and(self.labels, self._bits(color_names), dst=out)
+            mask = cv2.compare(out, 0, cv2.CMP_NE, dst=out)
+            self._cache[key] = mask
+        return mask
+
+    def roi_mask(self, color_names, roi):
+        """Full-resolution 0/255 mask of the given color classes inside roi (x0, y0, x1, y1) only.
+
+        For refining a coarse-level detection without classifying the whole frame
+        at full resolution; not cached.
+        """
+        x0, y0, x1, y1 = roi
+        with profiler.stage("roi_mask"):
+            hsv = cv2.cvtColor(self.root.frame[y0:y1, x0:x1], cv2.COLOR_BGR2HSV)
+            labels = segment_hsv(hsv, get_hsv_lut(self.color_classes))
+            cv2.bitwise_and(labels, self._bits(color_names), dst=labels)
+            return cv2.compare(labels, 0, cv2.CMP_NE, dst=labels)
+
+    def _bits(self, color_names):
+        names = list(self.color_classes)
+        return sum(1 << names.index(name) for name in color_names)
+
+
+class Stage:
+    """A named detection step: detect(ctx) returns a result, draw(frame, result) renders it.
+
+    detect gets the context of pyramid level `level` (the frame downscaled by
+    2**level) and returns its result in full-resolution coordinates.
+    """
+
+    def __init__(self, name, detect, draw=None, colors=(), level=0):
+        self.name = name
+        self.detect = detect
+        self.draw = draw
+        self.colors = tuple(colors)  # Color classes this stage reads through ctx.mask()
+        self.level = level
+
+
+class Pipeline:
+    """Run several stages on each frame, sharing conversions and masks between them."""
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        names = []
+        for stage in self.stages:
+            for color in stage.colors:
+                if color not in names:
+                    names.append(color)
+        self.color_classes = get_color_classes(names)
+        self.buffers = FrameBuffers()
+        self.pyramid = Pyramid(self.buffers)
+        self.frame_index = 0
+
+    def process(self, frame, timestamp=None):
+        """Run every stage on one frame and return its FrameContext."""
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        self.pyramid.set_frame(frame)
+        ctx = FrameContext(frame, self.frame_index, timestamp, self.buffers, self.color_classes, self.pyramid)
+        self.frame_index += 1
+        profiler.start_frame()
+        for stage in self.stages:
+            with profiler.stage(stage.name):
+                ctx.results[stage.name] = stage.detect(ctx.at_level(stage.level))
+        profiler.end_frame()
+        return ctx
+
+    def draw_results(self, frame, results):
+        """Render every stage's result onto a frame."""
+        for stage in self.stages:
+            if stage.draw is not None:
+                stage.draw(frame, results[stage.name])
+        return frame
+
+    def draw(self, ctx):
+        """Render every stage's result onto the context's frame."""
+        return self.draw_results(ctx.frame, ctx.results)
+
+    def run(self, source=0, window_name="Pipeline", headless=False, on_frame=None, max_frames=None, duration=None):
+        """Capture frames from source and run the pipeline until 'q' is pressed or the source ends.
+
+        In headless mode nothing is drawn or shown in the loop; an annotated preview is
+        rendered on a separate thread only when a display is attached. on_frame(ctx), if
+        given, is called with every processed frame. Ctrl+C (SIGINT) and SIGTERM stop the
+        loop cleanly, as do max_frames processed frames or duration seconds when given.
+        """
+        cap = LatestFrameCapture(source)
+        if not cap.isOpened():
+            print("Error: Could not open video source.")
+            return
+
+        preview = PreviewWorker(self.draw_results, window_name=window_name).start() if headless else None
+        # SIGTERM (e.g. from a service manager) interrupts the loop like Ctrl+C; only the main thread may set it
+        previous_sigterm = None
+        if threading.current_thread() is threading.main_thread():
+            previous_sigterm = signal.signal(signal.SIGTERM, signal.default_int_handler)
+        deadline = time.perf_counter() + duration if duration is not None else None
+        processed = 0
+        try:
+            while True:
+                success, frame = cap.read()
+                if not success:
+                    break
+                ctx = self.process(frame)
+                processed += 1
+                if on_frame is not None:
+                    on_frame(ctx)
+                if (max_frames is not None and processed >= max_frames) or \
+                        (deadline is not None and time.perf_counter() >= deadline):
+                    break
+                if headless:
+                    preview.offer(frame, ctx.results)
+                    if preview.quit_requested:
+                        break
+                    continue
+                cv2.imshow(window_name, self.draw(ctx))
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+        except KeyboardInterrupt:
+            print("Interrupted, stopping.")
+        finally:
+            if previous_sigterm is not None:
+                signal.signal(signal.SIGTERM, previous_sigterm)
+            cap.release()
+            if preview is not None:
+                preview.stop()
+            else:
+                cv2.destroyAllWindows()
+            if profiler.enabled:
+                print(profiler.report())
+
+
+def main():
+    from stages import CONFIGS, build_stages
+
+    parser = argparse.ArgumentParser(description="Run several detectors on one camera with shared intermediates.")
+    parser.add_argument("configs", nargs="+", choices=sorted(CONFIGS), help="Stage configurations to run together")
+    parser.add_argument("--source", default="0", help="Camera index, video file or image directory")
+    parser.add_argument("--headless", action="store_true", help="No drawing or windows in the processing loop")
+    parser.add_argument("--max-frames", type=int, default=None, help="Stop after this many frames")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+    args = parser.parse_args()
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    Pipeline(build_stages(args.configs)).run(source, headless=args.headless, max_frames=args.max_frames,
+                                             duration=args.duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+
+import cv2
+
+
+def display_attached():
+    """Return True when there is a display to show a preview window on."""
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+class PreviewWorker:
+    """Render an annotated preview on a separate thread at a low, fixed rate.
+
+    offer() is the only call made from the vision loop. Unless a viewer is
+    attached and the next preview is due, it returns right away without copying
+    or drawing anything. When a preview is due, the frame is copied and the
+    results are handed to the worker, which draws them and shows the window.
+    """
+
+    def __init__(self, render, fps=5, window_name="Preview", viewer_attached=display_attached):
+        self.render = render  # render(frame, results) draws the annotations in place
+        self.period = 1.0 / fps
+        self.window_name = window_name
+        self.viewer_attached = viewer_attached
+        self.enabled = viewer_attached()
+        self.condition = threading.Condition()
+        self.pending = None
+        self.next_due = 0.0
+        self.quit_requested = False
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start the rendering thread if a viewer is attached."""
+        if not self.enabled or self.running:
+            return self
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="PreviewWorker", daemon=True)
+        self.thread.start()
+        return self
+
+    def offer(self, frame, results):
+        """Hand a frame and its detection results to the preview if one is due."""
+        if not self.running:
+            return
+        now = time.perf_counter()
+        if now < self.next_due:
+            return
+        self.next_due = now + self.period
+        with self.condition:
+            # Latest wins: an unrendered pending frame is simply replaced
+            self.pending = (frame.copy(), results)
+            self.condition.notify()
+
+    def _run(self):
+        while self.running:
+            with self.condition:
+                while self.pending is None and self.running:
+                    self.condition.wait(0.1)
+                item, self.pending = self.pending, None
+            if item is None:
+                continue
+            frame, results = item
+            self.render(frame, results)
+            cv2.imshow(self.window_name, frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                self.quit_requested = True
+
+    def stop(self):
+        """Stop the rendering thread and close the preview window."""
+        self.running = False
+        if self.thread is not None:
+            with self.condition:
+                self.condition.notify()
+            self.thread.join(timeout=1.0)
+            self.thread = None
+            cv2.destroyAllWindows()
@@ -0,0 +1,136 @@
+import contextlib
+import functools
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+class _StageTimer:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+    """Per-stage latency recorder for the hot loop.
+
+    Each stage keeps its last `capacity` durations in a preallocated array, from
+    which snapshot() computes p50/p95/p99. Frames whose total time exceeds the
+    budget are counted and remembered. When disabled, stage() hands back a shared
+    null context and timed() functions cost one attribute check.
+    """
+
+    def __init__(self, capacity=1024, budget=None, enabled=False):
+        self.capacity = capacity
+        self.budget = budget  # Frame budget in seconds, None to disable overrun checks
+        self.enabled = enabled
+        self.samples = {}
+        self.counts = {}
+        self.frame_index = 0
+        self.frame_start = None
+        self.overruns = 0
+        self.recent_overruns = deque(maxlen=100)  # (frame index, frame seconds)
+
+    def reset(self):
+        """Drop every recorded sample."""
+        self.samples.clear()
+        self.counts.clear()
+        self.frame_index = 0
+        self.overruns = 0
+        self.recent_overruns.clear()
+
+    def record(self, name, seconds):
+        """Store one duration for a stage."""
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = np.zeros(self.capacity, dtype=np.float64)
+            self.counts[name] = 0
+        count = self.counts[name]
+        samples[count % self.capacity] = seconds
+        self.counts[name] = count + 1
+
+    def stage(self, name):
+        """Context manager timing the enclosed block as one sample of the named stage."""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return _StageTimer(self, name)
+
+    def timed(self, name=None):
+        """Decorator timing every call of the function as a stage (named after it by default)."""
+        def decorator(function):
+            stage_name = name or function.__name__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(stage_name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def start_frame(self):
+        """Mark the start of a frame."""
+        if self.enabled:
+            self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        """Mark the end of a frame, recording its total time and checking it against the budget."""
+        if not self.enabled or self.frame_start is None:
+            return
+        seconds = time.perf_counter() - self.frame_start
+        self.frame_start = None
+        self.record("frame", seconds)
+        if self.budget is not None and seconds > self.budget:
+            self.overruns += 1
+            self.recent_overruns.append((self.frame_index, seconds))
+        self.frame_index += 1
+
+    def snapshot(self):
+        """Return {stage: {count, mean, p50, p95, p99, max}} with times in milliseconds."""
+        stats = {}
+        for name, samples in self.samples.items():
+            count = self.counts[name]
+            window = samples[:min(count, self.capacity)] * 1000.0
+            if window.size == 0:
+                continue
+            p50, p95, p99 = np.percentile(window, [50, 95, 99])
+            stats[name] = {"count": count, "mean": float(window.mean()), "p50": float(p50),
+                           "p95": float(p95), "p99": float(p99), "max": float(window.max())}
+        return stats
+
+    def report(self):
+        """Return a printable table of per-stage latency percentiles and budget overruns."""
+        lines = [f"{'stage':<20}{'count':>8}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)"]
+        for name, s in sorted(self.snapshot().items(), key=lambda item: -item[1]["mean"]):
+            lines.append(f"{name:<20}{s['count']:>8}{s['mean']:>9.2f}{s['p50']:>9.2f}"
+                         f"{s['p95']:>9.2f}{s['p99']:>9.2f}{s['max']:>9.2f}")
+        if self.budget is not None:
+            lines.append(f"Frames over the {self.budget * 1000:.1f} ms budget: {self.overruns} of {self.frame_index}")
+        return "\n".join(lines)
+
+
+# Shared instance for the scripts: PROFILE=1 enables it, FRAME_BUDGET_MS sets the budget.
+profiler = Profiler(
+    enabled=os.environ.get("PROFILE", "0") == "1",
+    budget=float(os.environ["FRAME_BUDGET_MS"]) / 1000.0 if os.environ.get("FRAME_BUDGET_MS") else None,
+)
+stage = profiler.stage
+timed = profiler.timed
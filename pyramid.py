@@ -0,0 +1,103 @@
+import sys
+import time
+
+import cv2
+import numpy as np
+
+
+def level_size(size, level):
+    """(width, height) of a pyramid level: each level halves the one before, dropping an odd last row/column."""
+    width, height = size
+    for _ in range(level):
+        width, height = width // 2, height // 2
+    return width, height
+
+
+def to_full(points, level):
+    """Map pixel coordinates at a pyramid level to full resolution (pixel centers, not corners, line up)."""
+    scale = 1 << level
+    return (np.asarray(points, dtype=np.float32) + 0.5) * scale - 0.5
+
+
+def to_level(points, level):
+    """Map full-resolution pixel coordinates to a pyramid level."""
+    scale = 1 << level
+    return (np.asarray(points, dtype=np.float32) + 0.5) / scale - 0.5
+
+
+def roi_around(x, y, half_size, size):
+    """Integer (x0, y0, x1, y1) window of half_size around (x, y), clipped to an image of size."""
+    width, height = size
+    x0, y0 = max(int(x - half_size), 0), max(int(y - half_size), 0)
+    x1, y1 = min(int(x + half_size) + 1, width), min(int(y + half_size) + 1, height)
+    return x0, y0, x1, y1
+
+
+class Pyramid:
+    """Downscaled copies of one frame, each level half the size of the one before.
+
+    Levels are built on first request from the level above with a 2x2 box
+    average (INTER_AREA) into buffers reused from frame to frame, so a frame
+    only pays for the levels some detector actually asked for. buffers is
+    anything with get(name, shape, dtype), like the pipeline's FrameBuffers.
+    """
+
+    def __init__(self, buffers):
+        self.buffers = buffers
+        self.levels = []
+
+    def set_frame(self, frame):
+        self.levels = [frame]
+
+    def level(self, level):
+        """The frame at 1 / 2**level resolution."""
+        while len(self.levels) <= level:
+            above = self.levels[-1]
+            height, width = above.shape[:2]
+            shape = (height // 2, width // 2) + above.shape[2:]
+            out = self.buffers.get(f"pyramid:{len(self.levels)}", shape, above.dtype)
+            self.levels.append(cv2.resize(above, shape[1::-1], dst=out, interpolation=cv2.INTER_AREA))
+        return self.levels[level]
+
+
+def benchmark(source, configs=("balldetectandgoaldetect",), repeat=3):
+    """Time the stages at their declared pyramid levels against the same stages all at full resolution."""
+    from benchmark import load_frames
+    from pipeline import Pipeline
+    from stages import build_stages
+
+    frames = load_frames(source)
+    if not frames:
+        print("Error: No frames read from", source)
+        return None
+
+    def run(full_resolution):
+        stages = build_stages(configs)
+        if full_resolution:
+            for stage in stages:
+                stage.level = 0
+        pipeline = Pipeline(stages)
+        pipeline.process(frames[0])
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for frame in frames:
+                ctx = pipeline.process(frame)
+        return (time.perf_counter() - start) / (repeat * len(frames)), ctx.results
+
+    full_time, full_results = run(True)
+    pyramid_time, pyramid_results = run(False)
+    print(f"Frames: {len(frames)}")
+    print(f"All stages at full resolution: {full_time * 1000:.2f} ms/frame")
+    print(f"Declared pyramid levels: {pyramid_time * 1000:.2f} ms/frame")
+    for name, result in full_results.items():
+        print(f"  {name} (last frame): {result!r:.60} -> {pyramid_results[name]!r:.60}")
+    if pyramid_time > 0:
+        print(f"Speedup: {full_time / pyramid_time:.1f}x")
+    return {"full_ms": full_time * 1000, "pyramid_ms": pyramid_time * 1000}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python pyramid.py <video file or image directory> [config ...]")
+        sys.exit(1)
+    benchmark(sys.argv[1], sys.argv[2:] or ("balldetectandgoaldetect",))
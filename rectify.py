@@ -0,0 +1,187 @@
+import hashlib
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Where the calibration scripts write their results, in the order they are looked for
+CALIBRATION_FILES = [
+    os.path.join(ROOT, "calibration.yaml"),
+    os.path.join(ROOT, "camera_calibration-master", "calibration.yaml"),
+    os.path.join(ROOT, "camera_calibration.npz"),
+]
+
+
+def find_calibration():
+    """Return the first calibration file that exists, or None."""
+    for path in CALIBRATION_FILES:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def scale_camera_matrix(mtx, calibrated_size, size):
+    """Camera matrix of a calibration made at calibrated_size, for frames of size (both (width, height)).
+
+    The same sensor area at another resolution only rescales the intrinsics;
+    a different aspect ratio means a crop, which the calibration cannot describe.
+    """
+    sx, sy = size[0] / calibrated_size[0], size[1] / calibrated_size[1]
+    if abs(sx - sy) > 0.01 * max(sx, sy):
+        raise ValueError(f"Calibration was made at {calibrated_size[0]}x{calibrated_size[1]}; "
+                         f"frames of {size[0]}x{size[1]} have a different aspect ratio, recalibrate at that size")
+    mtx = np.array(mtx, dtype=np.float64)
+    mtx[0, 0] *= sx
+    mtx[1, 1] *= sy
+    # Pixel centers scale about the image corner
+    mtx[0, 2] = (mtx[0, 2] + 0.5) * sx - 0.5
+    mtx[1, 2] = (mtx[1, 2] + 0.5) * sy - 0.5
+    return mtx
+
+
+def load_calibration(path=None, size=None):
+    """Load (camera matrix, distortion coefficients) from calibration.yaml or camera_calibration.npz.
+
+    With size (width, height), the camera matrix is scaled from the resolution the
+    calibration was made at. Files written before that resolution was recorded
+    are assumed to match.
+    """
+    path = path or find_calibration()
+    if path is None:
+        raise FileNotFoundError("No calibration file found; run calibration.py or camera_calibration.py first")
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            mtx, dist = data["mtx"], data["dist"]
+            calibrated_size = data["size"] if "size" in data.files else None
+    else:
+        import yaml
+
+        with open(path) as f:
+            data = yaml.safe_load(f)
+        mtx, dist = data["camera_matrix"], data["dist_coeff"]
+        calibrated_size = data.get("image_size")
+    mtx = np.asarray(mtx, dtype=np.float64).reshape(3, 3)
+    if size is not None and calibrated_size is not None:
+        mtx = scale_camera_matrix(mtx, tuple(int(v) for v in calibrated_size), tuple(int(v) for v in size))
+    return mtx, np.asarray(dist, dtype=np.float64).ravel()
+
+
+def map_key(mtx, dist, size, alpha):
+    """Hash of everything the remap tables depend on."""
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(mtx, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(dist, dtype=np.float64).tobytes())
+    digest.update(np.array([size[0], size[1], alpha], dtype=np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+class Rectifier:
+    """Undistort frames with remap tables built once per calibration and resolution.
+
+    The tables are built in OpenCV's fixed-point format (CV_16SC2 plus an
+    interpolation table, about 6 bytes per pixel) and saved as .npy files in
+    cache_dir, so later runs memory-map them instead of rebuilding. When only a
+    few keypoints matter, undistort_points() maps them without touching the frame.
+    """
+
+    def __init__(self, mtx, dist, size, alpha=1, cache_dir=None):
+        self.mtx = np.asarray(mtx, dtype=np.float64)
+        self.dist = np.asarray(dist, dtype=np.float64)
+        self.size = tuple(size)  # (width, height)
+        # Camera matrix of the undistorted image; use it (with zero distortion) for pose estimation
+        self.new_camera_matrix, self.roi = cv2.getOptimalNewCameraMatrix(self.mtx, self.dist, self.size, alpha, self.size)
+        self.cache_dir = cache_dir
+        self.key = map_key(self.mtx, self.dist, self.size, alpha)
+        self._maps = None
+
+    @classmethod
+    def from_file(cls, size, path=None, alpha=1):
+        """Rectifier for the calibration in path, caching its tables next to that file."""
+        path = path or find_calibration()
+        mtx, dist = load_calibration(path)
+        return cls(mtx, dist, size, alpha, cache_dir=os.path.join(os.path.dirname(path), "rectify_cache"))
+
+    def _paths(self):
+        base = os.path.join(self.cache_dir, f"{self.key}_{self.size[0]}x{self.size[1]}")
+        return base + "_map1.npy", base + "_map2.npy"
+
+    @property
+    def maps(self):
+        """The (map1, map2) remap tables, loaded from the cache or built on first use."""
+        if self._maps is None:
+            self._maps = self._load() or self._build()
+        return self._maps
+
+    def _load(self):
+        if self.cache_dir is None:
+            return None
+        path1, path2 = self._paths()
+        if not (os.path.exists(path1) and os.path.exists(path2)):
+            return None
+        return np.load(path1, mmap_mode="r"), np.load(path2, mmap_mode="r")
+
+    def _build(self):
+        maps = cv2.initUndistortRectifyMap(self.mtx, self.dist, None, self.new_camera_matrix, self.size, cv2.CV_16SC2)
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for path, table in zip(self._paths(), maps):
+                np.save(path + ".tmp.npy", table)
+                os.replace(path + ".tmp.npy", path)
+        return maps
+
+    def apply(self, image, dst=None):
+        """Return the undistorted image, written into dst when given."""
+        map1, map2 = self.maps
+        return cv2.remap(image, map1, map2, cv2.INTER_LINEAR, dst=dst)
+
+    def undistort_points(self, points):
+        """Map pixel coordinates of the raw image to the undistorted image; returns an (N, 2) array."""
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+        if points.size == 0:
+            return np.empty((0, 2), dtype=np.float32)
+        return cv2.undistortPoints(points, self.mtx, self.dist, P=self.new_camera_matrix).reshape(-1, 2)
+
+
+def benchmark(source, path=None, repeat=20):
+    """Compare cv2.undistort with the cached remap tables on recorded footage, printing ms/frame."""
+    from capture import open_source
+
+    cap = open_source(source)
+    success, frame = cap.read()
+    cap.release()
+    if not success:
+        print("Error: No frames read from", source)
+        return None
+
+    height, width = frame.shape[:2]
+    mtx, dist = load_calibration(path)
+    start = time.perf_counter()
+    rectifier = Rectifier.from_file((width, height), path)
+    rectifier.maps
+    setup_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        cv2.undistort(frame, mtx, dist, None, rectifier.new_camera_matrix)
+    undistort_time = (time.perf_counter() - start) / repeat
+
+    out = np.empty_like(frame)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        rectifier.apply(frame, dst=out)
+    remap_time = (time.perf_counter() - start) / repeat
+
+    print(f"Tables ready in {setup_time * 1000:.1f} ms")
+    print(f"cv2.undistort: {undistort_time * 1000:.2f} ms/frame")
+    print(f"cached remap:  {remap_time * 1000:.2f} ms/frame")
+    return {"setup_ms": setup_time * 1000, "undistort_ms": undistort_time * 1000, "remap_ms": remap_time * 1000}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python rectify.py <video file or image directory> [calibration file]")
+        sys.exit(1)
+    benchmark(sys.argv[1], sys.argv[2] if len(sys.argv) == 3 else None)
@@ -0,0 +1,146 @@
+import sys
+import time
+
+import cv2
+
+from profiler import timed
+
+
+@timed("hough_circles")
+def find_circles(mask, min_radius, max_radius, min_dist=50, param1=100, param2=30, dp=1.2):
+    """Blur the mask and run the Hough circle transform with the ball detector's settings."""
+    blurred_mask = cv2.GaussianBlur(mask, (9, 9), 2)
+    return cv2.HoughCircles(
+        blurred_mask,
+        cv2.HOUGH_GRADIENT,
+        dp=dp,
+        minDist=min_dist,
+        param1=param1,
+        param2=param2,
+        minRadius=min_radius,
+        maxRadius=max_radius
+    )
+
+
+class RoiCircleDetector:
+    """Hough circle search restricted to a window around the previous detection.
+
+    While a ball is being tracked only a padded window around the last center is
+    searched, with the radius bounds narrowed around the last radius. A full-frame
+    search is used to (re)acquire the ball, after max_misses consecutive ROI misses,
+    and every full_search_every frames regardless. hough_params are passed on to
+    find_circles for both searches.
+    """
+
+    def __init__(self, min_radius=40, max_radius=150, padding=1.5, margin=30,
+                 radius_slack=0.3, max_misses=3, full_search_every=30, hough_params=None):
+        self.min_radius = min_radius
+        self.max_radius = max_radius
+        self.padding = padding  # Window half-size in multiples of the last radius
+        self.margin = margin  # Extra pixels of motion allowed on each side
+        self.radius_slack = radius_slack  # Allowed relative change of radius between frames
+        self.max_misses = max_misses
+        self.full_search_every = full_search_every
+        self.hough_params = hough_params or {}
+
+        self.last = None  # (x, y, radius) of the last detection
+        self.misses = 0
+        self.frames_since_full = 0
+        self.full_searches = 0
+        self.roi_searches = 0
+
+    def reset(self):
+        """Forget the tracked ball so the next call searches the whole frame."""
+        self.last = None
+        self.misses = 0
+
+    def use_full_search(self):
+        return (
+            self.last is None
+            or self.misses >= self.max_misses
+            or self.frames_since_full >= self.full_search_every
+        )
+
+    def roi(self, frame_shape):
+        """Return the (x0, y0, x1, y1) search window around the last detection."""
+        x, y, radius = self.last
+        half = int(radius * self.padding + self.margin)
+        height, width = frame_shape[:2]
+        x0, y0 = max(int(x) - half, 0), max(int(y) - half, 0)
+        x1, y1 = min(int(x) + half + 1, width), min(int(y) + half + 1, height)
+        return x0, y0, x1, y1
+
+    def detect(self, mask):
+        """Detect circles in the mask, returning them in cv2.HoughCircles format (or None)."""
+        if self.use_full_search():
+            circles = find_circles(mask, self.min_radius, self.max_radius, **self.hough_params)
+            self.frames_since_full = 0
+            self.full_searches += 1
+            if circles is None:
+                self.reset()
+                return None
+        else:
+            self.frames_since_full += 1
+            self.roi_searches += 1
+            x0, y0, x1, y1 = self.roi(mask.shape)
+            radius = self.last[2]
+            min_radius = max(self.min_radius, int(radius * (1 - self.radius_slack)))
+            max_radius = min(self.max_radius, int(radius * (1 + self.radius_slack)) + 1)
+            circles = find_circles(mask[y0:y1, x0:x1], min_radius, max_radius, **self.hough_params)
+            if circles is None:
+                self.misses += 1
+                return None
+            circles[0, :, 0] += x0
+            circles[0, :, 1] += y0
+
+        self.misses = 0
+        self.last = tuple(float(v) for v in circles[0, 0])
+        return circles
+
+
+def benchmark(source, color_ranges=None):
+    """Compare full-frame and ROI Hough search on recorded footage, printing ms/frame for each."""
+    from capture import open_source
+    from colorsegment import get_color_classes, segment_masks
+
+    if color_ranges is None:
+        color_ranges = get_color_classes(["red"])
+
+    cap = open_source(source)
+    masks = []
+    while True:
+        success, frame = cap.read()
+        if not success:
+            break
+        img_hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        masks.append(next(iter(segment_masks(img_hsv, color_ranges).values())))
+    cap.release()
+
+    if not masks:
+        print("Error: No frames read from", source)
+        return None
+
+    start = time.perf_counter()
+    full_hits = sum(find_circles(mask, 40, 150) is not None for mask in masks)
+    full_time = (time.perf_counter() - start) / len(masks)
+
+    detector = RoiCircleDetector()
+    start = time.perf_counter()
+    roi_hits = sum(detector.detect(mask) is not None for mask in masks)
+    roi_time = (time.perf_counter() - start) / len(masks)
+
+    print(f"Frames: {len(masks)}")
+    print(f"Full-frame Hough: {full_time * 1000:.2f} ms/frame, {full_hits} frames with a circle")
+    print(f"ROI Hough:        {roi_time * 1000:.2f} ms/frame, {roi_hits} frames with a circle "
+          f"({detector.roi_searches} ROI / {detector.full_searches} full searches)")
+    if roi_time > 0:
+        print(f"Speedup: {full_time / roi_time:.1f}x")
+    return {"frames": len(masks), "full_ms": full_time * 1000, "roi_ms": roi_time * 1000,
+            "full_hits": full_hits, "roi_hits": roi_hits}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python roicircles.py <video file or image directory>")
+        sys.exit(1)
+    benchmark(sys.argv[1])
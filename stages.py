@@ -0,0 +1,316 @@
+import cv2
+import numpy as np
+
+from pipeline import Stage
+from pyramid import roi_around
+from roicircles import RoiCircleDetector
+
+
+def circle_stage(name, colors, min_radius, max_radius, tracking=True, label=None, hough_params=None, level=0,
+                 refine=True):
+    """Hough circles on the union of the given color masks (balldetectandgoaldetect.py, detectredyellowball.py, m.py).
+
+    Radii are in full-resolution pixels. Above level 0 the circles are searched
+    at 1 / 2**level resolution and, with refine, each one is fitted again on a
+    full-resolution mask of a window just around it.
+    """
+    from balldetectandgoaldetect import draw_circles, find_ball_circles
+
+    detectors = {}
+    label = label if label is not None else name
+    hough_params = hough_params or {}
+
+    def refine_circle(ctx, x, y, radius):
+        # Search only radii the coarse level could have rounded to, in a window a little larger than the circle
+        slack = ctx.scale * 2
+        roi = roi_around(x, y, radius * 1.2 + slack, (ctx.root.width, ctx.root.height))
+        mask = ctx.roi_mask(colors, roi)
+        circles = find_ball_circles(mask, None, max(int(radius - slack), 1), int(radius + slack) + 1,
+                                    **dict(hough_params, min_dist=max(mask.shape)))
+        if not circles:
+            return x, y, radius
+        fx, fy, fr = circles[0]
+        if abs(fx + roi[0] - x) > slack or abs(fy + roi[1] - y) > slack:
+            return x, y, radius
+        return fx + roi[0], fy + roi[1], fr
+
+    def detect(ctx):
+        # Radius bounds, center spacing and tracking state are kept per level
+        level_min, level_max = max(min_radius // ctx.scale, 1), max(max_radius // ctx.scale, 2)
+        level_params = dict(hough_params, min_dist=hough_params.get("min_dist", 50) / ctx.scale)
+        detector = None
+        if tracking:
+            detector = detectors.get(ctx.level)
+            if detector is None:
+                detector = detectors[ctx.level] = RoiCircleDetector(level_min, level_max, margin=30 / ctx.scale,
+                                                                    hough_params=level_params)
+        circles = find_ball_circles(ctx.any_mask(colors), detector, level_min, level_max, **level_params)
+        if ctx.level == 0 or not circles:
+            return circles
+        centers = ctx.to_full([circle[:2] for circle in circles])
+        circles = [(x, y, radius * ctx.scale) for (x, y), (_, _, radius) in zip(centers, circles)]
+        if refine:
+            circles = [refine_circle(ctx, *circle) for circle in circles]
+        return [tuple(int(round(v)) for v in circle) for circle in circles]
+
+    def draw(frame, circles):
+        draw_circles(frame, circles, label)
+
+    return Stage(name, detect, draw, colors=colors, level=level)
+
+
+def largest_blob_stage(name, color, min_area=500, label=None, level=0):
+    """Center and outline of the largest blob of a color, if it is large enough (detect_pink_center).
+
+    min_area is in full-resolution pixels whatever the level.
+    """
+    from balldetectandgoaldetect import draw_pink_center, find_pink_center
+
+    label = label if label is not None else name
+
+    def detect(ctx):
+        blob = find_pink_center(ctx.mask(color), min_area / ctx.scale ** 2)
+        if blob is None or ctx.level == 0:
+            return blob
+        center, contour = blob
+        center_x, center_y = ctx.to_full(center)
+        return (int(round(center_x)), int(round(center_y))), np.round(ctx.to_full(contour)).astype(np.int32)
+
+    def draw(frame, blob):
+        draw_pink_center(frame, blob, label)
+
+    return Stage(name, detect, draw, colors=(color,), level=level)
+
+
+def center_stage(name, color, label=None):
+    """Center of the largest blob of a color, (-1, -1) when there is none (tester.py's detect_center)."""
+    from tester import detect_center
+
+    label = label if label is not None else name
+
+    def detect(ctx):
+        return detect_center(ctx.mask(color))
+
+    def draw(frame, center):
+        if center[0] == -1:
+            return
+        cv2.circle(frame, center, 5, (0, 0, 255), -1)
+        cv2.putText(frame, f"{label} ({center[0]}, {center[1]})", (center[0] - 50, center[1] - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+    return Stage(name, detect, draw, colors=(color,))
+
+
+def white_dots_stage(name="white_dots", color="white", tolerance=10, margin=32):
+    """White dots in a vertical band around the screen center (detect_white_dots).
+
+    Small dots blur into their background when downscaled, so they are searched at
+    full resolution, classifying only the band (plus margin for dots straddling
+    its edge) instead of the whole frame.
+    """
+    from balldetectandgoaldetect import draw_white_dots, find_white_dots
+
+    def detect(ctx):
+        root = ctx.root
+        frame_center_x = root.width // 2
+        x0 = max(frame_center_x - tolerance - margin, 0)
+        x1 = min(frame_center_x + tolerance + margin + 1, root.width)
+        dots = find_white_dots(ctx.roi_mask((color,), (x0, 0, x1, root.height)), frame_center_x - x0, tolerance)
+        return [(x + x0, y) for x, y in dots]
+
+    return Stage(name, detect, draw_white_dots, colors=(color,))
+
+
+def boxes_stage(name, color, min_area=500, level=0):
+    """Bounding boxes of every large blob of a color (msf.py).
+
+    min_area is in full-resolution pixels whatever the level.
+    """
+    from msf import draw_boxes, find_red_boxes
+
+    def detect(ctx):
+        return [tuple(v * ctx.scale for v in box) for box in find_red_boxes(ctx.mask(color), min_area / ctx.scale ** 2)]
+
+    return Stage(name, detect, draw_boxes, colors=(color,), level=level)
+
+
+def coverage_stage(name, color, outline=(255, 0, 0)):
+    """Pixel count and outline of a color mask (blue.py, detectpink.py)."""
+
+    def detect(ctx):
+        mask = ctx.mask(color)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        return cv2.countNonZero(mask), contours
+
+    def draw(frame, result):
+        cv2.drawContours(frame, result[1], -1, outline, 1)
+
+    return Stage(name, detect, draw, colors=(color,))
+
+
+def distance_stage(name="distance", color="red"):
+    """The first red circle and its distance from its pixel diameter and position (dpth.py's get_dist)."""
+    from dpth import ball_distance, draw_ball, find_ball
+
+    def detect(ctx):
+        ball = find_ball(ctx.mask(color))
+        if ball is None:
+            return None
+        x, y, radius = ball
+        return ball, ball_distance(float(radius), (ctx.width, ctx.height), (x, y))
+
+    return Stage(name, detect, draw_ball, colors=(color,))
+
+
+def field_lines_stage(name="field_lines", level=1, brightness=200):
+    """White field lines as segments found on a pyramid level (friedgedetection.py).
+
+    With CAMERA_HEIGHT set, the result also places them on the floor.
+    """
+    from fieldlines import FieldLineDetector, draw_lines
+
+    detectors = {}
+
+    def detect(ctx):
+        # One detector per frame size and level, built on first use from the calibration on disk
+        size = (ctx.root.width, ctx.root.height)
+        detector = detectors.get((size, ctx.level))
+        if detector is None:
+            detector = detectors[size, ctx.level] = FieldLineDetector.from_calibration(size, ctx.scale,
+                                                                                        brightness=brightness)
+        return detector.detect(ctx.frame)
+
+    def draw(frame, lines):
+        draw_lines(frame, lines)
+
+    return Stage(name, detect, draw, level=level)
+
+
+def aruco_stage(name="aruco", dictionary=cv2.aruco.DICT_6X6_250, level=1):
+    """ArUco marker IDs and corners (arucko.py), followed between detections with optical flow.
+
+    Markers are found and tracked at 1 / 2**level resolution; their corners are
+    then refined at full resolution on a small grayscale window around each marker.
+    """
+    from markertracker import MarkerTracker
+
+    aruco = cv2.aruco
+    trackers = {}
+    criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.01)
+
+    def refine_corners(ctx, corners):
+        window = ctx.scale + 1
+        x0, y0 = np.maximum(np.floor(corners.min(axis=0)).astype(int) - window * 2, 0)
+        x1, y1 = np.ceil(corners.max(axis=0)).astype(int) + window * 2 + 1
+        gray = cv2.cvtColor(ctx.root.frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        local = np.ascontiguousarray(corners - (x0, y0), dtype=np.float32).reshape(-1, 1, 2)
+        local[..., 0] = np.clip(local[..., 0], 0, gray.shape[1] - 1)
+        local[..., 1] = np.clip(local[..., 1], 0, gray.shape[0] - 1)
+        cv2.cornerSubPix(gray, local, (window, window), (-1, -1), criteria)
+        return local.reshape(4, 2) + (x0, y0)
+
+    def detect(ctx):
+        # Tracked corners are kept per level
+        tracker = trackers.get(ctx.level)
+        if tracker is None:
+            tracker = trackers[ctx.level] = MarkerTracker(dictionary)
+        markers = tracker.update(ctx.gray)
+        if not markers:
+            return (), None
+        corners = [ctx.to_full(marker.corners.reshape(4, 2)) for marker in markers]
+        if ctx.level > 0:
+            corners = [refine_corners(ctx, marker_corners) for marker_corners in corners]
+        corners = tuple(np.float32(marker_corners).reshape(1, 4, 2) for marker_corners in corners)
+        return corners, np.array([[marker.marker_id] for marker in markers], dtype=np.int32)
+
+    def draw(frame, result):
+        corners, ids = result
+        if ids is None:
+            return
+        aruco.drawDetectedMarkers(frame, corners, ids)
+        for i, marker_id in enumerate(np.ravel(ids)):
+            x, y = int(corners[i][0][0][0]), int(corners[i][0][0][1])
+            cv2.putText(frame, f"ID: {marker_id}", (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+
+    return Stage(name, detect, draw, level=level)
+
+
+def apriltag_stage(name="apriltag", family="tag36h11", marker_size=0.05):
+    """AprilTag corners and distances (linedetect.py), searched around known tags, and the field position.
+
+    The camera calibration is loaded for the frame size on the first frame; the
+    field position is None without a field map and a real calibration.
+    """
+    from linedetect import draw_tags, load_camera, tag_distance
+    from localization import observations
+    from tagtracker import TagTracker, make_tag_detector
+
+    tracker = TagTracker(make_tag_detector(family))
+    cameras = {}
+
+    def detect(ctx):
+        size = (ctx.width, ctx.height)
+        camera = cameras.get(size)
+        if camera is None:
+            camera = cameras[size] = load_camera(size)
+        camera_matrix, dist_coeffs, localizer = camera
+        found = tracker.update(ctx.gray)
+        tags = [(tag.tag_id, tag.corners, tuple(tag.center),
+                 tag_distance(marker_size, tag.corners, size, camera_matrix, dist_coeffs)) for tag in found]
+        robot = localizer.update(observations(found, family)) if localizer is not None else None
+        return tags, robot
+
+    return Stage(name, detect, draw_tags)
+
+
+def hands_stage(name="hands"):
+    """MediaPipe hand landmarks (main.py)."""
+    import mediapipe as mp
+
+    mp_hands = mp.solutions.hands
+    hands = mp_hands.Hands()
+    mp_drawing = mp.solutions.drawing_utils
+
+    def detect(ctx):
+        return hands.process(ctx.rgb).multi_hand_landmarks
+
+    def draw(frame, landmarks):
+        for hand_landmarks in landmarks or ():
+            mp_drawing.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
+
+    return Stage(name, detect, draw)
+
+
+# Each existing script expressed as a list of stages. Configurations can be combined
+# on one camera and share the HSV/grayscale conversions and color masks. Stages for
+# large targets run on a half-resolution pyramid level, which stages sharing it
+# build and classify only once.
+CONFIGS = {
+    "ball": lambda: [circle_stage("ball", ("red",), 40, 150, label="Red", level=1)],
+    "goal": lambda: [largest_blob_stage("goal", "pink", min_area=500, label="Pink", level=1)],
+    "white_dots": lambda: [white_dots_stage()],
+    "balldetectandgoaldetect": lambda: CONFIGS["ball"]() + CONFIGS["goal"]() + CONFIGS["white_dots"](),
+    # tester.py's detect_center: largest red and pink blobs with no minimum area
+    "tester": lambda: [center_stage("red_center", "red", label="Red"),
+                       center_stage("pink_center", "pink", label="Pink")],
+    "detectredyellowball": lambda: [circle_stage("red_yellow_ball", ("red", "yellow"), 20, 100, label="")],
+    "msf": lambda: [boxes_stage("red_boxes", "red", min_area=500, level=1)],
+    "m": lambda: [circle_stage("small_red_circles", ("red_loose",), 1, 40, tracking=False, label="",
+                                     hough_params={"dp": 1, "min_dist": 20, "param1": 50})],
+    "blue": lambda: [coverage_stage("blue", "blue", outline=(255, 0, 0))],
+    "detectpink": lambda: [coverage_stage("pink", "pink", outline=(255, 0, 255))],
+    "dpth": lambda: [distance_stage()],
+    "friedgedetection": lambda: [field_lines_stage()],
+    "arucko": lambda: [aruco_stage()],
+    "linedetect": lambda: [apriltag_stage()],
+    "main": lambda: [hands_stage()],
+}
+
+
+def build_stages(config_names):
+    """Instantiate the stages for the named configurations, skipping duplicates."""
+    stages = {}
+    for config_name in config_names:
+        for stage in CONFIGS[config_name]():
+            stages.setdefault(stage.name, stage)
+    return list(stages.values())
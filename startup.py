@@ -0,0 +1,138 @@
+import importlib
+import os
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MODEL_CACHE_DIR = os.path.join(ROOT, "model_cache")
+
+
+class LazyModule:
+    """Stand-in for a module that is only imported when one of its attributes is first used."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                start = time.perf_counter()
+                self._module = importlib.import_module(self._name)
+                startup.mark(f"import {self._name}", time.perf_counter() - start)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._module or self._load(), attribute)
+
+
+def lazy_import(name):
+    """Return a module proxy for a heavy library (torch, torchvision, mediapipe) that imports on first use."""
+    return LazyModule(name)
+
+
+class BackgroundTask:
+    """Run a slow setup step (model load, warmup) on a daemon thread while the caller carries on."""
+
+    def __init__(self, name, function, *args):
+        self.name = name
+        self.value = None
+        self.error = None
+        self.finished = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(function, args), name=name, daemon=True)
+        self.thread.start()
+
+    def _run(self, function, args):
+        start = time.perf_counter()
+        try:
+            self.value = function(*args)
+        except Exception as error:
+            self.error = error
+        startup.mark(self.name, time.perf_counter() - start)
+        self.finished.set()
+
+    @property
+    def done(self):
+        return self.finished.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the task and return its value, re-raising its exception if it failed."""
+        if not self.finished.wait(timeout):
+            raise TimeoutError(f"{self.name} is still running")
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def background(name, function, *args):
+    return BackgroundTask(name, function, *args)
+
+
+def checkpoint_path(name, directory=MODEL_CACHE_DIR):
+    return os.path.join(directory, f"{name}.pt")
+
+
+def load_cached_model(name, build, skeleton, directory=MODEL_CACHE_DIR):
+    """Load a torch model from a local memory-mapped checkpoint, creating it on first use.
+
+    build() produces the full pretrained model (slow: downloads or reads hub
+    weights) and is only called when no checkpoint exists; its state dict is then
+    saved locally. skeleton() produces the same architecture without weights, into
+    which the checkpoint is memory-mapped so tensors are paged in on demand rather
+    than read and copied up front.
+    """
+    import torch
+
+    path = checkpoint_path(name, directory)
+    start = time.perf_counter()
+    if os.path.exists(path):
+        model = skeleton()
+        state = torch.load(path, mmap=True, weights_only=True, map_location="cpu")
+        model.load_state_dict(state, assign=True)
+        startup.mark(f"load {name} (checkpoint)", time.perf_counter() - start)
+    else:
+        model = build()
+        os.makedirs(directory, exist_ok=True)
+        torch.save(model.state_dict(), path + ".tmp")
+        os.replace(path + ".tmp", path)
+        startup.mark(f"load {name} (built, checkpoint saved)", time.perf_counter() - start)
+    model.eval()
+    return model
+
+
+class StartupTimer:
+    """Record how long each startup step took and when the first frame was shown."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.steps = []  # (name, seconds since start when it finished, duration)
+        self.first_frame_at = None
+        self.lock = threading.Lock()
+
+    def mark(self, name, duration=None):
+        with self.lock:
+            self.steps.append((name, time.perf_counter() - self.start, duration))
+
+    def first_frame(self):
+        """Note the first frame; returns True only on the first call."""
+        if self.first_frame_at is not None:
+            return False
+        self.first_frame_at = time.perf_counter() - self.start
+        return True
+
+    def report(self):
+        """Return a printable summary of time to first frame and the startup steps."""
+        lines = []
+        if self.first_frame_at is not None:
+            lines.append(f"Time to first frame: {self.first_frame_at * 1000:.0f} ms")
+        with self.lock:
+            steps = list(self.steps)
+        for name, finished, duration in steps:
+            took = f" (took {duration * 1000:.0f} ms)" if duration is not None else ""
+            lines.append(f"  {finished * 1000:>8.0f} ms  {name}{took}")
+        return "\n".join(lines)
+
+
+# Shared timer; it starts when this module is first imported, so scripts import it early.
+startup = StartupTimer()
@@ -0,0 +1,176 @@
+import math
+import time
+
+
+def clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+class PIDController:
+    """PID controller with integral anti-windup and output rate limiting.
+
+    The error is expected to be normalised (e.g. pixel offset divided by half the
+    frame width) and the output lies in [-output_limit, output_limit]. When a
+    derivative is passed in (e.g. tracker velocity scaled the same way as the
+    error) it replaces the noisy finite difference of the error.
+    """
+
+    def __init__(self, kp=1.0, ki=0.3, kd=0.1, output_limit=1.0, integral_limit=0.5, rate_limit=6.0):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.output_limit = output_limit
+        self.integral_limit = integral_limit  # Cap on the integral term's contribution
+        self.rate_limit = rate_limit  # Maximum output change per second, None to disable
+        self.reset()
+
+    def reset(self):
+        """Clear the integral, derivative history and rate limiter."""
+        self.integral = 0.0
+        self.last_error = None
+        self.last_time = None
+        self.output = 0.0
+
+    def update(self, error, dt=None, derivative=None):
+        """Return the new control output for this error sample."""
+        if dt is None:
+            now = time.perf_counter()
+            dt = now - self.last_time if self.last_time is not None else 0.0
+            self.last_time = now
+
+        if derivative is None:
+            derivative = (error - self.last_error) / dt if self.last_error is not None and dt > 0 else 0.0
+        self.last_error = error
+
+        integral = self.integral
+        if self.ki and dt > 0:
+            integral = self.integral + self.ki * error * dt
+            if self.integral_limit is not None:
+                integral = clamp(integral, -self.integral_limit, self.integral_limit)
+
+        unsaturated = self.kp * error + integral + self.kd * derivative
+        output = clamp(unsaturated, -self.output_limit, self.output_limit)
+
+        # Conditional integration: stop accumulating while saturated in the error's direction
+        if output == unsaturated or (error > 0) != (unsaturated > 0):
+            self.integral = integral
+
+        if self.rate_limit is not None and dt > 0:
+            max_step = self.rate_limit * dt
+            output = clamp(output, self.output - max_step, self.output + max_step)
+        self.output = output
+        return output
+
+
+class BangBangController:
+    """The original fl/fr/f steering rule, expressed on the same normalised scale as PIDController.
+
+    Stopping one wheel at the base duty is the same wheel difference as a turn of 0.5
+    in differential_duty.
+    """
+
+    def __init__(self, deadband=15 / 320, turn=0.5):
+        self.deadband = deadband
+        self.turn = turn
+
+    def reset(self):
+        pass
+
+    def update(self, error, dt=None, derivative=None):
+        if error < -self.deadband:
+            return -self.turn
+        if error > self.deadband:
+            return self.turn
+        return 0.0
+
+
+def differential_duty(turn, base_duty=50, max_duty=100):
+    """Map a turn command in [-1, 1] to (left, right) wheel duty cycles; positive turns right."""
+    left = clamp(base_duty * (1 + turn), 0, max_duty)
+    right = clamp(base_duty * (1 - turn), 0, max_duty)
+    return left, right
+
+
+# Target bearing in radians as a function of time, for simulate()
+TRAJECTORIES = {
+    "step": lambda t: math.radians(20),
+    "ramp": lambda t: math.radians(20) + math.radians(10) * t,
+    "sine": lambda t: math.radians(15) * math.sin(2 * math.pi * 0.5 * t),
+}
+
+
+def simulate(controller, trajectory, duration=5.0, fps=30, frame_width=640, fov=math.radians(60),
+             base_duty=50, yaw_rate_per_duty=math.radians(3), motor_lag=0.1, latency_frames=1,
+             tolerance_px=15, hold_time=0.3):
+    """Run the controller against a deterministic robot model and return steering metrics.
+
+    The robot yaw rate follows the left/right duty difference through a first-order
+    motor lag, and the camera sees the target latency_frames late. time_to_center is
+    the first time the target stays within tolerance_px of the image center for
+    hold_time seconds, or None if it never does.
+    """
+    if isinstance(trajectory, str):
+        trajectory = TRAJECTORIES[trajectory]
+    controller.reset()
+    dt = 1.0 / fps
+    half_width = frame_width / 2
+    px_per_rad = half_width / (fov / 2)
+    hold_frames = max(1, int(round(hold_time * fps)))
+
+    heading = 0.0
+    yaw_rate = 0.0
+    delayed = [0.0] * latency_frames
+    errors_px = []
+    last_turn = 0.0
+    reversals = 0
+
+    for step in range(int(duration * fps)):
+        t = step * dt
+        error_px = (trajectory(t) - heading) * px_per_rad
+        errors_px.append(error_px)
+        delayed.append(error_px)
+        observed = delayed.pop(0)
+
+        turn = controller.update(observed / half_width, dt=dt)
+        if turn * last_turn < 0:
+            reversals += 1
+        if turn != 0:
+            last_turn = turn
+
+        left, right = differential_duty(turn, base_duty)
+        target_rate = yaw_rate_per_duty * (left - right)
+        yaw_rate += (target_rate - yaw_rate) * min(dt / motor_lag, 1.0)
+        heading += yaw_rate * dt
+
+    time_to_center = None
+    run = 0
+    for index, error_px in enumerate(errors_px):
+        run = run + 1 if abs(error_px) <= tolerance_px else 0
+        if run >= hold_frames:
+            time_to_center = (index - hold_frames + 1) * dt
+            break
+
+    rms = math.sqrt(sum(e * e for e in errors_px) / len(errors_px)) if errors_px else 0.0
+    return {
+        "time_to_center": time_to_center,
+        "rms_error_px": rms,
+        "final_error_px": errors_px[-1] if errors_px else 0.0,
+        "reversals": reversals,
+    }
+
+
+def compare(controllers=None, trajectories=TRAJECTORIES):
+    """Print simulate() metrics for each controller on each synthetic trajectory."""
+    if controllers is None:
+        controllers = {"bang-bang": BangBangController(), "pid": PIDController()}
+    for trajectory_name in trajectories:
+        for controller_name, controller in controllers.items():
+            result = simulate(controller, trajectories[trajectory_name])
+            ttc = result["time_to_center"]
+            ttc_text = f"{ttc:.2f}s" if ttc is not None else "never"
+            print(f"{trajectory_name:>5} {controller_name:>10}: time to center {ttc_text:>6}, "
+                  f"RMS error {result['rms_error_px']:6.1f}px, reversals {result['reversals']}")
+
+
+if __name__ == "__main__":
+    compare()
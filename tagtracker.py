@@ -0,0 +1,199 @@
+import sys
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from profiler import timed
+
+# One tag in full-frame pixel coordinates; corners are float32 (4, 2)
+TagDetection = namedtuple("TagDetection", ["tag_id", "corners", "center"])
+
+# cv2.aruco dictionaries for the AprilTag families, used when the apriltag package is missing
+ARUCO_APRILTAG_FAMILIES = {
+    "tag16h5": "DICT_APRILTAG_16h5",
+    "tag25h9": "DICT_APRILTAG_25h9",
+    "tag36h10": "DICT_APRILTAG_36h10",
+    "tag36h11": "DICT_APRILTAG_36h11",
+}
+
+
+def apriltag_detector(family="tag36h11", threads=2):
+    """detect(gray) -> [TagDetection] using the apriltag package."""
+    import apriltag
+
+    detector = apriltag.Detector(apriltag.DetectorOptions(families=family, nthreads=threads))
+
+    def detect(gray):
+        return [TagDetection(tag.tag_id, np.asarray(tag.corners, dtype=np.float32),
+                             np.asarray(tag.center, dtype=np.float32)) for tag in detector.detect(gray)]
+    return detect
+
+
+def aruco_apriltag_detector(family="tag36h11"):
+    """detect(gray) -> [TagDetection] using OpenCV's built-in AprilTag dictionaries."""
+    dictionary = cv2.aruco.getPredefinedDictionary(getattr(cv2.aruco, ARUCO_APRILTAG_FAMILIES[family]))
+    detector = cv2.aruco.ArucoDetector(dictionary)
+
+    def detect(gray):
+        corners, ids, _ = detector.detectMarkers(gray)
+        if ids is None:
+            return []
+        return [TagDetection(int(tag_id), quad.reshape(4, 2).astype(np.float32), quad.reshape(4, 2).mean(axis=0))
+                for tag_id, quad in zip(np.ravel(ids), corners)]
+    return detect
+
+
+def make_tag_detector(family="tag36h11"):
+    """The apriltag package's detector, or OpenCV's when that package is not installed."""
+    try:
+        return apriltag_detector(family)
+    except ImportError:
+        return aruco_apriltag_detector(family)
+
+
+class TagTracker:
+    """Find tags by searching only around where they were last seen.
+
+    Each tracked tag is looked for in a window around its last quad, decimated
+    so the tag stays about min_tag_px across: near, large tags are searched at
+    reduced resolution and far, small ones at full resolution. The whole frame is
+    searched when nothing is tracked and every reacquire_every frames, to pick
+    up new tags. Those full searches run decimated, except every
+    full_resolution_every-th one, which runs at full resolution to find far tags.
+    """
+
+    def __init__(self, detect, margin=1.0, max_misses=3, reacquire_every=15, reacquire_decimate=2,
+                 full_resolution_every=3, min_tag_px=32, max_decimate=4):
+        self.detect = detect  # detect(gray) -> [TagDetection], e.g. make_tag_detector()
+        self.margin = margin  # Window padding, as a fraction of the tag size
+        self.max_misses = max_misses
+        self.reacquire_every = reacquire_every
+        self.reacquire_decimate = reacquire_decimate
+        self.full_resolution_every = full_resolution_every
+        self.min_tag_px = min_tag_px
+        self.max_decimate = max_decimate
+        self.tracks = {}  # tag id -> [corners, misses]
+        self.frame_index = 0
+        self.full_searches = 0
+        self.roi_searches = 0
+        self.pixels_searched = 0
+
+    def _search(self, gray, window, decimate):
+        x0, y0, x1, y1 = window
+        patch = gray[y0:y1, x0:x1]
+        height, width = patch.shape[:2]
+        if decimate > 1 and width >= 2 * decimate and height >= 2 * decimate:
+            small = cv2.resize(patch, (width // decimate, height // decimate), interpolation=cv2.INTER_AREA)
+            scale = np.array([width / small.shape[1], height / small.shape[0]], dtype=np.float32)
+        else:
+            small = np.ascontiguousarray(patch)
+            scale = np.ones(2, dtype=np.float32)
+        self.pixels_searched += small.size
+        offset = np.array([x0, y0], dtype=np.float32)
+        detections = []
+        for tag in self.detect(small):
+            # Pixel centers of the decimated patch back to full-frame coordinates
+            corners = (tag.corners + 0.5) * scale - 0.5 + offset
+            detections.append(TagDetection(tag.tag_id, corners, corners.mean(axis=0)))
+        return detections
+
+    def _window(self, corners, shape):
+        x_min, y_min = corners.min(axis=0)
+        x_max, y_max = corners.max(axis=0)
+        pad = self.margin * max(x_max - x_min, y_max - y_min)
+        height, width = shape[:2]
+        return (max(int(x_min - pad), 0), max(int(y_min - pad), 0),
+                min(int(np.ceil(x_max + pad)) + 1, width), min(int(np.ceil(y_max + pad)) + 1, height))
+
+    def _decimation(self, corners):
+        side = np.linalg.norm(np.roll(corners, -1, axis=0) - corners, axis=1).min()
+        return int(np.clip(side // self.min_tag_px, 1, self.max_decimate))
+
+    @timed("tag_tracker")
+    def update(self, gray):
+        """Return the tags found in this frame as a list of TagDetection."""
+        found = {}
+        height, width = gray.shape[:2]
+        if not self.tracks or self.frame_index % self.reacquire_every == 0:
+            full_resolution = self.full_searches % self.full_resolution_every == 0
+            decimate = 1 if full_resolution else self.reacquire_decimate
+            for tag in self._search(gray, (0, 0, width, height), decimate):
+                found.setdefault(tag.tag_id, tag)
+            self.full_searches += 1
+
+        # Tracked tags missing from a decimated full search get their own window
+        for tag_id, (corners, _) in list(self.tracks.items()):
+            if tag_id in found:
+                continue
+            window = self._window(corners, gray.shape)
+            for tag in self._search(gray, window, self._decimation(corners)):
+                found.setdefault(tag.tag_id, tag)
+            self.roi_searches += 1
+
+        for tag_id in list(self.tracks):
+            if tag_id not in found:
+                self.tracks[tag_id][1] += 1
+                if self.tracks[tag_id][1] > self.max_misses:
+                    del self.tracks[tag_id]
+        for tag_id, tag in found.items():
+            self.tracks[tag_id] = [tag.corners, 0]
+        self.frame_index += 1
+        return list(found.values())
+
+
+def square_object_points(size):
+    """Tag corners in the tag's own frame, in the top-left, top-right, bottom-right, bottom-left order."""
+    half = size / 2.0
+    return np.array([[-half, half, 0], [half, half, 0], [half, -half, 0], [-half, -half, 0]], dtype=np.float32)
+
+
+def estimate_pose(corners, size, camera_matrix, dist_coeffs):
+    """(rvec, tvec) of one square tag from its float corners, or None when solvePnP fails."""
+    ok, rvec, tvec = cv2.solvePnP(square_object_points(size), np.asarray(corners, dtype=np.float32).reshape(4, 1, 2),
+                                  camera_matrix, dist_coeffs, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+    return (rvec, tvec) if ok else None
+
+
+def benchmark(source, family="tag36h11"):
+    """Compare full-frame detection with the tracker on recorded footage, printing ms/frame for each."""
+    from capture import open_source
+
+    cap = open_source(source)
+    frames = []
+    while True:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    cap.release()
+    if not frames:
+        print("Error: No frames read from", source)
+        return None
+
+    detect = make_tag_detector(family)
+    start = time.perf_counter()
+    full_hits = sum(len(detect(gray)) for gray in frames)
+    full_time = (time.perf_counter() - start) / len(frames)
+
+    tracker = TagTracker(detect)
+    start = time.perf_counter()
+    tracked_hits = sum(len(tracker.update(gray)) for gray in frames)
+    tracked_time = (time.perf_counter() - start) / len(frames)
+
+    print(f"Frames: {len(frames)}")
+    print(f"Full-frame detection: {full_time * 1000:.2f} ms/frame, {full_hits} tags")
+    print(f"Tracked detection:    {tracked_time * 1000:.2f} ms/frame, {tracked_hits} tags "
+          f"({tracker.roi_searches} window / {tracker.full_searches} full searches)")
+    if tracked_time > 0:
+        print(f"Speedup: {full_time / tracked_time:.1f}x")
+    return {"frames": len(frames), "full_ms": full_time * 1000, "tracked_ms": tracked_time * 1000,
+            "full_tags": full_hits, "tracked_tags": tracked_hits}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python tagtracker.py <video file or image directory>")
+        sys.exit(1)
+    benchmark(sys.argv[1])
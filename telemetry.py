@@ -0,0 +1,127 @@
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error"}
+
+
+class Telemetry:
+    """Structured event recorder with a preallocated ring buffer and a background drain.
+
+    emit() only stores a tuple in the ring: slots are claimed from an
+    itertools.count, which is atomic under the GIL, so producers never take a
+    lock. A drain thread writes the events out as JSON lines. When the drain falls
+    a full ring behind, the overwritten events are counted as lost rather than
+    blocking the producer. While disabled, emit() returns after one attribute check.
+    """
+
+    def __init__(self, capacity=4096, level=INFO, rate_limits=None, flush_interval=0.25):
+        self.capacity = capacity
+        self.ring = [None] * capacity
+        self.counter = itertools.count()
+        self.level = level
+        # Minimum seconds between two events of the same (kind, key), e.g. {"steer": 0.2}
+        self.rate_limits = dict(rate_limits or {})
+        self.last_emit = {}
+        self.flush_interval = flush_interval
+        self.enabled = False
+        self.read_seq = 0
+        self.lost = 0
+        self.suppressed = 0
+        self.stream = None
+        self.owns_stream = False
+        self.thread = None
+
+    def start(self, path="-"):
+        """Enable recording and drain to a JSON-lines file ("-" for stdout)."""
+        if self.enabled:
+            return self
+        if path == "-":
+            self.stream, self.owns_stream = sys.stdout, False
+        else:
+            self.stream, self.owns_stream = open(path, "a", buffering=1 << 16), True
+        self.enabled = True
+        self.thread = threading.Thread(target=self._run, name="Telemetry", daemon=True)
+        self.thread.start()
+        return self
+
+    def emit(self, kind, level=INFO, key=None, **fields):
+        """Record an event; dropped when disabled, below the level, or rate limited."""
+        if not self.enabled or level < self.level:
+            return
+        now = time.time()
+        interval = self.rate_limits.get(kind)
+        if interval is not None:
+            last = self.last_emit.get((kind, key))
+            if last is not None and now - last < interval:
+                self.suppressed += 1
+                return
+            self.last_emit[(kind, key)] = now
+        seq = next(self.counter)
+        self.ring[seq % self.capacity] = (seq, now, level, kind, key, fields)
+
+    def _drain(self):
+        lines = []
+        while True:
+            item = self.ring[self.read_seq % self.capacity]
+            if item is None or item[0] < self.read_seq:
+                break  # Not written yet
+            seq, stamp, level, kind, key, fields = item
+            if seq > self.read_seq:
+                # The producers lapped the drain; skip what was overwritten
+                self.lost += seq - self.read_seq
+            event = {"t": stamp, "level": LEVEL_NAMES.get(level, level), "kind": kind}
+            if key is not None:
+                event["key"] = key
+            event.update(fields)
+            lines.append(json.dumps(event, default=str))
+            self.read_seq = seq + 1
+        if lines:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+
+    def _run(self):
+        while self.enabled:
+            time.sleep(self.flush_interval)
+            self._drain()
+
+    def stop(self):
+        """Drain what is left, stop the background thread and close the log file."""
+        if not self.enabled:
+            return
+        self.enabled = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        self._drain()
+        if self.owns_stream:
+            self.stream.close()
+        self.stream = None
+
+    def stats(self):
+        """Return counts of events drained, lost to ring overruns, and suppressed by rate limits."""
+        return {"drained": self.read_seq - self.lost, "lost": self.lost, "suppressed": self.suppressed}
+
+
+# Shared instance for the scripts. Set TELEMETRY to a file path (or "-" for stdout)
+# to turn it on; TELEMETRY_LEVEL takes debug/info/warning/error.
+telemetry = Telemetry(rate_limits={"steer": 0.2})
+
+
+def configure_from_env():
+    """Start the shared telemetry instance if the TELEMETRY environment variable is set."""
+    path = os.environ.get("TELEMETRY")
+    if not path:
+        return telemetry
+    level_name = os.environ.get("TELEMETRY_LEVEL", "info").lower()
+    levels = {name: value for value, name in LEVEL_NAMES.items()}
+    telemetry.level = levels.get(level_name, INFO)
+    return telemetry.start(path)
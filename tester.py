@@ -1,7 +1,12 @@
 import cv2
 import numpy as np
-import RPi.GPIO as GPIO
-from time import sleep
+from colorsegment import segment_masks
+from pipeline import Pipeline
+from stages import build_stages
+from tracker import BallTracker
+from motordispatch import MotorDispatcher
+from steering import PIDController, differential_duty
+from telemetry import configure_from_env, telemetry
 
 # GPIO setup for motor control
 in1 = 24
@@ -9,18 +14,8 @@ in2 = 23
 in3 = 21
 in4 = 22
 en = 25
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(in1, GPIO.OUT)
-GPIO.setup(in2, GPIO.OUT)
-GPIO.setup(in3, GPIO.OUT)
-GPIO.setup(in4, GPIO.OUT)
-GPIO.setup(en, GPIO.OUT)
-GPIO.output(in1, GPIO.LOW)
-GPIO.output(in2, GPIO.LOW)
-GPIO.output(in3, GPIO.LOW)
-GPIO.output(in4, GPIO.LOW)
-p = GPIO.PWM(en, 1000)
-p.start(50)
+# Motor commands are applied from a background thread, latest command per control tick
+motors = MotorDispatcher(pins=(in1, in2, in3, in4), en_pin=en, pwm_frequency=1000, duty=50)
 
 # HSV ranges for colors
 def get_hsv_ranges():
@@ -34,91 +29,87 @@ def get_hsv_ranges():
 
 # Create combined mask for the colors
 def create_combined_mask(img_hsv, red_ranges, pink_range, white_range):
-    red_mask = sum(cv2.inRange(img_hsv, lower, upper) for lower, upper in red_ranges)
-    pink_mask = cv2.inRange(img_hsv, *pink_range)
-    white_mask = cv2.inRange(img_hsv, *white_range)
-    return red_mask, pink_mask, white_mask
+    masks = segment_masks(img_hsv, {"red": red_ranges, "pink": [pink_range], "white": [white_range]})
+    return masks["red"], masks["pink"], masks["white"]
+
+# Closed-loop steering for each tracked object, driving the wheel duty cycles
+steering = {"Red": PIDController(), "Pink": PIDController()}
+base_duty = 50
+
+# A ball centered this low in the frame is in front of the robot, so it heads for the goal
+held_row = 0.85  # Fraction of the frame height
+held_tolerance = 0.15  # Fraction of the frame width either side of center
+
+def ball_held(center_x, center_y, frame_width, frame_height):
+    if center_x == -1:
+        return False
+    return center_y >= held_row * frame_height and abs(center_x - frame_width / 2) <= held_tolerance * frame_width
 
 # Process detected positions
-def process_center_position(center_x, center_y, frame_width, color_name):
+def process_center_position(center_x, center_y, frame_width, color_name, velocity_x=None):
     screen_center_x = frame_width // 2
-    tolerance = 15
+    controller = steering[color_name]
 
     if center_x == -1:
-        print(f"{color_name} not detected. Turning left.")
-        move_motor("fl")
-    elif center_x < screen_center_x - tolerance:
-        print(f"{color_name} to the left. Turning left.")
+        telemetry.emit("steer", key=color_name, color=color_name, detected=False, command="fl")
+        controller.reset()
         move_motor("fl")
-    elif center_x > screen_center_x + tolerance:
-        print(f"{color_name} to the right. Turning right.")
-        move_motor("fr")
-    else:
-        print(f"{color_name} centered. Moving forward.")
-        move_motor("f")
+        return
+
+    # Normalised horizontal error, positive when the object is right of center
+    error = (center_x - screen_center_x) / screen_center_x
+    derivative = velocity_x / screen_center_x if velocity_x is not None else None
+    turn = controller.update(error, derivative=derivative)
+    left, right = differential_duty(turn, base_duty)
+    telemetry.emit("steer", key=color_name, color=color_name, detected=True, offset=center_x - screen_center_x,
+                   turn=round(turn, 3), left=round(left, 1), right=round(right, 1))
+    motors.set_wheel_duty(left, right)
 
 # Motor movement commands
 def move_motor(command):
-    if command == "f":
-        GPIO.output(in1, GPIO.HIGH)
-        GPIO.output(in2, GPIO.LOW)
-        GPIO.output(in3, GPIO.HIGH)
-        GPIO.output(in4, GPIO.LOW)
-    elif command == "fl":
-        GPIO.output(in1, GPIO.HIGH)
-        GPIO.output(in2, GPIO.LOW)
-        GPIO.output(in3, GPIO.LOW)
-        GPIO.output(in4, GPIO.LOW)
-    elif command == "fr":
-        GPIO.output(in1, GPIO.LOW)
-        GPIO.output(in2, GPIO.LOW)
-        GPIO.output(in3, GPIO.HIGH)
-        GPIO.output(in4, GPIO.LOW)
-    elif command == "stop":
-        GPIO.output(in1, GPIO.LOW)
-        GPIO.output(in2, GPIO.LOW)
-        GPIO.output(in3, GPIO.LOW)
-        GPIO.output(in4, GPIO.LOW)
+    # Queued without blocking; repeated commands within a tick are coalesced
+    motors.submit(command)
 
 # Main function
 def main():
-    red_ranges, pink_range, white_range = get_hsv_ranges()
-    webcam_video = cv2.VideoCapture(0)
-
-    if not webcam_video.isOpened():
-        print("Error: Could not open webcam.")
-        return
-
+    pipeline = Pipeline(build_stages(["tester"]))
+    red_tracker = BallTracker()
+    pink_tracker = BallTracker()
+    target = "Red"
+
+    def steer(ctx):
+        nonlocal target
+        frame_width, frame_height = ctx.width, ctx.height
+
+        # Detect red and pink
+        red_state = red_tracker.update(ctx.results["red_center"])
+        red_center_x, red_center_y = red_tracker.center()
+        pink_state = pink_tracker.update(ctx.results["pink_center"])
+        pink_center_x, pink_center_y = pink_tracker.center()
+
+        # Steer towards one target per frame: the ball, or the goal once the ball is held
+        previous_target = target
+        target = "Pink" if ball_held(red_center_x, red_center_y, frame_width, frame_height) else "Red"
+        if target != previous_target:
+            steering[previous_target].reset()
+        if target == "Red":
+            process_center_position(red_center_x, red_center_y, frame_width, "Red",
+                                    red_state.vx if red_state else None)
+        else:
+            process_center_position(pink_center_x, pink_center_y, frame_width, "Pink",
+                                    pink_state.vx if pink_state else None)
+
+        # Display the red and pink masks next to the annotated video feed
+        cv2.imshow("Mask Image", ctx.any_mask(("red", "pink")))
+
+    motors.start()
+    configure_from_env()
     try:
-        while True:
-            success, video = webcam_video.read()
-            if not success:
-                print("Error: Could not read frame.")
-                break
-
-            frame_height, frame_width, _ = video.shape
-            img_hsv = cv2.cvtColor(video, cv2.COLOR_BGR2HSV)
-            red_mask, pink_mask, white_mask = create_combined_mask(img_hsv, red_ranges, pink_range, white_range)
-
-            # Detect red
-            red_center_x, red_center_y = detect_center(red_mask)
-            process_center_position(red_center_x, red_center_y, frame_width, "Red")
-
-            # Detect pink
-            pink_center_x, pink_center_y = detect_center(pink_mask)
-            process_center_position(pink_center_x, pink_center_y, frame_width, "Pink")
-
-            # Display frames
-            combined_mask = red_mask | pink_mask | white_mask
-            cv2.imshow("Mask Image", combined_mask)
-            cv2.imshow("Video Feed", video)
-
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+        pipeline.run(0, window_name="Video Feed", on_frame=steer)
     finally:
-        webcam_video.release()
-        cv2.destroyAllWindows()
-        GPIO.cleanup()
+        motors.stop()
+        telemetry.emit("motors", **motors.stats())
+        telemetry.stop()
 
 # Detect center using contours
 def detect_center(mask):
@@ -0,0 +1,119 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# Filtered state of a tracked object. Position and velocity are in pixels and
+# pixels/second, age is the time in seconds since the last real detection and
+# confidence falls from 1 towards 0 as the track coasts without detections.
+TrackState = namedtuple("TrackState", ["x", "y", "vx", "vy", "confidence", "age"])
+
+_MEASUREMENT = np.array([[1.0, 0.0, 0.0, 0.0],
+                         [0.0, 1.0, 0.0, 0.0]])
+
+
+def is_detected(center):
+    """Return True unless the center is None or the (-1, -1) not-detected sentinel."""
+    return center is not None and center[0] != -1 and center[1] != -1
+
+
+class BallTracker:
+    """Constant-velocity Kalman filter for one object's image position.
+
+    Feed it the raw detector output every frame, including the (-1, -1)
+    sentinel. Through short gaps it keeps predicting from the last velocity,
+    so steering does not flip on a single dropped detection. The track is
+    dropped once no detection has arrived for max_age seconds.
+    """
+
+    def __init__(self, process_noise=2000.0, measurement_noise=9.0, max_age=0.5, min_hits=2):
+        self.process_noise = process_noise  # Acceleration variance, (px/s^2)^2
+        self.measurement_noise = measurement_noise  # Detector variance, px^2
+        self.max_age = max_age
+        self.min_hits = min_hits  # Detections needed before the track reaches full confidence
+        self.reset()
+
+    def reset(self):
+        """Forget the current track."""
+        self.state = None  # [x, y, vx, vy]
+        self.covariance = None
+        self.last_time = None
+        self.last_detection_time = None
+        self.hits = 0
+
+    def _predict(self, timestamp):
+        dt = max(timestamp - self.last_time, 0.0)
+        self.last_time = timestamp
+        if dt == 0.0:
+            return
+
+        transition = np.eye(4)
+        transition[0, 2] = transition[1, 3] = dt
+        q = self.process_noise
+        dt2, dt3, dt4 = dt * dt, dt * dt * dt, dt * dt * dt * dt
+        noise = q * np.array([[dt4 / 4, 0, dt3 / 2, 0],
+                              [0, dt4 / 4, 0, dt3 / 2],
+                              [dt3 / 2, 0, dt2, 0],
+                              [0, dt3 / 2, 0, dt2]])
+        self.state = transition @ self.state
+        self.covariance = transition @ self.covariance @ transition.T + noise
+
+    def _correct(self, center):
+        innovation = np.asarray(center, dtype=np.float64) - self.state[:2]
+        innovation_cov = self.covariance[:2, :2] + self.measurement_noise * np.eye(2)
+        gain = self.covariance[:, :2] @ np.linalg.inv(innovation_cov)
+        self.state = self.state + gain @ innovation
+        self.covariance = (np.eye(4) - gain @ _MEASUREMENT) @ self.covariance
+
+    def update(self, center, timestamp=None):
+        """Advance the filter to timestamp, fold in the detection if any, and return the TrackState.
+
+        Returns None when there is no live track.
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+
+        if self.state is None:
+            if not is_detected(center):
+                return None
+            self.state = np.array([center[0], center[1], 0.0, 0.0], dtype=np.float64)
+            # Position is known to the detector's accuracy, velocity is unknown
+            self.covariance = np.diag([self.measurement_noise, self.measurement_noise, 1e6, 1e6])
+            self.last_time = self.last_detection_time = timestamp
+            self.hits = 1
+            return self.track(timestamp)
+
+        self._predict(timestamp)
+        if is_detected(center):
+            self._correct(center)
+            self.last_detection_time = timestamp
+            self.hits += 1
+        elif timestamp - self.last_detection_time > self.max_age:
+            self.reset()
+            return None
+        return self.track(timestamp)
+
+    def predict(self, timestamp=None):
+        """Return the extrapolated TrackState at timestamp without changing the filter."""
+        if self.state is None:
+            return None
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        dt = max(timestamp - self.last_time, 0.0)
+        x, y, vx, vy = self.state
+        return self._make_state(x + vx * dt, y + vy * dt, vx, vy, timestamp)
+
+    def track(self, timestamp):
+        x, y, vx, vy = self.state
+        return self._make_state(x, y, vx, vy, timestamp)
+
+    def _make_state(self, x, y, vx, vy, timestamp):
+        age = max(timestamp - self.last_detection_time, 0.0)
+        confidence = max(0.0, 1.0 - age / self.max_age) * min(self.hits / self.min_hits, 1.0)
+        return TrackState(float(x), float(y), float(vx), float(vy), confidence, age)
+
+    def center(self):
+        """Return the filtered center as integers, or the (-1, -1) sentinel when there is no track."""
+        if self.state is None:
+            return -1, -1
+        return int(round(self.state[0])), int(round(self.state[1]))